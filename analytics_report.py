@@ -0,0 +1,98 @@
+import os
+import csv
+import time
+import argparse
+import numpy as np
+from services.analytics import (TagVocabulary, cooccurrence, encode, group_distribution, lift,
+                                load_table, top_lift_pairs)
+
+# same outputs batch_runner.py writes
+DEFAULT_SOURCES = [
+    "/app/data/outputs/analysis_results.parquet",
+    "/app/data/outputs/analysis_results.csv",
+]
+DEFAULT_REPORT_DIR = "/app/data/outputs/analytics"
+
+
+def _write_matrix(path, row_labels, column_labels, values, fmt="{:.4f}"):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow([""] + list(column_labels))
+        for label, row in zip(row_labels, values):
+            writer.writerow([label] + [fmt.format(v) for v in row])
+
+
+def _field_pair(spec: str, vocab: TagVocabulary):
+    a, _, b = spec.partition(":")
+    for name in (a, b):
+        if name not in vocab.slices:
+            raise argparse.ArgumentTypeError(f"unknown field '{name}', choose from {', '.join(vocab.slices)}")
+    return a, b
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tag co-occurrence, lift and per-genre distributions.")
+    parser.add_argument("--source", help="CSV file or Parquet dataset written by batch_runner.py")
+    parser.add_argument("--out", default=DEFAULT_REPORT_DIR, help="directory for the report CSVs")
+    parser.add_argument("--pair", action="append", default=[],
+                        help="field pair to export as its own matrix, e.g. emotional_hooks:text_hooks (repeatable)")
+    parser.add_argument("--group-by", default="primary_genre", help="field for the distribution table")
+    parser.add_argument("--min-support", type=int, default=20,
+                        help="minimum co-occurrences for a pair to be ranked by lift")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    source = args.source or next((p for p in DEFAULT_SOURCES if os.path.exists(p)), None)
+    if source is None:
+        parser.error("no batch output found, pass --source")
+    vocab = TagVocabulary()
+    try:
+        pairs = [_field_pair(spec, vocab) for spec in args.pair]
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    if args.group_by not in vocab.single_fields:
+        parser.error(f"--group-by must be a single-valued enum field: {', '.join(vocab.single_fields)}")
+
+    start = time.perf_counter()
+    table = load_table(source)
+    matrix, vocab = encode(table, vocab)
+    loaded = time.perf_counter()
+    n = matrix.shape[0]
+    counts = cooccurrence(matrix)
+    lifts = lift(counts, n)
+    groups, totals, shares = group_distribution(matrix, vocab, args.group_by)
+    print(f"Encoded {n} creatives x {len(vocab)} tags from {source} in {loaded - start:.2f}s, "
+          f"analytics in {time.perf_counter() - loaded:.2f}s")
+
+    os.makedirs(args.out, exist_ok=True)
+    marginals = np.diag(counts)
+    with open(os.path.join(args.out, "marginals.csv"), "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["field", "tag", "count", "share"])
+        for field, tag, count in zip(vocab.field_of, vocab.columns, marginals):
+            writer.writerow([field, tag, int(count), f"{count / max(n, 1):.4f}"])
+    _write_matrix(os.path.join(args.out, "cooccurrence.csv"), vocab.columns, vocab.columns, counts, "{:.0f}")
+    _write_matrix(os.path.join(args.out, "lift.csv"), vocab.columns, vocab.columns, np.nan_to_num(lifts))
+    _write_matrix(os.path.join(args.out, f"distribution_by_{args.group_by}.csv"),
+                  [f"{g} (n={int(t)})" for g, t in zip(groups, totals)], vocab.columns, shares)
+    for a, b in pairs:
+        rows, cols = vocab.slices[a], vocab.slices[b]
+        _write_matrix(os.path.join(args.out, f"cooccurrence_{a}__{b}.csv"),
+                      vocab.values(a), vocab.values(b), counts[rows, cols], "{:.0f}")
+        _write_matrix(os.path.join(args.out, f"lift_{a}__{b}.csv"),
+                      vocab.values(a), vocab.values(b), np.nan_to_num(lifts[rows, cols]))
+
+    top = top_lift_pairs(counts, lifts, vocab, min_support=args.min_support, top=args.top)
+    with open(os.path.join(args.out, "top_lift_pairs.csv"), "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["tag_a", "tag_b", "support", "lift"])
+        writer.writerows([(a, b, support, f"{value:.4f}") for a, b, support, value in top])
+
+    print(f"Top pairs by lift (support >= {args.min_support}):")
+    for a, b, support, value in top:
+        print(f"{value:>7.2f}  {support:>8}  {a} + {b}")
+    print(f"Report written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,29 @@
 import os
-import glob
-import csv
+import sys
 import time
+import signal
+import socket
+import argparse
+import threading
+import subprocess
 from dotenv import load_dotenv
-from services.analyzer import analyze_video
+from services import analyzer
+from services.cache import ResultCache, cache_enabled
+from services.dedup import cluster_videos
+from services.file_registry import DEFAULT_IDLE_SECONDS, RemoteFileRegistry, registry_enabled
+from services.metrics import STAGE_SECONDS, format_summary
+from services.pipeline import AnalysisPipeline
+from services import rate_limit
+from services.response_store import configure_default_response_store
+from services.preprocess import DEFAULT_PROFILE, PROFILES, transcode_totals
+from services.probe import DEFAULT_PROBE_WORKERS, PROBE_COLUMN_TYPES, PROBE_COLUMNS, probe_many, probe_row, probe_video
+from services.columnar import DEFAULT_ROW_GROUP_SIZE, ParquetResultWriter, merge_parquet_shards
+from services.results_writer import CsvResultWriter, RunManifest, csv_fieldnames, merge_csv_shards
+from services.watcher import (DEFAULT_POLL_SECONDS, DEFAULT_SETTLE_SECONDS, VIDEO_EXTENSIONS, FolderWatcher,
+                              find_videos, scan_videos)
+from services.work_queue import DEFAULT_LEASE_SECONDS, LeaseRenewer, WorkQueue, default_worker_id, safe_worker_id
 from data_models.CreativeAdsAnalysis import CreativeAnalysis
+from data_models.HookAnalysis import HookAnalysis
 
 load_dotenv()
 
@@ -12,63 +31,524 @@ load_dotenv()
 INTERNAL_INPUT_DIR = "/app/data/inputs"
 INTERNAL_OUTPUT_DIR = "/app/data/outputs"
 OUTPUT_FILENAME = "analysis_results.csv"
+# --format parquet writes a dataset directory of part files
+PARQUET_DIRNAME = "analysis_results.parquet"
+# cache lives next to the outputs so it survives container restarts
+CACHE_FILENAME = "analysis_cache.sqlite"
+# finished inputs, read by --resume
+MANIFEST_FILENAME = "analysis_manifest.jsonl"
+# content hash -> uploaded Gemini file, shared across runs
+REGISTRY_FILENAME = "remote_files.sqlite"
+# raw model responses for offline re-validation, see migrate_results.py
+RESPONSES_FILENAME = "analysis_responses.sqlite"
+# --hook writes its triage results and manifest separately from the full tagging
+HOOK_OUTPUT_FILENAME = "hook_results.csv"
+HOOK_PARQUET_DIRNAME = "hook_results.parquet"
+HOOK_MANIFEST_FILENAME = "hook_manifest.jsonl"
+# --queue: videos claimed by several workers, each writing its own shard under shards/<worker>/
+QUEUE_FILENAME = "work_queue.sqlite"
+HOOK_QUEUE_FILENAME = "hook_queue.sqlite"
+SHARDS_DIRNAME = "shards"
+# --queue: RPM/TPM/upload budget levels shared by every worker, see rate_limit.SharedTokenBucket
+RATE_LIMIT_STATE_FILENAME = "rate_limit.sqlite"
+# extra CSV columns written with --dedup
+DEDUP_COLUMNS = ["cluster_id", "cluster_representative"]
 
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Batch analysis of ad creatives into a CSV report.")
+    parser.add_argument("--input-dir", default=INTERNAL_INPUT_DIR, help="folder scanned for videos")
+    parser.add_argument("--recursive", action="store_true",
+                        help="also scan subfolders, results are keyed by the path relative to --input-dir")
+    parser.add_argument("--extensions", default=",".join(e.lstrip(".") for e in VIDEO_EXTENSIONS),
+                        help="comma-separated video extensions to pick up")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and analyse new or re-rendered videos as they land (implies --resume)")
+    parser.add_argument("--settle-seconds", type=float, default=DEFAULT_SETTLE_SECONDS,
+                        help="watch mode: size and mtime must hold still this long before a file is picked up")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_SECONDS,
+                        help="watch mode: folder scan interval when filesystem events are unavailable")
+    parser.add_argument("--output-dir", default=INTERNAL_OUTPUT_DIR,
+                        help="folder for results, manifest, cache and registry")
+    parser.add_argument("--upload-workers", type=int, default=2,
+                        help="parallel uploads to the Gemini Files API")
+    parser.add_argument("--wait-workers", type=int, default=8,
+                        help="files that can sit in server-side PROCESSING at once")
+    parser.add_argument("--inference-workers", type=int, default=rate_limit.DEFAULT_MAX_CONCURRENCY,
+                        help="threads ready to call the model, the rate limiter decides how many run at once")
+    parser.add_argument("--queue-size", type=int, default=4,
+                        help="bound of the queue in front of each stage")
+    parser.add_argument("--rpm", type=float, default=rate_limit.DEFAULT_RPM,
+                        help="model requests per minute budget, 0 = none (env RATE_LIMIT_RPM)")
+    parser.add_argument("--tpm", type=float, default=rate_limit.DEFAULT_TPM,
+                        help="prompt tokens per minute budget, 0 = none (env RATE_LIMIT_TPM)")
+    parser.add_argument("--upload-mb-per-s", type=float, default=rate_limit.DEFAULT_UPLOAD_BYTES_PER_SECOND / 1e6,
+                        help="combined upload bandwidth budget, 0 = none")
+    parser.add_argument("--max-concurrency", type=int, default=rate_limit.DEFAULT_MAX_CONCURRENCY,
+                        help="upper bound for the adaptive number of parallel model calls")
+    parser.add_argument("--rate-limit-state", default=rate_limit.DEFAULT_STATE_PATH or None,
+                        help="SQLite file through which processes share the --rpm/--tpm/--upload-mb-per-s "
+                             "budgets (env RATE_LIMIT_STATE_PATH), --queue defaults to one in --output-dir")
+    parser.add_argument("--resume", action="store_true",
+                        help="append to the existing CSV and skip videos already in the manifest")
+    parser.add_argument("--probe", action=argparse.BooleanOptionalAction,
+                        default=os.getenv("PROBE", "on").lower() not in ("0", "off", "false", "no"),
+                        help="probe every video locally with OpenCV, reject unusable ones before upload "
+                             "and write probe_* columns (env PROBE)")
+    parser.add_argument("--probe-workers", type=int, default=DEFAULT_PROBE_WORKERS,
+                        help="processes used to probe the input set")
+    parser.add_argument("--profile", choices=list(PROFILES), default=DEFAULT_PROFILE,
+                        help="pre-upload transcoding: fast=480p/12fps, balanced=720p/24fps, full=original")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv",
+                        help="csv (comma-joined lists) or parquet (dictionary enums, multi-hot bitmasks)")
+    parser.add_argument("--row-group-size", type=int, default=DEFAULT_ROW_GROUP_SIZE,
+                        help="rows per Parquet part file")
+    parser.add_argument("--dedup", action="store_true",
+                        help="cluster near-duplicate variants and analyse one representative per cluster")
+    parser.add_argument("--remote-idle-seconds", type=int, default=DEFAULT_IDLE_SECONDS,
+                        help="after the run, delete uploaded files not used for this long")
+    parser.add_argument("--purge-remote-files", action="store_true",
+                        help="after the run, delete every uploaded file tracked by the registry")
+    parser.add_argument("--context-cache", action="store_true", default=analyzer.USE_CONTEXT_CACHE,
+                        help="keep the prompt and schema descriptions in a Gemini context cache "
+                             "and send only the video per request (env CONTEXT_CACHE=on)")
+    parser.add_argument("--engine", choices=list(analyzer.ANALYZER_ENGINES), default=analyzer.ANALYZER_ENGINE,
+                        help="native google-genai calls or the LangChain chat model (env ANALYZER_ENGINE)")
+    parser.add_argument("--batch-inference", action="store_true",
+                        default=os.getenv("BATCH_INFERENCE", "off").lower() in ("1", "on", "true", "yes"),
+                        help="send several ready videos per inference request (env BATCH_INFERENCE=on)")
+    parser.add_argument("--batch-max-videos", type=int, default=analyzer.BATCH_MAX_VIDEOS,
+                        help="most videos per batched request")
+    parser.add_argument("--batch-max-tokens", type=int, default=analyzer.BATCH_MAX_TOKENS,
+                        help="estimated video tokens per batched request (~300 per second of video)")
+    parser.add_argument("--batch-linger", type=float, default=3.0,
+                        help="seconds a batch waits for more ready videos before it is sent")
+    parser.add_argument("--hook", action="store_true",
+                        help="fast triage: analyse only the opening seconds with the compact HookAnalysis schema")
+    parser.add_argument("--hook-seconds", type=float, default=analyzer.HOOK_SECONDS,
+                        help="length of the opening sent in hook mode (env HOOK_SECONDS)")
+    parser.add_argument("--hook-clip", choices=list(analyzer.HOOK_CLIP_MODES), default=analyzer.HOOK_CLIP_MODE,
+                        help="local = cut the clip before upload, server = upload the whole video and send offsets")
+    parser.add_argument("--queue", action="store_true",
+                        help="claim videos from a work queue in --output-dir shared by every batch_runner "
+                             "process or container started with --queue, each writes its own shard")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="start this many --queue workers as local processes, then --finalize "
+                             "(they share the budgets, --max-concurrency is split between them)")
+    parser.add_argument("--worker-id", default=None,
+                        help="queue worker name and shard folder, defaults to hostname-pid")
+    parser.add_argument("--max-claims", type=int, default=None,
+                        help="most videos one queue worker holds at once, lower balances the end of a run "
+                             "better (default: one per upload, processing and inference slot)")
+    parser.add_argument("--lease-seconds", type=float, default=DEFAULT_LEASE_SECONDS,
+                        help="a claim not renewed for this long goes back to the queue (env QUEUE_LEASE_SECONDS)")
+    parser.add_argument("--finalize", action="store_true",
+                        help="merge the worker shards into the regular results file and exit")
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.workers > 1:
+        args.queue = True
+    if args.queue and args.watch:
+        parser.error("--queue works through a fixed scan and cannot be combined with --watch")
+    if args.queue and args.dedup:
+        parser.error("--dedup clusters the whole folder in one process and cannot be combined with --queue")
+    if args.hook and args.batch_inference:
+        parser.error("--hook sends one short clip per request and cannot be combined with --batch-inference")
+    if args.watch and args.dedup:
+        parser.error("--dedup clusters the whole folder up front and cannot be combined with --watch")
+    args.extensions = tuple("." + e.strip().lower().lstrip(".") for e in args.extensions.split(",") if e.strip())
+    # a watcher restarted after a crash or deploy must not redo the folder
+    if args.watch:
+        args.resume = True
+    return args
+
+
+def limited(items, slots):
+    """hand out items only while a slot is free, the consumer releases them."""
+    while True:
+        slots.acquire()
+        item = next(items, None)
+        if item is None:
+            return
+        yield item
+
+
+def finalize(args, queue_path, output_name):
+    """merge shards/<worker>/<output_name> into the regular results file or dataset."""
+    if not os.path.exists(queue_path):
+        print(f"No work queue at {queue_path}, nothing to finalize.")
+        return
+    work_queue = WorkQueue(queue_path)
+    # key -> worker, a video written by two workers (lease ran out mid-analysis) keeps the accepted row
+    owners = work_queue.done_owners()
+    counts = work_queue.counts()
+    work_queue.close()
+
+    shards_dir = os.path.join(args.output_dir, SHARDS_DIRNAME)
+    shards = {}
+    for worker in sorted(os.listdir(shards_dir)) if os.path.isdir(shards_dir) else []:
+        path = os.path.join(shards_dir, worker, output_name)
+        if os.path.exists(path):
+            shards[worker] = path
+    output_path = os.path.join(args.output_dir, output_name)
+
+    def keep(worker, filename):
+        return owners.get(filename) == worker
+
+    if args.format == "parquet":
+        merged = merge_parquet_shards(shards, output_path, keep, args.row_group_size,
+                                      HookAnalysis if args.hook else CreativeAnalysis)
+    else:
+        merged = merge_csv_shards(shards, output_path, keep)
+    print(f"Finalize: {merged} results from {len(shards)} worker shards merged into {output_path}")
+    if merged < len(owners):
+        print(f"Warning: {len(owners) - merged} videos are done in the queue but missing from the shards.")
+    unfinished = counts.get("pending", 0) + counts.get("claimed", 0)
+    if unfinished:
+        print(f"{unfinished} videos are not finished yet, start workers again and finalize once they exit.")
+    if counts.get("failed") or counts.get("rejected"):
+        print(f"{counts.get('failed', 0)} videos failed every attempt, "
+              f"{counts.get('rejected', 0)} were rejected by the probe.")
+
+
+def launch_workers(args, argv):
+    """run args.workers queue workers as child processes of this script and wait for them."""
+    argv = list(sys.argv[1:] if argv is None else argv)
+    n = args.workers
+    # rpm/tpm/upload budgets are drawn from the shared rate limit state, parallel calls are per process
+    budget = ["--max-concurrency", str(max(1, args.max_concurrency // n))]
+    # no pid in the base name, so a relaunch appends to the same shards
+    base = safe_worker_id(args.worker_id or socket.gethostname())
+
+    children = []
+    for i in range(n):
+        # argparse keeps the last value, so these override whatever the run was started with
+        child_argv = argv + budget + ["--workers", "1", "--queue", "--worker-id", f"{base}-w{i}"]
+        children.append(subprocess.Popen([sys.executable, os.path.abspath(__file__)] + child_argv))
+    print(f"Started {n} queue workers ({base}-w0..w{n - 1}).")
+
+    # Ctrl+C reaches the workers straight from the terminal, SIGTERM (docker stop) is passed on
+    def forward(signum, frame):
+        for child in children:
+            child.send_signal(signum)
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, forward)
+    failed = sum(1 for child in children if child.wait() != 0)
+    if failed:
+        print(f"Warning: {failed} workers exited with an error, their claims return to the queue "
+              f"once the leases run out.")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
     # ensure output directory exists (good practice)
-    os.makedirs(INTERNAL_OUTPUT_DIR, exist_ok=True)
-    output_path = os.path.join(INTERNAL_OUTPUT_DIR, OUTPUT_FILENAME)
-    
-    
-    # setup output CSV from pydantic model
-    field_keys = list(CreativeAnalysis.model_fields.keys())
-    fieldnames = ["filename"] + field_keys
-    
-    #find videos
-    videos = glob.glob(os.path.join(INTERNAL_INPUT_DIR, "*.mp4"))
-    print(f"Scanning container path: {INTERNAL_INPUT_DIR}")
-    print(f"Found {len(videos)} videos to process.")
-    if not videos:
-        print("No videos found, map the volume correctly in .env file")
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.hook:
+        output_name = HOOK_PARQUET_DIRNAME if args.format == "parquet" else HOOK_OUTPUT_FILENAME
+        manifest_path = os.path.join(args.output_dir, HOOK_MANIFEST_FILENAME)
+    else:
+        output_name = PARQUET_DIRNAME if args.format == "parquet" else OUTPUT_FILENAME
+        manifest_path = os.path.join(args.output_dir, MANIFEST_FILENAME)
+    output_path = os.path.join(args.output_dir, output_name)
+    result_model = HookAnalysis if args.hook else CreativeAnalysis
+    queue_path = os.path.join(args.output_dir, HOOK_QUEUE_FILENAME if args.hook else QUEUE_FILENAME)
+
+    if args.finalize:
+        finalize(args, queue_path, output_name)
         return
+    if args.workers > 1:
+        launch_workers(args, argv)
+        finalize(args, queue_path, output_name)
+        return
+
+    # relative paths keep same-named videos in different subfolders apart,
+    # top-level files keep their plain filename as before
+    def key_of(path):
+        return os.path.relpath(path, args.input_dir)
+
+    watcher = None
+    work_queue = None
+    worker_id = None
+    manifest = None
+    if args.watch:
+        manifest = RunManifest(manifest_path)
+        print(f"Watch mode: {len(manifest)} videos already done, waiting for new ones in {args.input_dir}")
+        watcher = FolderWatcher(args.input_dir, args.extensions, args.recursive,
+                                settle_seconds=args.settle_seconds, poll_seconds=args.poll_interval)
+        # the manifest check runs as each settled file is handed to the pipeline
+        videos = (v for v in watcher.paths() if not manifest.is_done(v, key_of(v)))
+        all_videos = []
+    elif args.queue:
+        worker_id = safe_worker_id(args.worker_id or default_worker_id())
+        work_queue = WorkQueue(queue_path, args.lease_seconds)
+        # every worker queues its own scan, videos already queued with the same size and mtime stay as they are
+        scanned = scan_videos(args.input_dir, args.extensions, args.recursive)
+        queued = work_queue.enqueue((key_of(v), size, mtime) for v, (size, mtime) in sorted(scanned.items()))
+        counts = work_queue.counts()
+        print(f"Queue worker {worker_id}: {len(scanned)} videos in {args.input_dir}, {queued} newly queued, "
+              f"{counts.get('pending', 0)} pending, {counts.get('done', 0)} done.")
+        # the queue replaces the manifest, rows go to this worker's shard and are merged by --finalize
+        output_path = os.path.join(args.output_dir, SHARDS_DIRNAME, worker_id, output_name)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        args.resume = True
+        stop_claiming = threading.Event()
+        # a slot is taken before each claim and given back once its result is in, so a worker
+        # never sits on a backlog that idle workers could be analysing
+        claim_slots = threading.Semaphore(
+            args.max_claims or args.upload_workers + args.wait_workers + args.inference_workers)
+        videos = (os.path.join(args.input_dir, key)
+                  for key in limited(work_queue.claims(worker_id, stop=stop_claiming), claim_slots))
+        all_videos = []
+    else:
+        #find videos
+        videos = find_videos(args.input_dir, args.extensions, args.recursive)
+        print(f"Scanning container path: {args.input_dir}")
+        print(f"Found {len(videos)} videos to process.")
+        if not videos:
+            print("No videos found, map the volume correctly in .env file")
+            return
+
+        # a fresh run starts a new manifest, --resume continues the previous one
+        manifest = RunManifest(manifest_path, reset=not args.resume)
+        all_videos = videos
+        if args.resume:
+            videos = [v for v in videos if not manifest.is_done(v, key_of(v))]
+            print(f"Resuming: {len(manifest)} already done, {len(videos)} left.")
+            if not videos:
+                print(f"Nothing to do, results in {output_path}")
+                manifest.close()
+                return
+
+    # path -> ProbeResult, rejected files never reach the upload stage
+    probes = {}
+    rejected = []
 
-    results = []
-
-    for v in videos:
-        try:
-            # analyze_video returns a CreativeAnalysis object
-            analysis_object = analyze_video(v) 
-            
-            if analysis_object:
-                #mode=json ensures Enums are converted to strings instead of python objects
-                row_data = analysis_object.model_dump(mode="json")
-                
-                # CSV handling
-                # CSVs can't handle lists like list[str] or list[Enum] 
-                # We must join them into a single string.
-                for key, value in row_data.items():
-                    if isinstance(value, list):
-                        row_data[key] = ", ".join(str(x) for x in value)
-
-                row_data["filename"] = os.path.basename(v)
-                results.append(row_data)
-                print(f"Saved: {os.path.basename(v)}")
+    def report_rejected(result):
+        rejected.append(result.path)
+        print(f"Rejected: {key_of(result.path)} ({result.reason})")
+        if work_queue is not None:
+            work_queue.reject(worker_id, key_of(result.path), result.reason)
+            claim_slots.release()
+
+    # watch and queue mode only see their videos one at a time, they probe inline below
+    inline_probe = args.watch or args.queue
+    if args.probe and not inline_probe:
+        probes = probe_many(videos, args.probe_workers)
+        for result in probes.values():
+            STAGE_SECONDS.observe(result.seconds, stage="probe")
+            if not result.ok:
+                report_rejected(result)
+        videos = [v for v in videos if probes[v].ok]
+        all_videos = [v for v in all_videos if v not in probes or probes[v].ok]
+        print(f"Probe: {len(rejected)} of {len(probes)} videos rejected before upload.")
+        if not videos:
+            print("Nothing left to analyse.")
+            manifest.close()
+            return
+
+    # representative path -> the videos whose rows it provides, every video stands alone without --dedup
+    members_of = {}
+    cluster_of = {}
+    if args.dedup:
+        # cluster the whole folder so memberships stay the same across --resume runs, ids
+        # hash the representative's relative path so they also survive a moved folder
+        pending = set(videos)
+        members_of = {}
+        for cluster in cluster_videos(all_videos, key=key_of):
+            todo = [m for m in cluster.members if m in pending]
+            if todo:
+                members_of[cluster.representative] = todo
+                for m in todo:
+                    cluster_of[m] = cluster
+        videos = list(members_of)
+        print(f"Dedup: {len(pending)} videos in {len(videos)} clusters, analysing one representative each.")
+
+    cache = None
+    if cache_enabled():
+        cache = ResultCache(os.getenv("ANALYSIS_CACHE_PATH", os.path.join(args.output_dir, CACHE_FILENAME)))
+
+    configure_default_response_store(
+        os.getenv("RESPONSE_STORE_PATH", os.path.join(args.output_dir, RESPONSES_FILENAME)))
+
+    registry = None
+    if registry_enabled():
+        registry = RemoteFileRegistry(
+            analyzer.get_client(),
+            os.getenv("REMOTE_FILE_REGISTRY_PATH", os.path.join(args.output_dir, REGISTRY_FILENAME)),
+        )
+
+    analyzer.USE_CONTEXT_CACHE = args.context_cache
+    analyzer.ANALYZER_ENGINE = args.engine
+    # scales parallel model calls up while they succeed, backs off on 429/503
+    # queue workers in other processes or containers spend the same quota
+    state_path = args.rate_limit_state
+    if state_path is None and work_queue is not None:
+        state_path = os.path.join(args.output_dir, RATE_LIMIT_STATE_FILENAME)
+    limiter = rate_limit.configure_default_limiter(
+        rpm=args.rpm,
+        tpm=args.tpm,
+        upload_bytes_per_second=args.upload_mb_per_s * 1e6,
+        max_concurrency=args.max_concurrency,
+        state_path=state_path or "",
+    )
+
+    pipeline = AnalysisPipeline(
+        cache=cache,
+        registry=registry,
+        upload_workers=args.upload_workers,
+        wait_workers=args.wait_workers,
+        inference_workers=args.inference_workers,
+        queue_size=args.queue_size,
+        profile=args.profile,
+        batch_inference=args.batch_inference,
+        batch_max_videos=args.batch_max_videos,
+        batch_max_tokens=args.batch_max_tokens,
+        batch_linger=args.batch_linger,
+        hook_seconds=args.hook_seconds if args.hook else None,
+        hook_clip_mode=args.hook_clip,
+    )
+
+    extra_columns = (DEDUP_COLUMNS if args.dedup else []) + (PROBE_COLUMNS if args.probe else [])
+
+    # the manifest only records rows once they are durable on disk
+    def mark_done(paths):
+        for path in paths:
+            if work_queue is not None:
+                work_queue.complete(worker_id, key_of(path))
             else:
-                print(f" Skipped (No result): {os.path.basename(v)}")
-                
-        except Exception as e:
-            print(f"Error processing {os.path.basename(v)}: {e}")
-            
-        time.sleep(2)# safety pause between videos
-        
-        
-    # 4. Save CSV
-    if results:
-        with open(output_path, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(results)
-        print(f"Done! Results in {output_path}")
+                manifest.mark_done(path, key_of(path))
+
+    # CSV rows are flushed one by one, Parquet rows in row-group batches
+    if args.format == "parquet":
+        writer = ParquetResultWriter(output_path, extra_columns, append=args.resume,
+                                     row_group_size=args.row_group_size, on_flushed=mark_done,
+                                     model=result_model, extra_types=PROBE_COLUMN_TYPES)
+    else:
+        writer = CsvResultWriter(output_path, csv_fieldnames(result_model) + extra_columns, append=args.resume,
+                                 on_flushed=mark_done)
+
+    # watch and queue mode: Ctrl+C / SIGTERM stops taking new videos, in-flight ones still finish and get written
+    stop_feeding = watcher.stop if watcher is not None else stop_claiming.set if work_queue is not None else None
+    if stop_feeding is not None:
+        def stop(signum, frame):
+            print("Stopping, finishing videos in flight (signal again to abort)...")
+            stop_feeding()
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+
+    # fed is only written by the pipeline's feeder thread, finished only here
+    fed = {"count": 0}
+    finished = 0
+
+    def counted(paths):
+        for path in paths:
+            fed["count"] += 1
+            yield path
+
+    # watch mode probes each settled file as it is handed to the pipeline
+    def probed(paths):
+        for path in paths:
+            result = probe_video(path)
+            STAGE_SECONDS.observe(result.seconds, stage="probe")
+            probes[path] = result
+            if result.ok:
+                yield path
+            else:
+                report_rejected(result)
+
+    if args.probe and inline_probe:
+        videos = probed(videos)
+
+    # claims stay alive while videos are in flight, a crashed worker's lapse and go to the others
+    renewer = LeaseRenewer(work_queue, worker_id).start() if work_queue is not None else None
+
+    with writer:
+        # results arrive in completion order, not scan order
+        for result in pipeline.run(counted(videos)):
+            finished += 1
+            if work_queue is not None:
+                claim_slots.release()
+            name = key_of(result.video_path)
+            # nothing left in flight: make buffered Parquet rows visible instead of waiting for a full row group
+            # in queue mode this also completes the claims, which lets the workers see the queue drain
+            idle = (watcher is not None or work_queue is not None) and finished == fed["count"]
+            if result.error is not None:
+                print(f"Error processing {name}: {result.error}")
+                if work_queue is not None:
+                    # back to pending for another attempt, by any worker
+                    work_queue.fail(worker_id, name, str(result.error))
+                if idle:
+                    writer.flush()
+                continue
+
+            # the pipeline yields a CreativeAnalysis object (HookAnalysis with --hook)
+            if not result.analysis:
+                print(f" Skipped (No result): {name}")
+                if work_queue is not None:
+                    work_queue.fail(worker_id, name, "no result")
+                if idle:
+                    writer.flush()
+                continue
+
+            # a representative's tags are written for every variant in its cluster
+            members = members_of.get(result.video_path, [result.video_path])
+            for member in members:
+                extra = {}
+                if args.dedup:
+                    extra = {"cluster_id": cluster_of[member].cluster_id, "cluster_representative": name}
+                if member in probes:
+                    extra.update(probe_row(probes.pop(member)))
+                writer.write_result(result.analysis, key_of(member), extra, source_path=member)
+            if idle:
+                writer.flush()
+            landed = ""
+            if watcher is not None:
+                try:
+                    # file mtime to tags on disk, the number watch mode is tuned for
+                    seconds = max(0.0, time.time() - os.path.getmtime(result.video_path))
+                    STAGE_SECONDS.observe(seconds, stage="landing")
+                    landed = f" ({seconds:.0f}s after landing)"
+                except OSError:
+                    pass
+            print(f"Saved: {name}{' (cached)' if result.from_cache else ''}"
+                  f"{f' + {len(members) - 1} variants' if args.dedup else ''}{landed}")
+
+    if work_queue is not None:
+        renewer.stop()
+        work_queue.close()
+    if manifest is not None:
+        manifest.close()
+    if rejected:
+        print(f"Probe rejected {len(rejected)} videos, none of them were uploaded.")
+    totals = transcode_totals()
+    if totals["videos"]:
+        saved = totals["original_bytes"] - totals["output_bytes"]
+        print(f"Transcoding ({args.profile}) saved {saved / 1e6:.1f} MB over {totals['videos']} uploads "
+              f"({100 * saved / totals['original_bytes']:.0f}%).")
+    if args.context_cache and analyzer.get_prefix_cache().prompt_tokens:
+        prefix = analyzer.get_prefix_cache()
+        print(f"Context cache: {prefix.cached_tokens} of {prefix.prompt_tokens} prompt tokens served from cache "
+              f"({100 * prefix.cached_tokens / prefix.prompt_tokens:.0f}%).")
+    if limiter.throttled:
+        print(f"Rate limiter: {limiter.throttled} throttled responses retried, "
+              f"concurrency ended at {int(limiter.concurrency.limit)}.")
+    if registry is not None:
+        # uploads stay reusable for re-analysis until they go idle
+        registry.collect_garbage(0 if args.purge_remote_files else args.remote_idle_seconds)
+
+    print("Run summary:")
+    print(format_summary())
+
+    if writer.rows_written:
+        print(f"Done! {writer.rows_written} new results in {output_path}")
+        if work_queue is not None:
+            print("Merge the worker shards with --finalize once every worker has exited.")
     else:
         print("No results generated.")
 
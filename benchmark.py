@@ -0,0 +1,327 @@
+import os
+import sys
+import json
+import time
+import shlex
+import socket
+import argparse
+import datetime
+import resource
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+# everything runs against services.fakes, the key only satisfies the analyzer's import check
+os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+
+BASELINE_PATH = os.path.join("benchmarks", "baselines.json")
+# flag a regression when throughput drops, or p95 latency / peak RSS grow, by more than this
+REGRESSION_TOLERANCE = 0.10
+MODES = ["batch", "api"]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark of batch_runner and the API against a "
+                                                 "simulated Gemini Files/LLM backend.")
+    parser.add_argument("--mode", choices=MODES + ["all"], default="all")
+    parser.add_argument("--videos", type=int, default=100, help="videos per scenario")
+    parser.add_argument("--video-mb", type=float, default=1.0, help="size of each synthetic video")
+    parser.add_argument("--concurrency", type=int, default=8, help="parallel API clients")
+    parser.add_argument("--api-workers", type=int, default=16, help="ANALYSIS_WORKERS for the API scenario")
+    parser.add_argument("--batch-args", default="",
+                        help="extra batch_runner.py arguments, e.g. '--inference-workers 4 --batch-inference'")
+    # simulated backend
+    parser.add_argument("--upload-mb-per-s", type=float, default=50.0, help="upload throughput per connection")
+    parser.add_argument("--processing-seconds", type=float, default=1.0, help="mean PROCESSING time")
+    parser.add_argument("--processing-jitter", type=float, default=0.3)
+    parser.add_argument("--failed-rate", type=float, default=0.0, help="share of uploads ending FAILED")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds per model call")
+    parser.add_argument("--seconds-per-1k-tokens", type=float, default=0.0,
+                        help="extra latency per 1k uncached prompt tokens")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of model calls answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="RetryInfo delay sent with each 429")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--with-cache", action="store_true",
+                        help="keep the result cache and file registry on (off by default so every video is analysed)")
+    # baselines
+    parser.add_argument("--save-baseline", nargs="?", const="", default=None, metavar="NAME",
+                        help="store the results under NAME (default: current git commit)")
+    parser.add_argument("--compare", metavar="NAME", help="compare against a saved baseline, exit 1 on regression")
+    parser.add_argument("--baseline-file", default=BASELINE_PATH)
+    parser.add_argument("--verbose", action="store_true", help="show the output of the benchmarked code")
+    # internal: run one scenario in this process and write its result to a file
+    parser.add_argument("--scenario", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+# ---- scenario side (runs in a child process, so RSS and metrics start clean) ----
+
+def _install_fakes(args):
+    from services import analyzer
+    from services.fakes import FakeGenaiClient, FakeStructuredLLM, sample_analysis
+    fake = FakeGenaiClient(
+        analyses=[sample_analysis(i) for i in range(8)],
+        latency_seconds=args.llm_latency,
+        seconds_per_1k_tokens=args.seconds_per_1k_tokens,
+        upload_bytes_per_second=args.upload_mb_per_s * 1e6,
+        processing_seconds=args.processing_seconds,
+        processing_jitter=args.processing_jitter,
+        failed_rate=args.failed_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after_seconds=args.retry_after,
+        seed=args.seed,
+    )
+    analyzer.configure_backend(fake, FakeStructuredLLM(fake))
+    return fake
+
+
+def _payload(i: int, size: int) -> bytes:
+    # unique prefix per video so content hashes differ, cheap filler for the rest
+    head = f"benchmark-video-{i:08d}".encode("ascii")
+    return head + b"\0" * max(0, size - len(head))
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _common_result(args, fake, wall: float, latencies_summary: dict, ok: int, errors: int) -> dict:
+    from services import metrics
+    stages = {stage: {k: round(v, 4) for k, v in s.items() if k in ("count", "p50", "p95", "p99")}
+              for (stage,), s in metrics.STAGE_SECONDS.summary().items()}
+    return {
+        "videos": args.videos,
+        "ok": ok,
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "throughput_per_min": round(ok / wall * 60, 2) if wall else 0.0,
+        "latency": {k: round(latencies_summary.get(k, 0.0), 4) for k in ("p50", "p95", "p99", "max")},
+        "stages": stages,
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "llm_calls": fake.calls,
+        "rate_limited": fake.rate_limited,
+        "upload_mb": round(fake.files.bytes_uploaded / 1e6, 1),
+    }
+
+
+def run_batch_scenario(args, workdir: str) -> dict:
+    import batch_runner
+    from services import metrics
+
+    inputs = os.path.join(workdir, "inputs")
+    outputs = os.path.join(workdir, "outputs")
+    os.makedirs(inputs)
+    size = int(args.video_mb * 1e6)
+    for i in range(args.videos):
+        with open(os.path.join(inputs, f"video_{i:05d}.mp4"), "wb") as f:
+            f.write(_payload(i, size))
+
+    fake = _install_fakes(args)
+    start = time.perf_counter()
+    # the synthetic payloads are not real videos, the local probe would reject them all
+    batch_runner.main(["--input-dir", inputs, "--output-dir", outputs, "--no-probe"] + shlex.split(args.batch_args))
+    wall = time.perf_counter() - start
+
+    outcomes = {key[0]: value for key, value in metrics.ANALYSES.values().items()}
+    total = metrics.STAGE_SECONDS.summary().get(("total",), {})
+    return _common_result(args, fake, wall, total, int(outcomes.get("ok", 0)), int(outcomes.get("error", 0)))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_api_scenario(args, workdir: str) -> dict:
+    os.environ["ANALYSIS_WORKERS"] = str(args.api_workers)
+    os.environ["ANALYSIS_MAX_PENDING"] = str(max(100, args.concurrency * 2))
+    try:
+        import httpx
+    except ImportError:
+        sys.exit("The API scenario needs httpx: pip install httpx (listed in requirements.txt)")
+    import uvicorn
+    from services import metrics
+    fake = _install_fakes(args)
+    import main as api
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    size = int(args.video_mb * 1e6)
+    url = f"http://127.0.0.1:{port}/analyze?wait=true"
+    client = httpx.Client(timeout=600, limits=httpx.Limits(max_connections=args.concurrency))
+
+    def one(i: int):
+        body = _payload(i, size)
+        started = time.perf_counter()
+        response = client.post(url, files={"file": (f"video_{i:05d}.mp4", body, "video/mp4")})
+        return response.status_code, time.perf_counter() - started
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        outcomes = list(pool.map(one, range(args.videos)))
+    wall = time.perf_counter() - start
+    client.close()
+    server.should_exit = True
+    thread.join(timeout=10)
+
+    latencies = sorted(seconds for status, seconds in outcomes if status == 200)
+    summary = {"p50": metrics.percentile(latencies, 50), "p95": metrics.percentile(latencies, 95),
+               "p99": metrics.percentile(latencies, 99), "max": latencies[-1] if latencies else 0.0}
+    result = _common_result(args, fake, wall, summary, len(latencies), len(outcomes) - len(latencies))
+    result["concurrency"] = args.concurrency
+    result["status_codes"] = {str(code): sum(1 for s, _ in outcomes if s == code) for code in {s for s, _ in outcomes}}
+    return result
+
+
+def run_scenario(args) -> None:
+    if not args.with_cache:
+        os.environ["ANALYSIS_CACHE"] = "off"
+        os.environ["REMOTE_FILE_REGISTRY"] = "off"
+        os.environ["RESPONSE_STORE"] = "off"
+    with tempfile.TemporaryDirectory(prefix="benchmark-") as workdir:
+        os.environ.setdefault("ANALYSIS_CACHE_PATH", os.path.join(workdir, "cache.sqlite"))
+        os.environ.setdefault("REMOTE_FILE_REGISTRY_PATH", os.path.join(workdir, "remote_files.sqlite"))
+        # never the real store: it is append-only and migrate_results.py would treat the canned answers as real
+        os.environ["RESPONSE_STORE_PATH"] = os.path.join(workdir, "responses.sqlite")
+        result = run_batch_scenario(args, workdir) if args.scenario == "batch" else run_api_scenario(args, workdir)
+    with open(args.result_file, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+
+
+# ---- driver side ----
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _config(args) -> dict:
+    # everything that changes the workload; results are only comparable when these match
+    keys = ["videos", "video_mb", "concurrency", "api_workers", "batch_args", "upload_mb_per_s",
+            "processing_seconds", "processing_jitter", "failed_rate", "llm_latency", "seconds_per_1k_tokens",
+            "rate_limit_rate", "retry_after", "seed", "with_cache"]
+    return {k: getattr(args, k) for k in keys}
+
+
+def _spawn(mode: str, argv, verbose: bool) -> dict:
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+        result_file = f.name
+    try:
+        command = [sys.executable, os.path.abspath(__file__)] + argv + ["--scenario", mode,
+                                                                       "--result-file", result_file]
+        output = None if verbose else subprocess.DEVNULL
+        subprocess.run(command, check=True, stdout=output, stderr=None if verbose else subprocess.PIPE)
+        with open(result_file, encoding="utf-8") as f:
+            return json.load(f)
+    except subprocess.CalledProcessError as e:
+        raise SystemExit(f"{mode} scenario failed:\n{(e.stderr or b'').decode(errors='replace')}")
+    finally:
+        os.remove(result_file)
+
+
+def _print_result(mode: str, r: dict) -> None:
+    lat = r["latency"]
+    print(f"[{mode}] {r['ok']}/{r['videos']} ok, {r['errors']} errors in {r['wall_seconds']:.1f}s "
+          f"-> {r['throughput_per_min']:.1f} videos/min")
+    print(f"[{mode}] latency p50 {lat['p50']:.2f}s  p95 {lat['p95']:.2f}s  p99 {lat['p99']:.2f}s  "
+          f"max {lat['max']:.2f}s | peak RSS {r['peak_rss_mb']:.0f} MB | "
+          f"{r['llm_calls']} model calls, {r['rate_limited']} rate-limited, {r['upload_mb']:.0f} MB uploaded")
+    for stage, s in sorted(r["stages"].items()):
+        print(f"[{mode}]   {stage:<16} n={s['count']:<6} p50 {s['p50']:.3f}s  p95 {s['p95']:.3f}s  "
+              f"p99 {s['p99']:.3f}s")
+
+
+def _compare(results: dict, baseline: dict, config: dict) -> bool:
+    """print deltas against a baseline, True when something regressed beyond the tolerance."""
+    if baseline.get("config") != config:
+        print("Warning: baseline was recorded with a different workload, deltas may not be meaningful.")
+    regressed = False
+    checks = [("throughput_per_min", lambda r: r["throughput_per_min"], -1),
+              ("latency p95", lambda r: r["latency"]["p95"], 1),
+              ("peak_rss_mb", lambda r: r["peak_rss_mb"], 1)]
+    for mode, current in results.items():
+        before = baseline["results"].get(mode)
+        if before is None:
+            continue
+        for label, get, worse_sign in checks:
+            old, new = get(before), get(current)
+            change = (new - old) / old if old else 0.0
+            bad = change * worse_sign > REGRESSION_TOLERANCE
+            regressed |= bad
+            print(f"[{mode}] {label:<20} {old:>10.2f} -> {new:>10.2f} ({change:+.1%}){'  REGRESSION' if bad else ''}")
+    return regressed
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+    if args.scenario:
+        run_scenario(args)
+        return
+
+    # the driver only forwards workload options to the scenario processes
+    forwarded = []
+    skip_next = False
+    for i, token in enumerate(argv):
+        if skip_next:
+            skip_next = False
+            continue
+        name = token.split("=", 1)[0]
+        if name in ("--mode", "--save-baseline", "--compare", "--baseline-file"):
+            has_value = "=" not in token and i + 1 < len(argv) and not argv[i + 1].startswith("--")
+            skip_next = has_value
+            continue
+        if name == "--verbose":
+            continue
+        forwarded.append(token)
+
+    modes = MODES if args.mode == "all" else [args.mode]
+    results = {}
+    for mode in modes:
+        print(f"Running {mode} scenario: {args.videos} videos of {args.video_mb} MB...")
+        results[mode] = _spawn(mode, forwarded, args.verbose)
+        _print_result(mode, results[mode])
+
+    baselines = {}
+    if os.path.exists(args.baseline_file):
+        with open(args.baseline_file, encoding="utf-8") as f:
+            baselines = json.load(f)
+
+    regressed = False
+    if args.compare:
+        if args.compare not in baselines:
+            raise SystemExit(f"No baseline named '{args.compare}' in {args.baseline_file}")
+        print(f"Compared with baseline '{args.compare}' (tolerance {REGRESSION_TOLERANCE:.0%}):")
+        regressed = _compare(results, baselines[args.compare], _config(args))
+
+    if args.save_baseline is not None:
+        name = args.save_baseline or _git_commit()
+        baselines[name] = {
+            "commit": _git_commit(),
+            "recorded_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "config": _config(args),
+            "results": results,
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline_file)), exist_ok=True)
+        with open(args.baseline_file, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"Saved baseline '{name}' to {args.baseline_file}")
+
+    if regressed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
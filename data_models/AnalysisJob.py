@@ -0,0 +1,27 @@
+from enum import Enum
+from typing import Optional, Union
+from pydantic import BaseModel, Field
+from data_models.CreativeAdsAnalysis import CreativeAnalysis
+from data_models.HookAnalysis import HookAnalysis
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class AnalysisJob(BaseModel):
+    """
+    State of an asynchronous /analyze or /analyze/hook request, served from GET /jobs/{id}.
+    """
+
+    id: str
+    status: JobStatus = JobStatus.QUEUED
+    filename: Optional[str] = None
+    created_at: float = Field(..., description="Unix time the upload was accepted.")
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[Union[CreativeAnalysis, HookAnalysis]] = None
+    error: Optional[str] = None
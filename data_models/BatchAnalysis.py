@@ -0,0 +1,22 @@
+from typing import List
+from pydantic import BaseModel, Field
+from data_models.CreativeAdsAnalysis import CreativeAnalysis
+
+
+class VideoAnalysis(BaseModel):
+    filename: str = Field(
+        ...,
+        description="The filename shown right before the video this entry describes, copied exactly."
+    )
+    analysis: CreativeAnalysis
+
+
+class BatchAnalysis(BaseModel):
+    """
+    Response wrapper for one request carrying several videos.
+    """
+
+    results: List[VideoAnalysis] = Field(
+        ...,
+        description="Exactly one entry per video in the request, each analysed independently of the others."
+    )
@@ -131,6 +131,7 @@ class FailType(str, Enum):
 class PointerStyle(str, Enum):
     REAL_HAND = "Pointer_RealHand"
     CARTOON_HAND = "Pointer_CartoonHand"
+    THREE_D_HAND = "Pointer_3D_Hand"
     ARROW_CURSOR = "Pointer_Arrow"
     GHOST_TOUCH = "Pointer_Ghost"
 
@@ -0,0 +1,24 @@
+from copy import copy
+from pydantic import create_model
+from data_models.CreativeAdsAnalysis import CreativeAnalysis
+
+# what can be judged from the opening seconds alone; names, enums and
+# descriptions are taken from CreativeAnalysis so the tags stay comparable
+HOOK_FIELDS = [
+    "art_style",
+    "color_palette",
+    "visual_clutter",
+    "primary_genre",
+    "character_archetype",
+    "emotional_hooks",
+    "fail_scenario",
+    "pointer_style",
+    "text_hooks",
+]
+
+HookAnalysis = create_model(
+    "HookAnalysis",
+    __doc__="Fast triage of the opening hook of a Mobile Game Ad Creative, a subset of CreativeAnalysis.",
+    **{name: (CreativeAnalysis.model_fields[name].annotation, copy(CreativeAnalysis.model_fields[name]))
+       for name in HOOK_FIELDS},
+)
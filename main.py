@@ -1,34 +1,269 @@
+import io
 import os
-import shutil
-import time
+import json
+import asyncio
+import mimetypes
+from contextlib import asynccontextmanager
+from typing import List, Optional
 from dotenv import load_dotenv
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from services.analyzer import analyze_video
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from services import analyzer
+from services.analyzer import (HOOK_CLIP_MODES, HOOK_SECONDS, analysis_cache_key, analyze_hook_stream,
+                               analyze_video_stream, hook_cache_key)
+from services.cache import get_default_cache
+from services.file_registry import get_default_registry
+from services.jobs import JobManager, QueueFullError
+from services.metrics import REGISTRY
+from services.singleflight import SingleFlight
+from services.streaming import stream_sha256
+from services.tag_index import QuerySyntaxError, TagIndex
 from data_models.CreativeAdsAnalysis import CreativeAnalysis
+from data_models.AnalysisJob import AnalysisJob
+from data_models.HookAnalysis import HookAnalysis
 load_dotenv()
 
-app = FastAPI(title="Video Analysis Agent (Gemini Native)")
+# analyses run here, never on the event loop
+jobs = JobManager()
+# identical uploads analysed at the same time share one upload, wait and inference
+inflight = SingleFlight()
 
+# batch outputs (CSV files or Parquet datasets) that /search reads incrementally
+SEARCH_SOURCES = [p for p in os.getenv(
+    "SEARCH_SOURCES", "/app/data/outputs/analysis_results.csv,/app/data/outputs/analysis_results.parquet"
+).split(",") if p]
+tag_index = TagIndex()
 
-@app.post("/analyze", response_model=CreativeAnalysis)
-async def analyze_endpoint(file: UploadFile = File(...)):
-    # save temp file
-    temp_filename = f"temp_{file.filename}"
+# uploads accepted by one POST /analyze/batch
+BATCH_MAX_FILES = int(os.getenv("ANALYZE_BATCH_MAX_FILES", "50"))
+# SSE comment sent while nothing finishes, keeps proxies from closing the stream
+SSE_KEEPALIVE_SECONDS = 15.0
+# batch runs clean up idle uploads at the end, the long-running API does it on this interval
+REMOTE_GC_INTERVAL_SECONDS = float(os.getenv("REMOTE_FILE_GC_INTERVAL_SECONDS", "3600"))
+
+
+async def _collect_remote_files():
+    """delete uploads the registry has not reused for REMOTE_FILE_IDLE_SECONDS."""
+    while True:
+        await asyncio.sleep(REMOTE_GC_INTERVAL_SECONDS)
+        try:
+            registry = get_default_registry(analyzer.get_client())
+            if registry is not None:
+                await asyncio.to_thread(registry.collect_garbage)
+        except Exception as e:
+            print(f"Remote file cleanup failed: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    gc_task = asyncio.create_task(_collect_remote_files())
+    yield
+    gc_task.cancel()
+    jobs.shutdown()
+
+
+app = FastAPI(title="Video Analysis Agent (Gemini Native)", lifespan=lifespan)
+
+
+def _take_stream(file: UploadFile):
+    """take ownership of the upload's spooled body so it outlives the request.
+
+    FastAPI closes UploadFile once the response is sent, but background jobs
+    still need to read it; the job closes the stream when it finishes.
+    """
+    stream = file.file
+    file.file = io.BytesIO()
+    return stream
+
+
+def _video_mime_type(file: UploadFile) -> str:
+    # clients often send application/octet-stream, the Files API needs the real type
+    if file.content_type and file.content_type.startswith("video/"):
+        return file.content_type
+    guessed, _ = mimetypes.guess_type(file.filename or "")
+    return guessed if guessed and guessed.startswith("video/") else "video/mp4"
+
+
+def _analyze_and_index(stream, mime_type, filename, cache, registry) -> CreativeAnalysis:
+    # hashing the spooled body first lets duplicates coalesce, and cache hits skip the upload
+    content_hash = stream_sha256(stream)
+    key = analysis_cache_key(content_hash)
+    result = inflight.do(key, analyze_video_stream, stream, mime_type, filename, cache, registry, content_hash)
+    # every request indexes under its own filename, even when it joined another's analysis
+    if result is not None and filename:
+        tag_index.add(filename, result)
+    return result
+
+
+def _analyze_hook(stream, mime_type, filename, cache, registry, seconds, clip) -> HookAnalysis:
+    # clip mode does not change the result, see hook_cache_key
+    content_hash = stream_sha256(stream)
+    key = hook_cache_key(content_hash, seconds)
+    return inflight.do(key, analyze_hook_stream, stream, mime_type, filename, cache, registry, seconds, clip,
+                       content_hash, kind="hook")
+
+
+def _submit_analysis(file: UploadFile) -> AnalysisJob:
+    # the body is streamed to the Files API in chunks, no local copy is written
+    stream = _take_stream(file)
+    mime_type = _video_mime_type(file)
+    try:
+        return jobs.submit(_analyze_and_index, stream, mime_type, file.filename,
+                           get_default_cache(), get_default_registry(analyzer.get_client()),
+                           filename=file.filename, on_finish=stream.close)
+    except QueueFullError:
+        stream.close()
+        raise
+
+
+@app.post("/analyze", response_model=None)
+async def analyze_endpoint(file: UploadFile = File(...),
+                           wait: bool = Query(False, description="Block until the analysis is done and return it.")):
+    try:
+        job = _submit_analysis(file)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    if not wait:
+        return JSONResponse(status_code=202, content=job.model_dump(mode="json"))
+
+    # synchronous callers keep the old contract: the CreativeAnalysis or a 500
     try:
-        with open(temp_filename, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        #analyze video
-        result = analyze_video(temp_filename)
+        result: CreativeAnalysis = await asyncio.wrap_future(jobs.future(job.id))
         return result
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
+
+def _encode_event(event: str, payload: dict, sse: bool) -> str:
+    data = json.dumps({"event": event, **payload})
+    return f"event: {event}\ndata: {data}\n\n" if sse else data + "\n"
+
+
+async def _stream_batch(submitted, sse: bool):
+    """accepted first, then one result/error event per video in completion order."""
+    yield _encode_event("accepted", {"jobs": [
+        {"index": i, "filename": name, "job_id": job.id if job else None} for i, name, job, _ in submitted
+    ]}, sse)
+
+    waiting = {}
+    for index, name, job, refused in submitted:
+        if job is None:
+            yield _encode_event("error", {"index": index, "filename": name, "job_id": None, "error": refused}, sse)
+        else:
+            # shielded: cancelling the waiter must not cancel the job's own future (wrap_future would),
+            # or the job stays queued and never finishes
+            waiting[asyncio.shield(asyncio.wrap_future(jobs.future(job.id)))] = (index, name, job.id)
+
+    try:
+        while waiting:
+            done, _ = await asyncio.wait(waiting, timeout=SSE_KEEPALIVE_SECONDS if sse else None,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                yield ": keepalive\n\n"
+                continue
+            for task in done:
+                index, name, job_id = waiting.pop(task)
+                item = {"index": index, "filename": name, "job_id": job_id}
+                if task.exception() is not None:
+                    yield _encode_event("error", {**item, "error": str(task.exception())}, sse)
+                else:
+                    result = task.result()
+                    yield _encode_event("result", {
+                        **item, "result": result.model_dump(mode="json") if result is not None else None,
+                    }, sse)
+    finally:
+        # a client that disconnects drops only these waiters, the jobs run on and stay readable via GET /jobs/{id}
+        for task in waiting:
+            task.cancel()
+    if sse:
+        yield _encode_event("end", {"count": len(submitted)}, sse)
+
+
+@app.post("/analyze/batch", response_model=None)
+async def analyze_batch_endpoint(request: Request, files: List[UploadFile] = File(...),
+                                 stream_format: Optional[str] = Query(
+                                     None, alias="format", pattern="^(ndjson|sse)$",
+                                     description="ndjson or sse, defaults to sse when Accept is text/event-stream.")):
+    # every upload becomes its own job on the shared pool, results stream back as each one finishes
+    if len(files) > BATCH_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_FILES} files per batch.")
+    if stream_format is None:
+        stream_format = "sse" if "text/event-stream" in request.headers.get("accept", "") else "ndjson"
+    sse = stream_format == "sse"
+
+    submitted = []
+    for index, file in enumerate(files):
+        try:
+            submitted.append((index, file.filename, _submit_analysis(file), None))
+        except QueueFullError as e:
+            if not submitted:
+                # nothing admitted at all, same answer as POST /analyze
+                raise HTTPException(status_code=503, detail=str(e))
+            # the rest are reported as errors in the stream, the client retries only those
+            submitted.append((index, file.filename, None, str(e)))
+
+    media_type = "text/event-stream" if sse else "application/x-ndjson"
+    # no-transform/X-Accel-Buffering stop proxies from holding results back until the batch is done
+    headers = {"Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"}
+    return StreamingResponse(_stream_batch(submitted, sse), media_type=media_type, headers=headers)
+
+
+@app.post("/analyze/hook", response_model=None)
+async def analyze_hook_endpoint(file: UploadFile = File(...),
+                                wait: bool = Query(False, description="Block until the triage is done and return it."),
+                                seconds: float = Query(HOOK_SECONDS, gt=0, le=60,
+                                                       description="Length of the opening that is analysed."),
+                                clip: str = Query(analyzer.HOOK_CLIP_MODE, pattern=f"^({'|'.join(HOOK_CLIP_MODES)})$",
+                                                  description="local: cut before upload, server: send offsets.")):
+    # fast triage of the opening seconds with the compact HookAnalysis schema
+    stream = _take_stream(file)
+    mime_type = _video_mime_type(file)
+    try:
+        job = jobs.submit(_analyze_hook, stream, mime_type, file.filename,
+                          get_default_cache(), get_default_registry(analyzer.get_client()), seconds, clip,
+                          filename=file.filename, on_finish=stream.close)
+    except QueueFullError as e:
+        stream.close()
+        raise HTTPException(status_code=503, detail=str(e))
+
+    if not wait:
+        return JSONResponse(status_code=202, content=job.model_dump(mode="json"))
+
+    try:
+        result: HookAnalysis = await asyncio.wrap_future(jobs.future(job.id))
+        return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    
-    # cleanup temp file    
-    finally: 
-        if os.path.exists(temp_filename):
-            os.remove(temp_filename)
+
+
+@app.get("/jobs/{job_id}", response_model=AnalysisJob)
+async def job_status(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id.")
+    return job
+
+
+# plain def: FastAPI runs it in the threadpool, so loading new rows never blocks the loop
+@app.get("/search")
+def search_endpoint(q: str = Query(..., description="e.g. Genre_ArcadeIdle AND Mechanic_Digging AND NOT VO_None"),
+                    limit: int = Query(100, ge=1, le=10000)):
+    try:
+        # picks up only rows appended since the previous search
+        tag_index.refresh(SEARCH_SOURCES)
+        count, filenames = tag_index.search(q, limit=limit)
+    except QuerySyntaxError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"query": q, "count": count, "filenames": filenames}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    # Prometheus text format: stage latency histograms, upload bytes, tokens, polls, retries, cache lookups
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
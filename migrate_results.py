@@ -0,0 +1,84 @@
+import os
+import argparse
+from dotenv import load_dotenv
+from services import analyzer
+from services.cache import ResultCache
+from services.columnar import ParquetResultWriter
+from services.migration import RESULT_MODELS, load_rules, migrate
+from services.response_store import DEFAULT_RESPONSE_STORE_PATH, ResponseStore
+from services.results_writer import CsvResultWriter, csv_fieldnames
+
+load_dotenv()
+
+# what batch_runner.py writes next to its outputs
+DEFAULT_OUTPUT_DIR = "/app/data/outputs"
+RESPONSES_FILENAME = "analysis_responses.sqlite"
+CACHE_FILENAME = "analysis_cache.sqlite"
+
+
+def _default_path(filename: str, fallback: str) -> str:
+    path = os.path.join(DEFAULT_OUTPUT_DIR, filename)
+    return path if os.path.exists(path) else fallback
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Re-derive results from stored raw responses after a schema change, without API calls.")
+    parser.add_argument("--store", default=_default_path(RESPONSES_FILENAME, DEFAULT_RESPONSE_STORE_PATH),
+                        help="response store written by batch_runner.py or the API")
+    parser.add_argument("--cache", default=_default_path(CACHE_FILENAME, os.path.join(".cache", CACHE_FILENAME)),
+                        help="result cache to fill under the current schema version, so runs hit it")
+    parser.add_argument("--no-cache", action="store_true", help="only validate and export, leave the cache alone")
+    parser.add_argument("--kind", choices=list(RESULT_MODELS), default="analysis",
+                        help="analysis = CreativeAnalysis, hook = HookAnalysis")
+    parser.add_argument("--rules", help="JSON file with rename_fields / values / drop_unknown rules")
+    parser.add_argument("--drop-unknown", action="store_true",
+                        help="drop enum values the current schema does not know instead of failing the record")
+    parser.add_argument("--output", help="also export the migrated results, .csv or .parquet")
+    parser.add_argument("--any-prompt", action="store_true",
+                        help="include responses produced with a different prompt than the current one")
+    parser.add_argument("--top", type=int, default=20, help="how many failing field values to list")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.store):
+        parser.error(f"no response store at {args.store}")
+    rules = load_rules(args.rules)
+    if args.drop_unknown:
+        rules = rules._replace(drop_unknown=True)
+
+    if args.kind == "hook":
+        prompt, schema_version = analyzer.HOOK_PROMPT, analyzer.HOOK_SCHEMA_VERSION
+    else:
+        prompt, schema_version = analyzer.ANALYSIS_PROMPT, analyzer.SCHEMA_VERSION
+
+    store = ResponseStore(args.store)
+    cache = None if args.no_cache else ResultCache(args.cache)
+    model = RESULT_MODELS[args.kind]
+    writer = None
+    if args.output and args.output.endswith(".parquet"):
+        writer = ParquetResultWriter(args.output, model=model)
+    elif args.output:
+        writer = CsvResultWriter(args.output, csv_fieldnames(model))
+
+    print(f"Migrating {args.kind} responses from {args.store} to schema {schema_version}...")
+    report = migrate(store, args.kind, rules, cache, writer, args.any_prompt, prompt, schema_version)
+    if writer is not None:
+        writer.close()
+    store.close()
+
+    print(f"{report.migrated} of {report.total} videos migrated "
+          f"({report.rewritten} needed the rules), {report.failed} still failing.")
+    if report.skipped_prompt:
+        print(f"{report.skipped_prompt} skipped: produced with a different prompt (--any-prompt to include).")
+    if cache is not None:
+        print(f"Result cache {args.cache} now serves them without API calls.")
+    if args.output:
+        print(f"Exported to {args.output}")
+    if report.failures:
+        print("Most common validation failures (field, value, count), candidates for --rules:")
+        for (field, value), count in report.failures.most_common(args.top):
+            print(f"{count:>8}  {field} = {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import os
+import argparse
+from services.tag_index import QuerySyntaxError, TagIndex
+
+# same outputs batch_runner.py writes
+DEFAULT_SOURCES = [
+    "/app/data/outputs/analysis_results.csv",
+    "/app/data/outputs/analysis_results.parquet",
+]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Boolean tag search over analysed creatives.")
+    parser.add_argument("query", nargs="?", default="", help="e.g. 'Genre_ArcadeIdle AND Mechanic_Digging AND NOT VO_None'")
+    parser.add_argument("--source", action="append",
+                        help="CSV file or Parquet dataset to index (repeatable)")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--counts", action="store_true", help="print per-tag counts instead of matches")
+    args = parser.parse_args(argv)
+
+    sources = args.source or [p for p in DEFAULT_SOURCES if os.path.exists(p)]
+    index = TagIndex()
+    index.refresh(sources)
+    print(f"Indexed {len(index)} creatives from {', '.join(sources) or 'nothing'}")
+
+    if args.counts:
+        for tag, count in sorted(index.tag_counts().items(), key=lambda kv: -kv[1]):
+            print(f"{count:>8}  {tag}")
+        return
+
+    if not args.query:
+        parser.error("a query is required unless --counts is given")
+    try:
+        count, filenames = index.search(args.query, limit=args.limit)
+    except QuerySyntaxError as e:
+        parser.error(str(e))
+    print(f"{count} matches")
+    for name in filenames:
+        print(name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import os
+import csv
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from services.schema_fields import enum_values, multi_enum_fields, single_enum_fields
+from services.tag_index import BOOL_TAGS
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pacsv
+except ImportError:  # optional, needed to load batch outputs
+    pa = None
+
+# rows per matrix product when accumulating co-occurrence, bounds float32 scratch memory
+CHUNK_ROWS = 200_000
+
+
+class TagVocabulary:
+    """column layout of the multi-hot matrix: every enum value of every field, plus bool tags."""
+
+    def __init__(self):
+        self.columns: List[str] = []
+        self.field_of: List[str] = []
+        self.slices: Dict[str, slice] = {}
+        fields = list(single_enum_fields().items()) + list(multi_enum_fields().items())
+        for name, cls in fields:
+            start = len(self.columns)
+            values = enum_values(cls)
+            self.columns.extend(values)
+            self.field_of.extend([name] * len(values))
+            self.slices[name] = slice(start, len(self.columns))
+        for name in BOOL_TAGS:
+            self.slices[name] = slice(len(self.columns), len(self.columns) + 1)
+            self.columns.append(name)
+            self.field_of.append(name)
+        self.single_fields = list(single_enum_fields())
+        self.multi_fields = list(multi_enum_fields())
+
+    def __len__(self) -> int:
+        return len(self.columns)
+
+    def values(self, field: str) -> List[str]:
+        return self.columns[self.slices[field]]
+
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise ImportError("pyarrow is required to load results for analytics: pip install pyarrow")
+
+
+def load_table(source: str):
+    """batch output (CSV file or Parquet dataset) as a pyarrow Table."""
+    _require_pyarrow()
+    if os.path.isdir(source) or source.endswith(".parquet"):
+        from services.columnar import read_results
+        # parts come back in the current bit layout, see columnar.remap_multi_hot
+        table = read_results(source)
+        # an empty dataset directory, e.g. before the first flush
+        return table if table is not None else pa.table({"filename": pa.array([], type=pa.string())})
+    # every column as string, the encoder does its own typing
+    with open(source, newline="", encoding="utf-8-sig") as f:
+        header = next(csv.reader(f))
+    convert = pacsv.ConvertOptions(strings_can_be_null=True,
+                                   column_types={name: pa.string() for name in header})
+    return pacsv.read_csv(source, read_options=pacsv.ReadOptions(block_size=64 << 20),
+                          convert_options=convert)
+
+
+def encode(table, vocab: Optional[TagVocabulary] = None) -> Tuple[np.ndarray, TagVocabulary]:
+    """multi-hot uint8 matrix (rows = creatives, columns = vocab) built with columnar ops only."""
+    vocab = vocab or TagVocabulary()
+    n = table.num_rows
+    matrix = np.zeros((n, len(vocab)), dtype=np.uint8)
+    stored_layout = None
+    if table.schema.metadata and b"creative_analysis.enums" in table.schema.metadata:
+        from services.columnar import enum_layout
+        stored_layout = enum_layout(table)["multi_hot"]
+
+    for field in vocab.single_fields:
+        if field not in table.column_names:
+            continue
+        column = table[field]
+        if pa.types.is_dictionary(column.type):
+            column = column.cast(pa.string())
+        _scatter(matrix, np.arange(n), column, vocab, field)
+
+    for field in vocab.multi_fields:
+        if field not in table.column_names:
+            continue
+        column = table[field]
+        if pa.types.is_integer(column.type):
+            # Parquet bitmask: expand bits, then map stored bit order onto the current vocab
+            domain = stored_layout[field] if stored_layout else vocab.values(field)
+            masks = column.fill_null(0).to_numpy().astype(np.uint64)
+            bits = ((masks[:, None] >> np.arange(len(domain), dtype=np.uint64)) & 1).astype(np.uint8)
+            positions = {v: vocab.slices[field].start + i for i, v in enumerate(vocab.values(field))}
+            for bit, value in enumerate(domain):
+                if value in positions:
+                    matrix[:, positions[value]] |= bits[:, bit]
+        else:
+            # CSV: "A, B, C" strings
+            lists = pc.split_pattern(column.combine_chunks(), ", ")
+            rows = pc.list_parent_indices(lists).to_numpy()
+            _scatter(matrix, rows, pc.list_flatten(lists), vocab, field)
+
+    for field in BOOL_TAGS:
+        if field not in table.column_names:
+            continue
+        column = table[field]
+        if not pa.types.is_boolean(column.type):
+            column = pc.equal(column, "True")
+        matrix[:, vocab.slices[field].start] = column.fill_null(False).to_numpy(zero_copy_only=False)
+
+    return matrix, vocab
+
+
+def _scatter(matrix: np.ndarray, rows: np.ndarray, values, vocab: TagVocabulary, field: str) -> None:
+    indices = pc.index_in(values, value_set=pa.array(vocab.values(field)))
+    valid = indices.is_valid().to_numpy(zero_copy_only=False)
+    columns = indices.fill_null(0).to_numpy(zero_copy_only=False)
+    matrix[rows[valid], vocab.slices[field].start + columns[valid]] = 1
+
+
+def cooccurrence(matrix: np.ndarray, chunk_rows: int = CHUNK_ROWS) -> np.ndarray:
+    """C[a, b] = number of creatives tagged with both a and b (diagonal = marginals)."""
+    k = matrix.shape[1]
+    counts = np.zeros((k, k), dtype=np.float64)
+    for start in range(0, matrix.shape[0], chunk_rows):
+        block = matrix[start:start + chunk_rows].astype(np.float32)
+        # float32 is exact for per-chunk counts below 2**24
+        counts += block.T @ block
+    return counts
+
+
+def lift(counts: np.ndarray, n: int) -> np.ndarray:
+    """P(a, b) / (P(a) P(b)); NaN where either tag never occurs."""
+    marginals = np.diag(counts)
+    expected = np.outer(marginals, marginals) / max(n, 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(expected > 0, counts / expected, np.nan)
+
+
+def group_distribution(matrix: np.ndarray, vocab: TagVocabulary, group_field: str = "primary_genre"):
+    """share of each tag within each value of group_field, as a (groups x tags) matrix."""
+    columns = vocab.slices[group_field]
+    group_counts = np.zeros((columns.stop - columns.start, matrix.shape[1]), dtype=np.float64)
+    for start in range(0, matrix.shape[0], CHUNK_ROWS):
+        block = matrix[start:start + CHUNK_ROWS].astype(np.float32)
+        group_counts += block[:, columns].T @ block
+    totals = group_counts[np.arange(len(group_counts)), columns.start + np.arange(len(group_counts))]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shares = group_counts / totals[:, None]
+    return vocab.values(group_field), totals, np.nan_to_num(shares)
+
+
+def top_lift_pairs(counts: np.ndarray, lifts: np.ndarray, vocab: TagVocabulary,
+                   min_support: int = 20, top: int = 20) -> List[Tuple[str, str, int, float]]:
+    """strongest cross-field associations with at least min_support co-occurrences."""
+    _, field_ids = np.unique(vocab.field_of, return_inverse=True)
+    mask = (counts >= min_support) & (field_ids[:, None] != field_ids[None, :])
+    mask &= np.triu(np.ones_like(mask, dtype=bool), k=1)
+    candidates = np.where(mask, np.nan_to_num(lifts, nan=0.0), 0.0)
+    flat = np.argsort(candidates, axis=None)[::-1][:top]
+    pairs = []
+    for a, b in zip(*np.unravel_index(flat, candidates.shape)):
+        if candidates[a, b] <= 0:
+            break
+        pairs.append((vocab.columns[a], vocab.columns[b], int(counts[a, b]), float(lifts[a, b])))
+    return pairs
@@ -1,69 +1,792 @@
 import os
-import time
+import json
+import hashlib
+import shutil
+import tempfile
+import threading
+import mimetypes
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple, Type
 from dotenv import load_dotenv
-from google import genai 
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import HumanMessage
+from pydantic import BaseModel
+from data_models.BatchAnalysis import BatchAnalysis
 from data_models.CreativeAdsAnalysis import CreativeAnalysis
+from data_models.HookAnalysis import HookAnalysis
+from services.cache import ResultCache, file_sha256, make_cache_key
+from services.context_cache import PrefixCache, context_cache_enabled, schema_instruction, slim_schema
+from services.file_registry import RemoteFileRegistry
+from services.file_tracker import FileReadinessTracker
+from services.metrics import RETRIES, UPLOAD_BYTES, record_usage, stage_timer, track_analysis
+from services.rate_limit import get_default_limiter
+from services.response_store import ResponseRecord, get_default_response_store
+from services.streaming import DEFAULT_CHUNK_SIZE, HashingReader, stream_sha256
 
 load_dotenv()
 
-if not os.getenv("GOOGLE_API_KEY"):
-    raise ValueError("GOOGLE_API_KEY not found. Please set it in your .env file.")
+# Gemini 2.5 pro or flash , native Multimodal"
+# gemini-2.5-flash is faster/cheaper but less capable than "gemini-1.5-pro"
+MODEL_NAME = "gemini-2.5-flash"
 
-client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
+# "native" calls google-genai directly and validates with pydantic,
+# "langchain" goes through ChatGoogleGenerativeAI (optional dependency)
+ANALYZER_ENGINES = ("native", "langchain")
+ANALYZER_ENGINE = os.getenv("ANALYZER_ENGINE", "native")
 
+ANALYSIS_PROMPT = "Analyze this mobile game ad. Focus on the narrative flow, how the audio matches the visuals, and the 'hook' in the first 3 seconds."
 
-# Gemini 2.5 pro or flash , native Multimodal"
-# gemini-2.5-flash is faster/cheaper but less capable than "gemini-1.5-pro"
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash", 
-    temperature=0
-)
+# any change to the pydantic schema (enums, descriptions) produces a new version
+SCHEMA_VERSION = hashlib.sha256(
+    json.dumps(CreativeAnalysis.model_json_schema(), sort_keys=True).encode("utf-8")
+).hexdigest()[:16]
+
+# context caching: the prompt and field descriptions live in a server-side cache,
+# each request carries the video, a cache reference and the bare response schema
+USE_CONTEXT_CACHE = context_cache_enabled()
+RESPONSE_SCHEMA = slim_schema(CreativeAnalysis)
+_prefix_cache: Optional[PrefixCache] = None
+_prefix_cache_lock = threading.Lock()
+
+# the SDK client, chat model and poll loop are built on first use, so importing
+# this module needs neither the API key nor the (slow to import) SDKs
+_client = None
+_llm = None
+_file_tracker: Optional[FileReadinessTracker] = None
+_backend_lock = threading.RLock()
+# response schema -> prepared request config / bound chat model, reused across calls
+_native_configs: Dict[type, object] = {}
+_bound_llms: Dict[type, object] = {}
+
+
+def get_client():
+    """the shared google-genai client."""
+    global _client
+    with _backend_lock:
+        if _client is None:
+            if not os.getenv("GOOGLE_API_KEY"):
+                raise ValueError("GOOGLE_API_KEY not found. Please set it in your .env file.")
+            from google import genai
+            _client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
+        return _client
+
+
+def get_llm():
+    """the LangChain chat model used by ANALYZER_ENGINE=langchain."""
+    global _llm
+    with _backend_lock:
+        if _llm is None:
+            try:
+                from langchain_google_genai import ChatGoogleGenerativeAI
+            except ImportError:
+                raise RuntimeError("ANALYZER_ENGINE=langchain needs the langchain-google-genai package")
+            _llm = ChatGoogleGenerativeAI(model=MODEL_NAME, temperature=0)
+        return _llm
+
+
+def get_file_tracker() -> FileReadinessTracker:
+    # one poll loop shared by every upload waiting for server-side processing
+    global _file_tracker
+    with _backend_lock:
+        if _file_tracker is None:
+            _file_tracker = FileReadinessTracker(get_client())
+        return _file_tracker
+
+
+def configure_backend(new_client=None, new_llm=None) -> None:
+    """swap the Gemini client and/or chat model, e.g. for the offline fakes in services.fakes."""
+    global _client, _llm, _file_tracker, _prefix_cache
+    with _backend_lock:
+        if new_client is not None:
+            _client = new_client
+            _file_tracker = FileReadinessTracker(new_client)
+            with _prefix_cache_lock:
+                _prefix_cache = None
+        if new_llm is not None:
+            _llm = new_llm
+            _bound_llms.clear()
+
+
+def get_prefix_cache() -> PrefixCache:
+    """the cached instruction prefix for the current schema version, created on first use."""
+    global _prefix_cache
+    with _prefix_cache_lock:
+        if _prefix_cache is None:
+            _prefix_cache = PrefixCache(get_client(), MODEL_NAME,
+                                        schema_instruction(ANALYSIS_PROMPT, CreativeAnalysis), SCHEMA_VERSION)
+        return _prefix_cache
+
+
+def _analysis_variant(profile: str = "full") -> str:
+    # the untouched upload keeps the original key, transcoded inputs get their own
+    return "" if profile == "full" else f"profile={profile}"
+
+
+def analysis_cache_key(content_hash: str, profile: str = "full") -> str:
+    return make_cache_key(content_hash, MODEL_NAME, ANALYSIS_PROMPT, SCHEMA_VERSION, _analysis_variant(profile))
+
+
+def analysis_record(content_hash: Optional[str], source: Optional[str] = None,
+                    profile: str = "full") -> ResponseRecord:
+    """response store entry for a full analysis, variant matches analysis_cache_key."""
+    return ResponseRecord("analysis", content_hash, source, _analysis_variant(profile))
+
+
+def cached_analysis(video_path: str, cache: Optional[ResultCache],
+                    profile: str = "full") -> Optional[CreativeAnalysis]:
+    """return the stored result for this video without any network calls, or None."""
+    if cache is None:
+        return None
+    return cache.get(analysis_cache_key(file_sha256(video_path), profile))
+
+
+def analyze_video(video_path: str, cache: Optional[ResultCache] = None,
+                  registry: Optional[RemoteFileRegistry] = None,
+                  profile: str = "full") -> CreativeAnalysis:
+    """analyze a video file, reusing a cached result for identical content when a cache is given.
+
+    With a registry, a still-live upload of the same bytes is reused instead of uploading again.
+    profile names a services.preprocess transcoding profile applied before upload.
+    """
+    with track_analysis():
+        if cache is None and registry is None:
+            content_hash = file_sha256(video_path) if get_default_response_store() is not None else None
+            return _analyze_uncached(video_path, content_hash, profile=profile)
+
+        content_hash = file_sha256(video_path)
+        key = analysis_cache_key(content_hash, profile)
+        if cache is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                print(f"Cache hit: {video_path}")
+                return cached
+
+        analysis_result = _analyze_uncached(video_path, content_hash, registry, profile)
+        if cache is not None and analysis_result is not None:
+            cache.put(key, content_hash, MODEL_NAME, SCHEMA_VERSION, analysis_result)
+        return analysis_result
+
+
+def analyze_video_stream(stream, mime_type: str = "video/mp4", display_name: Optional[str] = None,
+                         cache: Optional[ResultCache] = None,
+                         registry: Optional[RemoteFileRegistry] = None,
+                         content_hash: Optional[str] = None,
+                         chunk_size: int = DEFAULT_CHUNK_SIZE) -> CreativeAnalysis:
+    """analyze a seekable binary stream without writing it to a local file.
+
+    The body is hashed first (or content_hash is taken as given), so a cache
+    hit makes no network calls and a live upload of the same bytes is reused;
+    otherwise the stream goes straight into the resumable upload in chunks.
+    """
+    with track_analysis():
+        if content_hash is None and (cache is not None or registry is not None):
+            content_hash = stream_sha256(stream, chunk_size)
+        key = analysis_cache_key(content_hash) if (cache is not None and content_hash) else None
+        if key is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                print(f"Cache hit: {display_name or content_hash}")
+                return cached
+
+        video_file, content_hash = _reuse_or_upload_stream(stream, mime_type, display_name, content_hash,
+                                                           registry, chunk_size)
+        video_file = wait_for_processing(video_file)
+        analysis_result = run_inference(video_file, analysis_record(content_hash, display_name))
+        if key is not None and analysis_result is not None:
+            cache.put(key, content_hash, MODEL_NAME, SCHEMA_VERSION, analysis_result)
+        return analysis_result
 
-def analyze_video(video_path: str) -> CreativeAnalysis:
+
+def upload_stream(stream, mime_type: str = "video/mp4", display_name: Optional[str] = None,
+                  chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """stage 1 for in-memory or spooled uploads, returns (file, sha256 of the bytes sent)."""
+    print(f"1. Streaming {display_name or 'upload'} to Google AI Studio...")
+    stream.seek(0)
+    reader = HashingReader(stream, chunk_size=chunk_size)
+    config = {"mime_type": mime_type}
+    if display_name:
+        config["display_name"] = display_name
+    # spooled request bodies are seekable, so the size is known before sending
+    size = stream.seek(0, os.SEEK_END)
+    stream.seek(0)
+    get_default_limiter().acquire_upload(size)
+    with stage_timer("upload"):
+        video_file = get_client().files.upload(file=reader, config=config)
+    UPLOAD_BYTES.observe(reader.bytes_hashed)
+    print(f"   Uploaded: {video_file.name} ({reader.bytes_hashed} bytes)")
+    return video_file, reader.content_hash
+
+
+def _reuse_or_upload_stream(stream, mime_type: str, display_name: Optional[str], content_hash: Optional[str],
+                            registry: Optional[RemoteFileRegistry], chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """the registry's live file for these bytes, or a fresh upload registered under them."""
+    if registry is not None and content_hash:
+        video_file = registry.lookup(content_hash)
+        if video_file is not None:
+            print(f"1. Reusing remote file {video_file.name} for {display_name or content_hash}")
+            return video_file, content_hash
+    video_file, streamed_hash = upload_stream(stream, mime_type, display_name, chunk_size)
+    content_hash = content_hash or streamed_hash
+    if registry is not None and content_hash:
+        registry.register(content_hash, video_file)
+    return video_file, content_hash
+
+
+def _analyze_uncached(video_path: str, content_hash: Optional[str] = None,
+                      registry: Optional[RemoteFileRegistry] = None,
+                      profile: str = "full") -> CreativeAnalysis:
     """analyze a video file using Gemini's native video understanding capabilities.
     """
+    video_file = upload_video(video_path, content_hash, registry, profile)
+    video_file = wait_for_processing(video_file)
+    return run_inference(video_file, analysis_record(content_hash, video_path, profile))
+
+
+def upload_video(video_path: str, content_hash: Optional[str] = None,
+                 registry: Optional[RemoteFileRegistry] = None, profile: str = "full",
+                 clip_seconds: Optional[float] = None):
+    """stage 1: push the local file to the Gemini Files API, or reuse a live upload of it.
+
+    clip_seconds uploads only the opening seconds, cut locally (hook mode).
+    """
+    registry_key = None
+    if registry is not None:
+        content_hash = content_hash or file_sha256(video_path)
+        registry_key = content_hash if profile == "full" else f"{content_hash}:{profile}"
+        if clip_seconds is not None:
+            registry_key = f"{content_hash}:hook={clip_seconds:g}"
+        video_file = registry.lookup(registry_key)
+        if video_file is not None:
+            print(f"1. Reusing remote file {video_file.name} for {video_path}")
+            return video_file
+
+    upload_path = video_path
+    transcoded = None
+    if clip_seconds is not None:
+        from services.preprocess import trim
+        with stage_timer("trim"):
+            transcoded = trim(video_path, clip_seconds)
+        upload_path = transcoded.path
+    elif profile != "full":
+        # OpenCV is only needed when a transcoding profile is in use
+        from services.preprocess import get_profile, transcode
+        with stage_timer("transcode"):
+            transcoded = transcode(video_path, get_profile(profile))
+        upload_path = transcoded.path
+
     print(f"1. Uploading {video_path} to Google AI Studio...")
-    
-    # upload via Native SDK is required for videos over 20mb
-    video_file = client.files.upload(file=video_path)
+    try:
+        # upload via Native SDK is required for videos over 20mb
+        size = os.path.getsize(upload_path)
+        get_default_limiter().acquire_upload(size)
+        with stage_timer("upload"):
+            video_file = get_client().files.upload(file=upload_path)
+        UPLOAD_BYTES.observe(size)
+    finally:
+        if transcoded is not None and transcoded.is_temporary:
+            os.remove(transcoded.path)
     print(f"   Uploaded: {video_file.name}")
+    if registry is not None:
+        registry.register(registry_key, video_file)
+    return video_file
+
 
+def wait_for_processing(video_file, timeout: Optional[float] = None):
+    """stage 2: block until the uploaded file leaves the PROCESSING state."""
     # videos require a processing phase before they can be analyzed
-    print("2. Waiting for video processing (this may take a moment)...")
-    while video_file.state.name == "PROCESSING":
-        print(".", end="", flush=True)
-        time.sleep(2)
-        video_file = client.files.get(name=video_file.name)
-
-    if video_file.state.name == "FAILED":
-        raise ValueError("Video processing failed on Google's side.")
-    
-    print("\n   Video is ready.")
-    
+    print(f"2. Waiting for video processing of {video_file.name} (this may take a moment)...")
+    # raises FileProcessingError (a ValueError) if processing FAILED
+    with stage_timer("processing_wait"):
+        video_file = get_file_tracker().track(video_file).result(timeout=timeout)
+    print(f"   Video is ready: {video_file.name}")
+    return video_file
+
+
+def run_inference(video_file, record: Optional[ResponseRecord] = None) -> CreativeAnalysis:
+    """stage 3: structured analysis of an ACTIVE file.
+
+    record names the video in the response store, where the raw JSON is kept.
+    """
+    if USE_CONTEXT_CACHE:
+        return run_inference_cached(video_file, record)
+
     # file_uri and mime_type are required for video media messages
-    message = HumanMessage(
-        content=[
-            {
-                "type": "text", 
-                "text": "Analyze this mobile game ad. Focus on the narrative flow, how the audio matches the visuals, and the 'hook' in the first 3 seconds."
-            },
-            {
-                "type": "media", 
-                "file_uri": video_file.uri,      
-                "mime_type": video_file.mime_type 
-            }
-        ]
-    )
-    # for structured output
-    structured_llm = llm.with_structured_output(CreativeAnalysis)
-    
-    print("Sending to Gemini 1.5 Pro...")
+    content = [
+        {"type": "text", "text": ANALYSIS_PROMPT},
+        {"type": "media", "file_uri": video_file.uri, "mime_type": video_file.mime_type},
+    ]
+    print(f"Sending {video_file.name} to {MODEL_NAME}...")
     try:
-        # Gemini takes a moment to "process" the video tokens
-        analysis_result = structured_llm.invoke([message])
-        return analysis_result
+        return generate_structured(content, CreativeAnalysis, video_file.name,
+                                   estimate_request_tokens([video_file]), keep_response(record))
     except Exception as e:
         print(f"Error: {e}")
         raise e
+
+
+def generate_structured(content: List[dict], model: Type[BaseModel], label: str, tokens: int = 0,
+                        on_raw: Optional[Callable] = None):
+    """one structured request through ANALYZER_ENGINE, validated into model.
+
+    content uses LangChain's message blocks ({"type": "text"} / {"type": "media"}),
+    which the native engine converts to SDK parts. on_raw(raw, error) sees the
+    response text before validation, see keep_response.
+    """
+    if ANALYZER_ENGINE not in ANALYZER_ENGINES:
+        raise ValueError(f"Unknown ANALYZER_ENGINE '{ANALYZER_ENGINE}', choose from {', '.join(ANALYZER_ENGINES)}")
+    if ANALYZER_ENGINE == "langchain":
+        return _generate_langchain(content, model, label, tokens, on_raw)
+
+    contents = _native_parts(content)
+    config = _native_config(model)
+    client = get_client()
+
+    def generate():
+        # Gemini takes a moment to "process" the video tokens
+        with stage_timer("inference"):
+            return client.models.generate_content(model=MODEL_NAME, contents=contents, config=config)
+
+    response = get_default_limiter().call(generate, tokens, _response_prompt_tokens, label)
+    _record_response_usage(response)
+    return _parse(model.model_validate_json, response.text or "", on_raw)
+
+
+def _parse(parse, raw: str, on_raw: Optional[Callable]):
+    with stage_timer("parse"):
+        try:
+            result = parse(raw)
+        except ValueError as e:
+            # invalid output is kept too, a later schema change may accept it
+            if on_raw is not None:
+                on_raw(raw, e)
+            raise
+    if on_raw is not None:
+        on_raw(raw, None)
+    return result
+
+
+def _engine_name() -> str:
+    return "native+context_cache" if USE_CONTEXT_CACHE else ANALYZER_ENGINE
+
+
+def _kind_prompt_and_schema(kind: str) -> Tuple[str, str]:
+    # the same prompt and schema version the result cache keys use
+    if kind == "hook":
+        return HOOK_PROMPT, HOOK_SCHEMA_VERSION
+    return ANALYSIS_PROMPT, SCHEMA_VERSION
+
+
+def keep_response(record: Optional[ResponseRecord]) -> Optional[Callable]:
+    """an on_raw callback writing to the response store, None when there is nothing to keep."""
+    store = get_default_response_store()
+    if store is None or record is None:
+        return None
+    prompt, schema_version = _kind_prompt_and_schema(record.kind)
+    engine = _engine_name()
+
+    def on_raw(raw: str, error: Optional[Exception]) -> None:
+        try:
+            store.record(record, raw, MODEL_NAME, prompt, schema_version, engine, error)
+        except Exception as e:
+            # losing the raw copy must never fail the analysis itself
+            print(f"   Warning: could not store the raw response: {e}")
+    return on_raw
+
+
+def _keep_batch_responses(records: Optional[Dict[str, ResponseRecord]]) -> Optional[Callable]:
+    """split a BatchAnalysis response into one stored response per video."""
+    if not records or get_default_response_store() is None:
+        return None
+
+    def on_raw(raw: str, error: Optional[Exception]) -> None:
+        try:
+            entries = json.loads(raw).get("results") or []
+        except (ValueError, AttributeError):
+            # not even JSON, nothing a migration could recover
+            return
+        seen = set()
+        for entry in entries:
+            if not isinstance(entry, dict):
+                continue
+            label = entry.get("filename")
+            if label not in records or label in seen or not isinstance(entry.get("analysis"), dict):
+                continue
+            seen.add(label)
+            try:
+                CreativeAnalysis.model_validate(entry["analysis"])
+                entry_error = None
+            except ValueError as e:
+                entry_error = e
+            keep_response(records[label])(json.dumps(entry["analysis"]), entry_error)
+    return on_raw
+
+
+def _native_config(model: Type[BaseModel]):
+    # the schema is generated and wrapped once per result model, not per call
+    with _backend_lock:
+        if model not in _native_configs:
+            from google.genai import types
+            _native_configs[model] = types.GenerateContentConfig(
+                temperature=0,
+                response_mime_type="application/json",
+                response_json_schema=model.model_json_schema(),
+            )
+        return _native_configs[model]
+
+
+def _native_parts(content: List[dict]) -> list:
+    from google.genai import types
+    parts = []
+    for block in content:
+        if block["type"] == "text":
+            parts.append(types.Part.from_text(text=block["text"]))
+            continue
+        part = types.Part.from_uri(file_uri=block["file_uri"], mime_type=block["mime_type"])
+        if block.get("video_metadata"):
+            part.video_metadata = types.VideoMetadata(**block["video_metadata"])
+        parts.append(part)
+    return parts
+
+
+def _generate_langchain(content: List[dict], model: Type[BaseModel], label: str, tokens: int,
+                        on_raw: Optional[Callable] = None):
+    from langchain_core.messages import HumanMessage
+    from langchain_core.output_parsers import PydanticOutputParser
+    with _backend_lock:
+        if model not in _bound_llms:
+            # the same JSON-schema binding with_structured_output uses,
+            # parsed separately so usage metadata and parse time are visible
+            _bound_llms[model] = get_llm().bind(response_mime_type="application/json",
+                                                response_json_schema=model.model_json_schema())
+        structured_llm = _bound_llms[model]
+
+    def invoke():
+        with stage_timer("inference"):
+            return structured_llm.invoke([HumanMessage(content=content)])
+
+    response = get_default_limiter().call(invoke, tokens, _message_prompt_tokens, label)
+    _record_message_usage(response)
+    return _parse(PydanticOutputParser(pydantic_object=model).parse, response.text, on_raw)
+
+
+def _message_prompt_tokens(message) -> Optional[int]:
+    usage = getattr(message, "usage_metadata", None)
+    return usage.get("input_tokens") if usage else None
+
+
+def _record_message_usage(message) -> None:
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        cached = (usage.get("input_token_details") or {}).get("cache_read")
+        record_usage(usage.get("input_tokens"), usage.get("output_tokens"), cached)
+
+
+def _record_response_usage(response) -> None:
+    usage = response.usage_metadata
+    if usage is not None:
+        record_usage(usage.prompt_token_count, usage.candidates_token_count, usage.cached_content_token_count)
+
+
+def run_inference_cached(video_file, record: Optional[ResponseRecord] = None) -> CreativeAnalysis:
+    """stage 3 against the cached prefix: only the video and the cache name are sent."""
+    from google.genai import types
+    contents = [types.Part.from_uri(file_uri=video_file.uri, mime_type=video_file.mime_type)]
+    print(f"Sending {video_file.name} to {MODEL_NAME} (context cache)...")
+    response = _generate_with_prefix(contents, RESPONSE_SCHEMA, video_file.name,
+                                     estimate_request_tokens([video_file]))
+    return _parse(CreativeAnalysis.model_validate_json, response.text or "", keep_response(record))
+
+
+def _generate_with_prefix(contents, response_schema: dict, label: str, tokens: int = 0):
+    from google.genai import types
+    prefix = get_prefix_cache()
+    client = get_client()
+    for attempt in range(2):
+        cache_name = prefix.name()
+        config = types.GenerateContentConfig(
+            cached_content=cache_name,
+            temperature=0,
+            response_mime_type="application/json",
+            response_json_schema=response_schema,
+        )
+
+        def generate():
+            with stage_timer("inference"):
+                return client.models.generate_content(model=MODEL_NAME, contents=contents, config=config)
+
+        try:
+            response = get_default_limiter().call(generate, tokens, _response_prompt_tokens, label)
+            break
+        except Exception as e:
+            # the cache expired or was deleted behind our back: recreate it once
+            if attempt == 0 and getattr(e, "code", None) in (403, 404):
+                prefix.invalidate(cache_name)
+                RETRIES.inc(reason="context_cache_missing")
+                continue
+            print(f"Error: {e}")
+            raise e
+
+    prefix.record_usage(response.usage_metadata)
+    _record_response_usage(response)
+    usage = response.usage_metadata
+    if usage is not None:
+        print(f"   {label}: {usage.prompt_token_count} prompt tokens, "
+              f"{usage.cached_content_token_count or 0} from context cache")
+    return response
+
+
+def _response_prompt_tokens(response) -> Optional[int]:
+    usage = response.usage_metadata
+    return usage.prompt_token_count if usage is not None else None
+
+
+# ---- multi-video requests ----
+
+BATCH_PROMPT = (
+    "Several mobile game ads follow, each preceded by its filename. Analyze every video on its own, "
+    "as if it were the only one. Return exactly one entry per video in `results`, with `filename` copied "
+    "exactly from the line before that video."
+)
+# video plus audio tokens per second at default media resolution
+VIDEO_TOKENS_PER_SECOND = 300
+# assumed length when the duration cannot be read locally
+DEFAULT_VIDEO_SECONDS = 30.0
+# per-request budget: total estimated video tokens and number of videos (each answer costs output tokens)
+BATCH_MAX_TOKENS = int(os.getenv("BATCH_MAX_TOKENS", "120000"))
+BATCH_MAX_VIDEOS = int(os.getenv("BATCH_MAX_VIDEOS", "8"))
+BATCH_RESPONSE_SCHEMA = slim_schema(BatchAnalysis)
+# prompt plus schema, roughly 4 characters per token
+PROMPT_TOKENS_ESTIMATE = len(schema_instruction(ANALYSIS_PROMPT, CreativeAnalysis)) // 4
+
+
+class BatchOutcome(NamedTuple):
+    analyses: Dict[str, CreativeAnalysis]
+    errors: Dict[str, Exception]
+
+
+def estimate_video_tokens(video_path: str) -> int:
+    """input tokens a video will cost, from its local duration."""
+    from services.preprocess import video_duration_seconds
+    duration = video_duration_seconds(video_path) or DEFAULT_VIDEO_SECONDS
+    return int(duration * VIDEO_TOKENS_PER_SECOND)
+
+
+def _remote_duration_seconds(video_file) -> Optional[float]:
+    # ACTIVE files carry videoMetadata.videoDuration, e.g. "31.5s"
+    metadata = getattr(video_file, "video_metadata", None) or {}
+    duration = metadata.get("videoDuration") or metadata.get("video_duration")
+    try:
+        return float(str(duration).rstrip("s")) if duration else None
+    except ValueError:
+        return None
+
+
+def estimate_request_tokens(video_files) -> int:
+    """prompt tokens to reserve against the tokens/min budget, corrected from usage afterwards."""
+    seconds = sum(_remote_duration_seconds(f) or DEFAULT_VIDEO_SECONDS for f in video_files)
+    return int(seconds * VIDEO_TOKENS_PER_SECOND) + PROMPT_TOKENS_ESTIMATE
+
+
+def plan_batches(video_paths: List[str], max_tokens: int = BATCH_MAX_TOKENS,
+                 max_videos: int = BATCH_MAX_VIDEOS) -> List[List[str]]:
+    """greedy packing of videos, in order, into requests that stay within the budget."""
+    batches, current, used = [], [], 0
+    for path in video_paths:
+        tokens = estimate_video_tokens(path)
+        if current and (used + tokens > max_tokens or len(current) >= max_videos):
+            batches.append(current)
+            current, used = [], 0
+        current.append(path)
+        used += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def run_batch_inference(items: List[Tuple[str, object]],
+                        records: Optional[Dict[str, ResponseRecord]] = None) -> BatchOutcome:
+    """stage 3 for several ACTIVE files in one request, items are (filename label, file).
+
+    Entries that come back valid are kept. When the response fails validation,
+    or leaves videos out, the missing videos are retried, split in half when
+    nothing usable came back, down to ordinary single-video requests.
+    records (label -> ResponseRecord) stores each video's part of the raw response.
+    """
+    records = records or {}
+    if len(items) == 1:
+        label, video_file = items[0]
+        try:
+            return BatchOutcome({label: run_inference(video_file, records.get(label))}, {})
+        except Exception as e:
+            return BatchOutcome({}, {label: e})
+
+    try:
+        analyses = _infer_batch(items, records)
+    except ValueError as e:
+        # covers pydantic ValidationError, JSON decode errors and LangChain OutputParserException
+        print(f"Batch of {len(items)} failed validation, splitting: {e}")
+        RETRIES.inc(reason="batch_invalid")
+        analyses = {}
+
+    missing = [item for item in items if item[0] not in analyses]
+    if not missing:
+        return BatchOutcome(analyses, {})
+    outcome = BatchOutcome(analyses, {})
+    if len(missing) < len(items):
+        print(f"   {len(missing)} of {len(items)} videos missing from the batch response, retrying them")
+        RETRIES.inc(reason="batch_missing")
+        halves = [missing]
+    else:
+        middle = len(missing) // 2
+        halves = [missing[:middle], missing[middle:]]
+    for half in halves:
+        partial = run_batch_inference(half, records)
+        outcome.analyses.update(partial.analyses)
+        outcome.errors.update(partial.errors)
+    return outcome
+
+
+def _infer_batch(items: List[Tuple[str, object]],
+                 records: Optional[Dict[str, ResponseRecord]] = None) -> Dict[str, CreativeAnalysis]:
+    labels = [label for label, _ in items]
+    if len(set(labels)) != len(labels):
+        raise ValueError("batch labels must be unique")
+    print(f"Sending {len(items)} videos to {MODEL_NAME} in one request...")
+
+    if USE_CONTEXT_CACHE:
+        from google.genai import types
+        contents = [types.Part.from_text(text=BATCH_PROMPT)]
+        for label, video_file in items:
+            contents.append(types.Part.from_text(text=f"filename: {label}"))
+            contents.append(types.Part.from_uri(file_uri=video_file.uri, mime_type=video_file.mime_type))
+        response = _generate_with_prefix(contents, BATCH_RESPONSE_SCHEMA, f"batch of {len(items)}",
+                                         estimate_request_tokens([f for _, f in items]))
+        batch = _parse(BatchAnalysis.model_validate_json, response.text or "", _keep_batch_responses(records))
+    else:
+        content = [{"type": "text", "text": f"{ANALYSIS_PROMPT}\n\n{BATCH_PROMPT}"}]
+        for label, video_file in items:
+            content.append({"type": "text", "text": f"filename: {label}"})
+            content.append({"type": "media", "file_uri": video_file.uri, "mime_type": video_file.mime_type})
+        batch = generate_structured(content, BatchAnalysis, f"batch of {len(items)}",
+                                    estimate_request_tokens([f for _, f in items]), _keep_batch_responses(records))
+
+    # unknown filenames are ignored and a repeated one keeps its first entry
+    analyses: Dict[str, CreativeAnalysis] = {}
+    for entry in batch.results:
+        if entry.filename in labels and entry.filename not in analyses:
+            analyses[entry.filename] = entry.analysis
+    return analyses
+
+
+# ---- hook triage ----
+
+HOOK_PROMPT = (
+    "Analyze only the opening hook of this mobile game ad, the first {seconds:g} seconds: what grabs attention, "
+    "the on-screen text, the emotion it triggers and the look. Ignore anything after that."
+)
+# length of the opening that is sent, override per call
+HOOK_SECONDS = float(os.getenv("HOOK_SECONDS", "3"))
+# "local" uploads a clip cut before upload; "server" uploads the whole video (reusable
+# for a later full analysis) and sends clip offsets, so only the clip is tokenised
+HOOK_CLIP_MODES = ("local", "server")
+HOOK_CLIP_MODE = os.getenv("HOOK_CLIP_MODE", "local")
+HOOK_SCHEMA_VERSION = hashlib.sha256(
+    json.dumps(HookAnalysis.model_json_schema(), sort_keys=True).encode("utf-8")
+).hexdigest()[:16]
+HOOK_PROMPT_TOKENS_ESTIMATE = len(schema_instruction(HOOK_PROMPT, HookAnalysis)) // 4
+
+
+def hook_cache_key(content_hash: str, seconds: float = HOOK_SECONDS) -> str:
+    # the clip mode does not change what the model sees, so both share results
+    return make_cache_key(content_hash, MODEL_NAME, HOOK_PROMPT, HOOK_SCHEMA_VERSION, f"hook={seconds:g}")
+
+
+def hook_record(content_hash: Optional[str], source: Optional[str] = None,
+                seconds: float = HOOK_SECONDS) -> ResponseRecord:
+    return ResponseRecord("hook", content_hash, source, f"hook={seconds:g}")
+
+
+def _check_clip_mode(clip_mode: str) -> None:
+    if clip_mode not in HOOK_CLIP_MODES:
+        raise ValueError(f"Unknown hook clip mode '{clip_mode}', choose from {', '.join(HOOK_CLIP_MODES)}")
+
+
+def analyze_hook(video_path: str, cache: Optional[ResultCache] = None,
+                 registry: Optional[RemoteFileRegistry] = None, seconds: float = HOOK_SECONDS,
+                 clip_mode: str = HOOK_CLIP_MODE, source: Optional[str] = None) -> HookAnalysis:
+    """fast triage of the first seconds of a video with the compact HookAnalysis schema.
+
+    source names the video in the response store, the path by default.
+    """
+    _check_clip_mode(clip_mode)
+    with track_analysis("hook_total"):
+        content_hash = file_sha256(video_path) if (cache is not None or registry is not None) else None
+        key = hook_cache_key(content_hash, seconds) if cache is not None else None
+        if key is not None:
+            cached = cache.get(key, HookAnalysis)
+            if cached is not None:
+                print(f"Cache hit (hook): {video_path}")
+                return cached
+
+        if clip_mode == "local":
+            video_file = upload_video(video_path, content_hash, registry, clip_seconds=seconds)
+        else:
+            video_file = upload_video(video_path, content_hash, registry)
+        video_file = wait_for_processing(video_file)
+        result = run_hook_inference(video_file, seconds, server_clip=clip_mode == "server",
+                                    record=hook_record(content_hash, source or video_path, seconds))
+        if key is not None and result is not None:
+            cache.put(key, content_hash, MODEL_NAME, HOOK_SCHEMA_VERSION, result)
+        return result
+
+
+def analyze_hook_stream(stream, mime_type: str = "video/mp4", display_name: Optional[str] = None,
+                        cache: Optional[ResultCache] = None, registry: Optional[RemoteFileRegistry] = None,
+                        seconds: float = HOOK_SECONDS, clip_mode: str = HOOK_CLIP_MODE,
+                        content_hash: Optional[str] = None) -> HookAnalysis:
+    """hook triage of an uploaded stream.
+
+    Local clipping needs a file to cut, so the stream is copied to a temporary
+    one first; server clipping streams the whole body like analyze_video_stream,
+    after the same cache check and registry lookup.
+    """
+    _check_clip_mode(clip_mode)
+    if clip_mode == "local":
+        suffix = os.path.splitext(display_name or "")[1] or mimetypes.guess_extension(mime_type) or ".mp4"
+        fd, path = tempfile.mkstemp(prefix="hook_upload_", suffix=suffix)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                stream.seek(0)
+                shutil.copyfileobj(stream, f, DEFAULT_CHUNK_SIZE)
+            return analyze_hook(path, cache, registry, seconds, clip_mode, source=display_name)
+        finally:
+            os.remove(path)
+
+    with track_analysis("hook_total"):
+        if content_hash is None and (cache is not None or registry is not None):
+            content_hash = stream_sha256(stream)
+        key = hook_cache_key(content_hash, seconds) if (cache is not None and content_hash) else None
+        if key is not None:
+            cached = cache.get(key, HookAnalysis)
+            if cached is not None:
+                print(f"Cache hit (hook): {display_name or content_hash}")
+                return cached
+        # server clips send offsets, so the whole video is what gets uploaded and reused
+        video_file, content_hash = _reuse_or_upload_stream(stream, mime_type, display_name, content_hash, registry)
+        video_file = wait_for_processing(video_file)
+        result = run_hook_inference(video_file, seconds, server_clip=True,
+                                    record=hook_record(content_hash, display_name, seconds))
+        if key is not None and result is not None:
+            cache.put(key, content_hash, MODEL_NAME, HOOK_SCHEMA_VERSION, result)
+        return result
+
+
+def run_hook_inference(video_file, seconds: float = HOOK_SECONDS, server_clip: bool = False,
+                       record: Optional[ResponseRecord] = None) -> HookAnalysis:
+    """stage 3 for hook mode: the short prompt and the HookAnalysis schema, optionally with clip offsets."""
+    media = {"type": "media", "file_uri": video_file.uri, "mime_type": video_file.mime_type}
+    if server_clip:
+        # only the clipped range is tokenised, the upload and processing still cover the whole video
+        media["video_metadata"] = {"start_offset": "0s", "end_offset": f"{seconds:g}s"}
+    content = [{"type": "text", "text": HOOK_PROMPT.format(seconds=seconds)}, media]
+    print(f"Sending the first {seconds:g}s of {video_file.name} to {MODEL_NAME} (hook)...")
+    # the clip costs ~300 tokens per second plus the compact schema
+    tokens = int(seconds * VIDEO_TOKENS_PER_SECOND) + HOOK_PROMPT_TOKENS_ESTIMATE
+    return generate_structured(content, HookAnalysis, f"{video_file.name} (hook)", tokens, keep_response(record))
@@ -0,0 +1,184 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Optional, Type
+from pydantic import BaseModel
+from data_models.CreativeAdsAnalysis import CreativeAnalysis
+from services.metrics import CACHE_LOOKUPS, stage_timer
+
+# default location of the on-disk result store, override with ANALYSIS_CACHE_PATH
+DEFAULT_CACHE_PATH = os.getenv("ANALYSIS_CACHE_PATH", os.path.join(".cache", "analysis_cache.sqlite"))
+# eviction limits, 0 disables the limit
+DEFAULT_MAX_BYTES = int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+DEFAULT_MAX_AGE_SECONDS = int(os.getenv("ANALYSIS_CACHE_MAX_AGE_SECONDS", str(30 * 24 * 3600)))
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# (path, size, mtime) -> sha256, avoids re-reading a file hashed earlier in the run
+_hash_memo: dict = {}
+_hash_memo_lock = threading.Lock()
+
+
+def file_sha256(path: str) -> str:
+    """hash the video bytes so renamed or copied files still hit the cache."""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _hash_memo_lock:
+        if memo_key in _hash_memo:
+            return _hash_memo[memo_key]
+
+    digest = hashlib.sha256()
+    with stage_timer("hash"), open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+
+    with _hash_memo_lock:
+        if len(_hash_memo) > 10000:
+            _hash_memo.clear()
+        _hash_memo[memo_key] = digest.hexdigest()
+    return digest.hexdigest()
+
+
+def cache_enabled() -> bool:
+    return os.getenv("ANALYSIS_CACHE", "on").lower() not in ("0", "off", "false", "no")
+
+
+def make_cache_key(content_hash: str, model: str, prompt: str, schema_version: str, variant: str = "") -> str:
+    """a result is only reusable for the same video, model, prompt and schema.
+
+    variant separates results derived from a modified input, e.g. a transcoded upload.
+    """
+    parts = [content_hash, model, hashlib.sha256(prompt.encode("utf-8")).hexdigest(), schema_version]
+    if variant:
+        parts.append(variant)
+    raw = "\x1f".join(parts)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """SQLite backed store of validated CreativeAnalysis JSON, keyed by make_cache_key.
+
+    Other result models (e.g. HookAnalysis) share the table under their own keys.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_age_seconds: int = DEFAULT_MAX_AGE_SECONDS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # one connection shared by the API worker threads, guarded by the lock
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                schema_version TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_last_access ON results(last_access)")
+        self._conn.commit()
+
+    def get(self, key: str, model: Type[BaseModel] = CreativeAnalysis) -> Optional[BaseModel]:
+        analysis = self._lookup(key, model)
+        CACHE_LOOKUPS.inc(cache="result", result="miss" if analysis is None else "hit")
+        return analysis
+
+    def _lookup(self, key: str, model: Type[BaseModel]) -> Optional[BaseModel]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, created_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            payload, created_at = row
+            now = time.time()
+            if self.max_age_seconds and now - created_at > self.max_age_seconds:
+                self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE results SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+
+        try:
+            return model.model_validate_json(payload)
+        except ValueError:
+            # stored payload no longer matches the schema, treat as a miss
+            self.delete(key)
+            return None
+
+    def put(self, key: str, content_hash: str, model: str, schema_version: str,
+            analysis: BaseModel) -> None:
+        payload = analysis.model_dump_json()
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, content_hash, model, schema_version, payload, len(payload), now, now),
+            )
+            self._conn.commit()
+        self.evict()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def evict(self) -> int:
+        """drop expired entries, then least recently used ones until under max_bytes."""
+        removed = 0
+        with self._lock:
+            if self.max_age_seconds:
+                cursor = self._conn.execute(
+                    "DELETE FROM results WHERE created_at < ?", (time.time() - self.max_age_seconds,)
+                )
+                removed += cursor.rowcount
+
+            if self.max_bytes:
+                total = self._conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM results").fetchone()[0]
+                if total > self.max_bytes:
+                    rows = self._conn.execute(
+                        "SELECT key, size_bytes FROM results ORDER BY last_access ASC"
+                    ).fetchall()
+                    doomed = []
+                    for key, size in rows:
+                        if total <= self.max_bytes:
+                            break
+                        doomed.append((key,))
+                        total -= size
+                    self._conn.executemany("DELETE FROM results WHERE key = ?", doomed)
+                    removed += len(doomed)
+            self._conn.commit()
+        return removed
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache: Optional[ResultCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> Optional[ResultCache]:
+    """shared cache for main.py and batch_runner.py, disabled with ANALYSIS_CACHE=off."""
+    global _default_cache
+    if not cache_enabled():
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResultCache()
+        return _default_cache
@@ -0,0 +1,301 @@
+import os
+import re
+import json
+import glob
+import time
+import shutil
+import itertools
+from typing import Callable, Dict, List, Optional, Type
+import numpy as np
+from pydantic import BaseModel
+from data_models.CreativeAdsAnalysis import CreativeAnalysis
+from services.schema_fields import enum_values, multi_enum_fields, single_enum_fields
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional, only needed for --format parquet
+    pa = None
+    pq = None
+
+# rows buffered per part file (one row group each)
+DEFAULT_ROW_GROUP_SIZE = 10000
+# schema metadata key holding the enum domains / bit layouts
+ENUM_METADATA_KEY = b"creative_analysis.enums"
+# small parts a run may pile up (watch/queue mode flushes when idle) before they are merged into one
+COMPACT_AFTER_PARTS = 32
+# numbers writers opened by one process within the same second
+_writer_ids = itertools.count()
+# part-<run>-<n>.parquet, or part-<run>-<first>-to-<last>.parquet once merged
+_PART_NAME = re.compile(r"^part-(?P<run>.+?)-(?P<first>\d{5})(?:-to-(?P<last>\d{5}))?\.parquet$")
+
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise ImportError("pyarrow is required for Parquet output: pip install pyarrow")
+
+
+def _mask_type(n_values: int):
+    if n_values <= 8:
+        return pa.uint8()
+    if n_values <= 16:
+        return pa.uint16()
+    if n_values <= 32:
+        return pa.uint32()
+    return pa.uint64()
+
+
+def encode_multi_hot(values: List[str], domain: List[str]) -> int:
+    """bit i is set when domain[i] is present."""
+    positions = {value: bit for bit, value in enumerate(domain)}
+    mask = 0
+    for value in values:
+        mask |= 1 << positions[value]
+    return mask
+
+
+def decode_multi_hot(mask: Optional[int], domain: List[str]) -> List[str]:
+    if not mask:
+        return []
+    return [value for bit, value in enumerate(domain) if mask >> bit & 1]
+
+
+class ParquetResultWriter:
+    """writes CreativeAnalysis rows into a Parquet dataset directory in row-group batches.
+
+    Single-valued enums become dictionary columns over the full enum domain,
+    list-of-enum fields become one unsigned bitmask column each (bit order =
+    enum declaration order, recorded in the file metadata). Every batch is
+    written as its own complete part file, so a crash never leaves a file
+    without a footer and --resume simply adds parts. Small parts from idle
+    flushes are merged every COMPACT_AFTER_PARTS parts and on close.
+    on_flushed receives the source paths of rows once they are on disk.
+    """
+
+    def __init__(self, path: str, extra_columns: Optional[List[str]] = None, append: bool = False,
+                 row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+                 on_flushed: Optional[Callable[[List[str]], None]] = None,
+                 model: Type[BaseModel] = CreativeAnalysis, extra_types: Optional[Dict[str, str]] = None):
+        _require_pyarrow()
+        self.path = path
+        # columns follow this model, e.g. HookAnalysis for hook mode
+        self.model = model
+        self.extra_columns = extra_columns or []
+        # arrow type aliases ("double", "int32", "bool") for extra columns, the rest are strings
+        self.extra_types = {name: pa.type_for_alias(alias) for name, alias in (extra_types or {}).items()}
+        self.row_group_size = row_group_size
+        self.on_flushed = on_flushed
+        self.rows_written = 0
+        self._single = {name: enum_values(cls) for name, cls in single_enum_fields(model).items()}
+        self._multi = {name: enum_values(cls) for name, cls in multi_enum_fields(model).items()}
+        self._index = {name: {v: i for i, v in enumerate(domain)} for name, domain in self._single.items()}
+        self._buffer: List[tuple] = []
+
+        if not append and os.path.isdir(path):
+            shutil.rmtree(path)
+        os.makedirs(path, exist_ok=True)
+        self._run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(_writer_ids)}"
+        self._parts = 0
+        # parts since the last full-size one, merged into one file by _compact()
+        self._window: List[str] = []
+        self._window_rows = 0
+        self.schema = self._build_schema()
+
+    def _build_schema(self):
+        fields = [pa.field("filename", pa.string())]
+        for name, info in self.model.model_fields.items():
+            if name in self._single:
+                fields.append(pa.field(name, pa.dictionary(pa.int8(), pa.string())))
+            elif name in self._multi:
+                fields.append(pa.field(name, _mask_type(len(self._multi[name]))))
+            elif info.annotation is bool:
+                fields.append(pa.field(name, pa.bool_()))
+            elif info.annotation is str:
+                fields.append(pa.field(name, pa.string()))
+            else:
+                fields.append(pa.field(name, pa.list_(pa.string())))
+        for name in self.extra_columns:
+            fields.append(pa.field(name, self.extra_types.get(name, pa.string())))
+        layout = {"single": self._single, "multi_hot": self._multi}
+        return pa.schema(fields, metadata={ENUM_METADATA_KEY: json.dumps(layout).encode("utf-8")})
+
+    def write_result(self, analysis: BaseModel, filename: str,
+                     extra: Optional[Dict[str, object]] = None, source_path: Optional[str] = None) -> None:
+        self._buffer.append((filename, analysis.model_dump(mode="json"), extra or {}, source_path))
+        self.rows_written += 1
+        if len(self._buffer) >= self.row_group_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._buffer:
+            return
+        columns = {"filename": [entry[0] for entry in self._buffer]}
+        for name in self.model.model_fields:
+            values = [entry[1][name] for entry in self._buffer]
+            if name in self._single:
+                index = self._index[name]
+                indices = pa.array([None if v is None else index[v] for v in values], type=pa.int8())
+                columns[name] = pa.DictionaryArray.from_arrays(indices, pa.array(self._single[name]))
+            elif name in self._multi:
+                domain = self._multi[name]
+                columns[name] = pa.array([encode_multi_hot(v, domain) for v in values],
+                                         type=self.schema.field(name).type)
+            else:
+                columns[name] = pa.array(values, type=self.schema.field(name).type)
+        for name in self.extra_columns:
+            if name in self.extra_types:
+                columns[name] = pa.array([entry[2].get(name) for entry in self._buffer], type=self.extra_types[name])
+            else:
+                columns[name] = pa.array([None if entry[2].get(name) is None else str(entry[2][name])
+                                          for entry in self._buffer], type=pa.string())
+
+        part = os.path.join(self.path, f"part-{self._run_id}-{self._parts:05d}.parquet")
+        # write under a temp name and rename, readers never see a half-written part
+        pq.write_table(pa.table(columns, schema=self.schema), part + ".tmp", compression="zstd")
+        os.replace(part + ".tmp", part)
+        self._parts += 1
+        self._window.append(part)
+        self._window_rows += len(self._buffer)
+        if len(self._window) == 1 and self._window_rows >= self.row_group_size:
+            # a full row group on its own, nothing to merge
+            self._seal()
+        elif len(self._window) > COMPACT_AFTER_PARTS:
+            self._compact()
+
+        flushed = [entry[3] for entry in self._buffer if entry[3] is not None]
+        self._buffer.clear()
+        if self.on_flushed is not None and flushed:
+            self.on_flushed(flushed)
+
+    def _seal(self) -> None:
+        self._window = []
+        self._window_rows = 0
+
+    def _compact(self) -> None:
+        """rewrite the parts in the window as one file, row groups of row_group_size."""
+        if len(self._window) < 2:
+            return
+        first = _PART_NAME.match(os.path.basename(self._window[0])).group("first")
+        merged = os.path.join(self.path, f"part-{self._run_id}-{first}-to-{self._parts - 1:05d}.parquet")
+        table = pa.concat_tables([pq.read_table(part) for part in self._window])
+        pq.write_table(table, merged + ".tmp", compression="zstd", row_group_size=self.row_group_size)
+        os.replace(merged + ".tmp", merged)
+        # readers skip parts inside a merged range, a crash before this cleanup loses nothing
+        for part in self._window:
+            os.remove(part)
+        if table.num_rows >= self.row_group_size:
+            self._seal()
+        else:
+            # still small, the next compaction grows it
+            self._window = [merged]
+
+    def close(self) -> None:
+        self.flush()
+        self._compact()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def dataset_parts(path: str) -> List[str]:
+    """part files of a dataset, without small parts already merged into a bigger one."""
+    if not os.path.isdir(path):
+        return [path]
+    parts = sorted(glob.glob(os.path.join(path, "*.parquet")))
+    ranges = {}
+    for part in parts:
+        match = _PART_NAME.match(os.path.basename(part))
+        if match:
+            first = int(match.group("first"))
+            ranges[part] = (match.group("run"), first, int(match.group("last") or first))
+
+    def covered(part: str) -> bool:
+        if part not in ranges:
+            return False
+        run, first, last = ranges[part]
+        return any(other != part and r == run and lo <= first and last <= hi and (lo, hi) != (first, last)
+                   for other, (r, lo, hi) in ranges.items())
+
+    return [part for part in parts if not covered(part)]
+
+
+def model_layout(model: Type[BaseModel] = CreativeAnalysis) -> dict:
+    """the {"single": ..., "multi_hot": ...} domains a writer for model records today."""
+    return {
+        "single": {name: enum_values(cls) for name, cls in single_enum_fields(model).items()},
+        "multi_hot": {name: enum_values(cls) for name, cls in multi_enum_fields(model).items()},
+    }
+
+
+def remap_multi_hot(table, layout: dict):
+    """re-encode a part's bitmask columns from its stored bit order into layout's.
+
+    Values no longer in the domain are dropped, masks get the width the
+    current domain needs, and the table carries layout as its metadata.
+    """
+    metadata = table.schema.metadata or {}
+    stored = enum_layout(table)["multi_hot"] if ENUM_METADATA_KEY in metadata else layout["multi_hot"]
+    for field, domain in layout["multi_hot"].items():
+        if field not in table.column_names:
+            continue
+        bit_of = {value: bit for bit, value in enumerate(domain)}
+        masks = table[field].fill_null(0).to_numpy().astype(np.uint64)
+        remapped = np.zeros_like(masks)
+        for bit, value in enumerate(stored.get(field, domain)):
+            if value in bit_of:
+                remapped |= ((masks >> np.uint64(bit)) & np.uint64(1)) << np.uint64(bit_of[value])
+        column = pa.array(remapped, type=pa.uint64()).cast(_mask_type(len(domain)))
+        table = table.set_column(table.column_names.index(field), field, column)
+    return table.replace_schema_metadata({ENUM_METADATA_KEY: json.dumps(layout).encode("utf-8")})
+
+
+def read_results(path: str, model: Type[BaseModel] = CreativeAnalysis):
+    """load a dataset written by ParquetResultWriter as one pyarrow Table.
+
+    Each part is decoded with the enum layout it was written with and
+    re-encoded against model's current one, so a dataset spanning a schema
+    change reads back consistently. None for a dataset without parts.
+    """
+    _require_pyarrow()
+    layout = model_layout(model)
+    tables = [remap_multi_hot(pq.read_table(part), layout) for part in dataset_parts(path)]
+    # parts from older runs may lack later extra columns, those come back as nulls
+    return pa.concat_tables(tables, promote_options="default") if tables else None
+
+
+def merge_parquet_shards(shards: Dict[str, str], path: str, keep: Callable[[str, str], bool],
+                         row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+                         model: Type[BaseModel] = CreativeAnalysis) -> int:
+    """combine per-worker datasets (worker -> dataset dir) into a fresh one sorted by filename.
+
+    Same rules as results_writer.merge_csv_shards: keep(worker, filename)
+    picks the worker whose row counts, within a shard the newest part wins.
+    """
+    _require_pyarrow()
+    tables = []
+    for worker, shard in sorted(shards.items()):
+        table = read_results(shard, model)
+        if table is None:
+            continue
+        filenames = table.column("filename").to_pylist()
+        last = {name: i for i, name in enumerate(filenames) if keep(worker, name)}
+        tables.append(table.take(sorted(last.values())))
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+    if not tables:
+        return 0
+    merged = pa.concat_tables(tables, promote_options="default").sort_by("filename")
+    for start in range(0, merged.num_rows, row_group_size):
+        part = os.path.join(path, f"part-merged-{start // row_group_size:05d}.parquet")
+        pq.write_table(merged.slice(start, row_group_size), part + ".tmp", compression="zstd")
+        os.replace(part + ".tmp", part)
+    return merged.num_rows
+
+
+def enum_layout(table) -> dict:
+    """the {"single": ..., "multi_hot": ...} domains stored with the data."""
+    return json.loads(table.schema.metadata[ENUM_METADATA_KEY])
@@ -0,0 +1,151 @@
+import os
+import json
+import hashlib
+import time
+import threading
+from typing import Optional, Type
+from pydantic import BaseModel
+
+# how long a cached prefix lives on the server, extended while it is in use
+DEFAULT_TTL_SECONDS = int(os.getenv("CONTEXT_CACHE_TTL_SECONDS", "3600"))
+# extend the TTL this long before expiry, so no request is sent with a dying cache
+REFRESH_MARGIN_SECONDS = int(os.getenv("CONTEXT_CACHE_REFRESH_MARGIN_SECONDS", "300"))
+DISPLAY_NAME_PREFIX = "creative-analysis"
+
+
+def context_cache_enabled() -> bool:
+    # off by default: cached tokens are billed for storage while the cache lives
+    return os.getenv("CONTEXT_CACHE", "off").lower() in ("1", "on", "true", "yes")
+
+
+def slim_schema(model: Type[BaseModel]) -> dict:
+    """JSON schema without descriptions and titles, only the structure the response must follow."""
+
+    def strip(node, in_properties=False):
+        if isinstance(node, dict):
+            # keys directly under "properties" are field names, never schema keywords
+            return {k: strip(v, k == "properties" and not in_properties) for k, v in node.items()
+                    if in_properties or k not in ("description", "title")}
+        if isinstance(node, list):
+            return [strip(v) for v in node]
+        return node
+
+    return strip(model.model_json_schema())
+
+
+def schema_instruction(prompt: str, model: Type[BaseModel]) -> str:
+    """the static prefix: task prompt plus the full field guide (every Field description)."""
+    schema = json.dumps(model.model_json_schema(), indent=1)
+    return (
+        f"{prompt}\n\n"
+        "Answer with one JSON object. The JSON schema below defines every field; "
+        "use its descriptions to choose between the allowed values.\n\n"
+        f"{schema}"
+    )
+
+
+class PrefixCache:
+    """one server-side cached-content object holding the static instruction for a schema version.
+
+    The cache is created on first use, or adopted from an earlier run through
+    its display name (schema version plus a hash of model and instruction), its TTL is extended whenever it gets within
+    refresh_margin of expiry, and it is recreated if it disappears remotely.
+    Requests then send only the video and the cache name.
+    """
+
+    def __init__(self, client, model: str, system_instruction: str, version: str,
+                 ttl_seconds: int = DEFAULT_TTL_SECONDS, refresh_margin: int = REFRESH_MARGIN_SECONDS):
+        self.client = client
+        self.model = model
+        self.system_instruction = system_instruction
+        # adopted by display name, so it must change whenever the cached text or model does
+        digest = hashlib.sha256(f"{model}\n{system_instruction}".encode("utf-8")).hexdigest()[:12]
+        self.display_name = f"{DISPLAY_NAME_PREFIX}-{version}-{digest}"
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin = refresh_margin
+        self.creates = 0
+        self.refreshes = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self._name: Optional[str] = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def name(self) -> str:
+        """cache name valid for at least refresh_margin seconds."""
+        with self._lock:
+            now = time.time()
+            if self._name is None:
+                self._adopt_or_create(now)
+            elif self._expires_at <= now:
+                self._create()
+            elif self._expires_at - self.refresh_margin <= now:
+                self._refresh()
+            return self._name
+
+    def invalidate(self, name: str) -> None:
+        """forget a cache the server no longer knows, the next name() call recreates it."""
+        with self._lock:
+            if self._name == name:
+                self._name = None
+
+    def record_usage(self, usage) -> None:
+        if usage is None:
+            return
+        with self._lock:
+            self.prompt_tokens += usage.prompt_token_count or 0
+            self.cached_tokens += usage.cached_content_token_count or 0
+
+    def delete(self) -> None:
+        with self._lock:
+            if self._name is None:
+                return
+            try:
+                self.client.caches.delete(name=self._name)
+            except Exception as e:
+                print(f"Could not delete context cache {self._name}: {e}")
+            self._name = None
+
+    def _set(self, cached, now: float) -> None:
+        self._name = cached.name
+        expire_time = getattr(cached, "expire_time", None)
+        self._expires_at = expire_time.timestamp() if expire_time is not None else now + self.ttl_seconds
+
+    def _adopt_or_create(self, now: float) -> None:
+        # a cache left by an earlier run or another worker for the same schema version
+        try:
+            for cached in self.client.caches.list():
+                expire_time = getattr(cached, "expire_time", None)
+                if (cached.display_name == self.display_name and (cached.model or "").endswith(self.model)
+                        and expire_time is not None and expire_time.timestamp() - self.refresh_margin > now):
+                    self._set(cached, now)
+                    print(f"Reusing context cache {self._name} ({self.display_name})")
+                    return
+        except Exception as e:
+            print(f"Could not list context caches: {e}")
+        self._create()
+
+    def _create(self) -> None:
+        now = time.time()
+        cached = self.client.caches.create(
+            model=self.model,
+            config={
+                "display_name": self.display_name,
+                "system_instruction": self.system_instruction,
+                "ttl": f"{self.ttl_seconds}s",
+            },
+        )
+        self._set(cached, now)
+        self.creates += 1
+        print(f"Created context cache {self._name} ({self.display_name})")
+
+    def _refresh(self) -> None:
+        now = time.time()
+        try:
+            cached = self.client.caches.update(name=self._name, config={"ttl": f"{self.ttl_seconds}s"})
+        except Exception as e:
+            print(f"Could not refresh context cache {self._name}, recreating: {e}")
+            self._create()
+            return
+        self._set(cached, now)
+        self.refreshes += 1
@@ -0,0 +1,135 @@
+import os
+import hashlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional
+import cv2
+import numpy as np
+
+# frames sampled at evenly spaced positions of each video
+SAMPLE_FRAMES = 16
+# two sampled frames "match" within this many differing dHash bits (out of 64)
+FRAME_HAMMING_THRESHOLD = 10
+# videos are variants when this share of their aligned frames match; end card
+# and hook text swaps only touch a few samples at either end
+MATCH_RATIO_THRESHOLD = 0.6
+# LSH: each 64-bit frame hash is split into bands of 16 bits
+BANDS = 4
+# buckets this crowded carry no signal (e.g. black intro frames) and are skipped
+MAX_BUCKET_SIZE = 200
+FINGERPRINT_WORKERS = int(os.getenv("FINGERPRINT_WORKERS", "4"))
+
+
+class Cluster(NamedTuple):
+    # short hash of the representative's key, the same folder gives the same ids on every run
+    cluster_id: str
+    representative: str
+    members: List[str]
+
+
+def _dhash(frame: np.ndarray) -> int:
+    """64-bit difference hash: grayscale makes it insensitive to colour swaps."""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def fingerprint(video_path: str, samples: int = SAMPLE_FRAMES) -> Optional[np.ndarray]:
+    """dHash of `samples` evenly spaced frames, or None if the video can't be decoded."""
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        return None
+    try:
+        frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        if frame_count <= 0:
+            return None
+        hashes = []
+        for position in np.linspace(0, frame_count - 1, samples).astype(int):
+            capture.set(cv2.CAP_PROP_POS_FRAMES, int(position))
+            ok, frame = capture.read()
+            if not ok:
+                break
+            hashes.append(_dhash(frame))
+    finally:
+        capture.release()
+    if len(hashes) < samples:
+        return None
+    return np.array(hashes, dtype=np.uint64)
+
+
+def _match_ratio(a: np.ndarray, b: np.ndarray) -> float:
+    # popcount of xor per aligned frame, vectorised over the byte view
+    xor = np.bitwise_xor(a, b).view(np.uint8).reshape(len(a), 8)
+    distances = np.unpackbits(xor, axis=1).sum(axis=1)
+    return float(np.mean(distances <= FRAME_HAMMING_THRESHOLD))
+
+
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i: int, j: int) -> None:
+        ri, rj = self.find(i), self.find(j)
+        if ri != rj:
+            self.parent[max(ri, rj)] = min(ri, rj)
+
+
+def cluster_videos(video_paths: List[str], workers: int = FINGERPRINT_WORKERS,
+                   key: Callable[[str], str] = os.path.abspath) -> List[Cluster]:
+    """group near-duplicate variants, one Cluster per group (singletons included).
+
+    Candidate pairs come from an LSH index keyed by (frame slot, band, band
+    bits), so only videos that share at least one exact 16-bit band of an
+    aligned frame are compared in full; there is no all-pairs scan.
+    Cluster ids hash key(representative), not the cluster's position in the folder.
+    """
+    paths = sorted(video_paths)
+    # OpenCV releases the GIL while decoding, threads are enough here
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        prints = list(pool.map(fingerprint, paths))
+
+    buckets: Dict[tuple, List[int]] = defaultdict(list)
+    band_mask = (1 << (64 // BANDS)) - 1
+    for i, fp in enumerate(prints):
+        if fp is None:
+            continue
+        for slot, frame_hash in enumerate(fp.tolist()):
+            # near-flat frames hash to (almost) all zeros or ones, don't index them
+            if not 8 <= bin(frame_hash).count("1") <= 56:
+                continue
+            for band in range(BANDS):
+                value = (frame_hash >> (band * 64 // BANDS)) & band_mask
+                buckets[(slot, band, value)].append(i)
+
+    union_find = _UnionFind(len(paths))
+    compared = set()
+    for members in buckets.values():
+        if len(members) < 2 or len(members) > MAX_BUCKET_SIZE:
+            continue
+        for a_pos, a in enumerate(members):
+            for b in members[a_pos + 1:]:
+                if (a, b) in compared or union_find.find(a) == union_find.find(b):
+                    continue
+                compared.add((a, b))
+                if _match_ratio(prints[a], prints[b]) >= MATCH_RATIO_THRESHOLD:
+                    union_find.union(a, b)
+
+    groups: Dict[int, List[str]] = defaultdict(list)
+    for i, path in enumerate(paths):
+        groups[union_find.find(i)].append(path)
+
+    clusters = []
+    for root in sorted(groups):
+        members = groups[root]
+        # the largest file is usually the master the variants were cut from
+        representative = max(members, key=lambda p: (os.path.getsize(p), p))
+        cluster_id = hashlib.sha1(key(representative).encode("utf-8")).hexdigest()[:12]
+        clusters.append(Cluster(cluster_id, representative, members))
+    return clusters
@@ -0,0 +1,363 @@
+import time
+import uuid
+import random
+import datetime
+import itertools
+import threading
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Sequence
+from google.genai import errors as genai_errors
+from data_models.BatchAnalysis import BatchAnalysis, VideoAnalysis
+from data_models.CreativeAdsAnalysis import CreativeAnalysis
+from services.schema_fields import enum_values, multi_enum_fields, single_enum_fields
+
+# rough size of one second of video at default media resolution
+VIDEO_TOKENS_PER_SECOND = 300
+# uploaded files expire after 48h on the real Files API
+FILE_TTL_SECONDS = 48 * 3600
+READ_CHUNK = 1024 * 1024
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token, close enough for English prose and JSON
+    return max(1, len(text) // 4)
+
+
+def _seconds(offset) -> float:
+    # clip offsets are protobuf durations like "3s"
+    return float(str(offset).rstrip("s"))
+
+
+def sample_analysis(variant: int = 0) -> CreativeAnalysis:
+    """a valid CreativeAnalysis; variant picks the n-th value of every enum (wrapping)."""
+    data = {}
+    single, multi = single_enum_fields(), multi_enum_fields()
+    for name, info in CreativeAnalysis.model_fields.items():
+        if name in single:
+            values = enum_values(single[name])
+            data[name] = values[variant % len(values)]
+        elif name in multi:
+            values = enum_values(multi[name])
+            data[name] = [values[variant % len(values)]]
+        elif info.annotation is bool:
+            data[name] = bool(variant % 2)
+        elif info.annotation is str:
+            data[name] = ""
+        else:
+            data[name] = []
+    return CreativeAnalysis.model_validate(data)
+
+
+def api_error(code: int, status: str, message: str, retry_delay: Optional[float] = None):
+    """a real google.genai ClientError/ServerError with the JSON body the API would send."""
+    details = []
+    if retry_delay is not None:
+        details.append({"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": f"{retry_delay:g}s"})
+    body = {"error": {"code": code, "message": message, "status": status, "details": details}}
+    error_cls = genai_errors.ServerError if code >= 500 else genai_errors.ClientError
+    return error_cls(code, body)
+
+
+class _Faults:
+    """shared latency / 429 behaviour of the fake model endpoints."""
+
+    def __init__(self, owner: "FakeGenaiClient"):
+        self._owner = owner
+
+    def before_request(self) -> None:
+        owner = self._owner
+        with owner._lock:
+            owner.calls += 1
+            throttled = owner._random.random() < owner.rate_limit_rate
+            if throttled:
+                owner.rate_limited += 1
+        if throttled:
+            raise api_error(429, "RESOURCE_EXHAUSTED", "Resource has been exhausted (e.g. check quota).",
+                            owner.retry_after_seconds)
+
+    def sleep(self, prompt_tokens: int, cached_tokens: int) -> None:
+        owner = self._owner
+        # prefill cost scales with the tokens that are not served from the cache
+        time.sleep(owner.latency_seconds + (prompt_tokens - cached_tokens) / 1000 * owner.seconds_per_1k_tokens)
+
+    def answer(self, labels: Sequence[str], batch: bool) -> str:
+        owner = self._owner
+        if batch:
+            # multi-video request: one entry per "filename: ..." label
+            return BatchAnalysis(results=[VideoAnalysis(filename=label, analysis=owner.next_analysis())
+                                          for label in labels]).model_dump_json()
+        return owner.next_analysis().model_dump_json()
+
+
+class _FakeFiles:
+    """Files API: throttled uploads, PROCESSING -> ACTIVE/FAILED transitions, get/list/delete."""
+
+    def __init__(self, owner: "FakeGenaiClient"):
+        self._owner = owner
+        self._files: Dict[str, SimpleNamespace] = {}
+        self._ready_at: Dict[str, float] = {}
+        self._fails: Dict[str, bool] = {}
+        self._lock = threading.Lock()
+        self.bytes_uploaded = 0
+        self.uploads = 0
+
+    def upload(self, file, config=None):
+        config = config or {}
+        owner = self._owner
+        start = time.monotonic()
+        size = 0
+        if isinstance(file, str):
+            with open(file, "rb") as f:
+                for chunk in iter(lambda: f.read(READ_CHUNK), b""):
+                    size += len(chunk)
+            mime_type = config.get("mime_type") or "video/mp4"
+        else:
+            for chunk in iter(lambda: file.read(READ_CHUNK), b""):
+                size += len(chunk)
+            mime_type = config.get("mime_type") or "application/octet-stream"
+        if owner.upload_bytes_per_second:
+            time.sleep(max(0.0, size / owner.upload_bytes_per_second - (time.monotonic() - start)))
+
+        name = f"files/{uuid.uuid4().hex[:12]}"
+        now = datetime.datetime.now(datetime.timezone.utc)
+        with owner._lock:
+            processing = max(0.0, owner._random.gauss(owner.processing_seconds, owner.processing_jitter))
+            fails = owner._random.random() < owner.failed_rate
+        video_file = SimpleNamespace(
+            name=name,
+            display_name=config.get("display_name"),
+            uri=f"https://generativelanguage.googleapis.com/v1beta/{name}",
+            mime_type=mime_type,
+            size_bytes=size,
+            create_time=now,
+            expiration_time=now + datetime.timedelta(seconds=FILE_TTL_SECONDS),
+            state=SimpleNamespace(name="PROCESSING"),
+            video_metadata={"videoDuration": f"{owner.video_seconds}s"},
+        )
+        with self._lock:
+            self._files[name] = video_file
+            self._ready_at[name] = time.monotonic() + processing
+            self._fails[name] = fails
+            self.bytes_uploaded += size
+            self.uploads += 1
+            return self._snapshot(name)
+
+    def _snapshot(self, name: str):
+        video_file = self._files[name]
+        state = "PROCESSING"
+        if time.monotonic() >= self._ready_at[name]:
+            state = "FAILED" if self._fails[name] else "ACTIVE"
+        return SimpleNamespace(**{**vars(video_file), "state": SimpleNamespace(name=state)})
+
+    def get(self, name: str):
+        with self._lock:
+            if name not in self._files:
+                raise api_error(403, "PERMISSION_DENIED", f"You do not have permission to access the File {name}")
+            return self._snapshot(name)
+
+    def list(self, config=None):
+        with self._lock:
+            # newest first, like the real listing
+            names = sorted(self._files, key=lambda n: self._files[n].create_time, reverse=True)
+            return [self._snapshot(n) for n in names]
+
+    def delete(self, name: str) -> None:
+        with self._lock:
+            self._files.pop(name, None)
+            self._ready_at.pop(name, None)
+            self._fails.pop(name, None)
+
+
+class _FakeCaches:
+    def __init__(self, owner: "FakeGenaiClient"):
+        self._owner = owner
+        self._caches: Dict[str, SimpleNamespace] = {}
+        self._lock = threading.Lock()
+
+    def _expired(self, cached) -> bool:
+        return cached.expire_time.timestamp() <= time.time()
+
+    def create(self, model: str, config: dict):
+        instruction = config.get("system_instruction") or ""
+        tokens = estimate_tokens(instruction)
+        if tokens < self._owner.min_cache_tokens:
+            raise api_error(400, "INVALID_ARGUMENT",
+                            f"Cached content is too small: {tokens} < {self._owner.min_cache_tokens}")
+        ttl = float(str(config.get("ttl", "3600s")).rstrip("s"))
+        now = datetime.datetime.now(datetime.timezone.utc)
+        cached = SimpleNamespace(
+            name=f"cachedContents/{uuid.uuid4().hex[:12]}",
+            display_name=config.get("display_name"),
+            model=model if model.startswith("models/") else f"models/{model}",
+            create_time=now,
+            update_time=now,
+            expire_time=now + datetime.timedelta(seconds=ttl),
+            usage_metadata=SimpleNamespace(total_token_count=tokens),
+        )
+        with self._lock:
+            self._caches[cached.name] = cached
+        return cached
+
+    def get(self, name: str):
+        with self._lock:
+            cached = self._caches.get(name)
+            if cached is None or self._expired(cached):
+                self._caches.pop(name, None)
+                raise api_error(403, "PERMISSION_DENIED", f"CachedContent not found (or permission denied): {name}")
+            return cached
+
+    def update(self, name: str, config: dict):
+        cached = self.get(name)
+        ttl = float(str(config.get("ttl", "3600s")).rstrip("s"))
+        now = datetime.datetime.now(datetime.timezone.utc)
+        cached.update_time = now
+        cached.expire_time = now + datetime.timedelta(seconds=ttl)
+        return cached
+
+    def delete(self, name: str) -> None:
+        with self._lock:
+            self._caches.pop(name, None)
+
+    def list(self):
+        with self._lock:
+            return [c for c in self._caches.values() if not self._expired(c)]
+
+
+class _FakeModels:
+    def __init__(self, owner: "FakeGenaiClient"):
+        self._owner = owner
+
+    def generate_content(self, model: str, contents, config=None):
+        config = config if isinstance(config, dict) else (config.model_dump(exclude_none=True) if config else {})
+        self._owner.faults.before_request()
+        cached_tokens = 0
+        if config.get("cached_content"):
+            if config.get("system_instruction"):
+                # the real API rejects this combination too
+                raise api_error(400, "INVALID_ARGUMENT",
+                                "system_instruction cannot be set together with cached_content")
+            cached = self._owner.caches.get(config["cached_content"])
+            cached_tokens = cached.usage_metadata.total_token_count
+
+        prompt_tokens = cached_tokens
+        labels = []
+        for part in contents if isinstance(contents, list) else [contents]:
+            text = part if isinstance(part, str) else getattr(part, "text", None)
+            if text:
+                prompt_tokens += estimate_tokens(text)
+                if text.startswith("filename: "):
+                    labels.append(text[len("filename: "):])
+            else:
+                seconds = self._owner.video_seconds
+                clip = getattr(part, "video_metadata", None)
+                if clip is not None and clip.end_offset:
+                    seconds = min(seconds, _seconds(clip.end_offset) - _seconds(clip.start_offset or "0s"))
+                prompt_tokens += int(VIDEO_TOKENS_PER_SECOND * seconds)
+        for key in ("system_instruction", "response_json_schema", "response_schema"):
+            if config.get(key):
+                prompt_tokens += estimate_tokens(str(config[key]))
+
+        self._owner.faults.sleep(prompt_tokens, cached_tokens)
+        schema = config.get("response_json_schema") or {}
+        text = self._owner.faults.answer(labels, "results" in schema.get("properties", {}))
+        return SimpleNamespace(
+            text=text,
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=prompt_tokens,
+                cached_content_token_count=cached_tokens or None,
+                candidates_token_count=estimate_tokens(text),
+            ),
+        )
+
+
+class FakeGenaiClient:
+    """offline stand-in for google.genai.Client: files, caches and models.generate_content.
+
+    Uploads are throttled to upload_bytes_per_second, files stay PROCESSING for
+    about processing_seconds and then turn ACTIVE, or FAILED with probability
+    failed_rate. Model calls sleep latency_seconds plus seconds_per_1k_tokens
+    for every uncached prompt token, and fail with a 429 carrying a RetryInfo
+    delay with probability rate_limit_rate. Token counts are estimated from
+    text length and a fixed per-video cost. Multi-video requests (a response
+    schema with "results") get one entry per "filename: ..." text part.
+    """
+
+    def __init__(self, analyses: Optional[List[CreativeAnalysis]] = None, latency_seconds: float = 0.0,
+                 seconds_per_1k_tokens: float = 0.0, video_seconds: int = 30, min_cache_tokens: int = 1024,
+                 upload_bytes_per_second: float = 0.0, processing_seconds: float = 0.0,
+                 processing_jitter: float = 0.0, failed_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 retry_after_seconds: Optional[float] = 1.0, seed: Optional[int] = None):
+        self.latency_seconds = latency_seconds
+        self.seconds_per_1k_tokens = seconds_per_1k_tokens
+        self.video_seconds = video_seconds
+        self.min_cache_tokens = min_cache_tokens
+        self.upload_bytes_per_second = upload_bytes_per_second
+        self.processing_seconds = processing_seconds
+        self.processing_jitter = processing_jitter
+        self.failed_rate = failed_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after_seconds = retry_after_seconds
+        self.calls = 0
+        self.rate_limited = 0
+        self._analyses = itertools.cycle(analyses or [sample_analysis()])
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.faults = _Faults(self)
+        self.files = _FakeFiles(self)
+        self.caches = _FakeCaches(self)
+        self.models = _FakeModels(self)
+
+    def next_analysis(self) -> CreativeAnalysis:
+        # canned outputs are handed out round robin
+        with self._lock:
+            return next(self._analyses)
+
+
+class FakeStructuredLLM:
+    """stand-in for the LangChain chat model used by analyzer.run_inference.
+
+    Shares latency, 429 injection and canned outputs with a FakeGenaiClient.
+    bind() keeps only the response schema, which decides whether a single or
+    a multi-video answer is returned.
+    """
+
+    def __init__(self, client: FakeGenaiClient, schema: Optional[dict] = None):
+        self.client = client
+        self.schema = schema or {}
+
+    def bind(self, **kwargs) -> "FakeStructuredLLM":
+        return FakeStructuredLLM(self.client, kwargs.get("response_json_schema"))
+
+    def invoke(self, messages):
+        self.client.faults.before_request()
+        prompt_tokens = 0
+        labels = []
+        for message in messages:
+            content = message.content if isinstance(message.content, list) else [message.content]
+            for part in content:
+                if isinstance(part, str):
+                    part = {"type": "text", "text": part}
+                if part.get("type") == "text":
+                    prompt_tokens += estimate_tokens(part["text"])
+                    if part["text"].startswith("filename: "):
+                        labels.append(part["text"][len("filename: "):])
+                else:
+                    # clip offsets (hook mode) limit the tokenised range
+                    clip = part.get("video_metadata") or {}
+                    seconds = self.client.video_seconds
+                    if clip.get("end_offset"):
+                        start = _seconds(clip.get("start_offset") or "0s")
+                        seconds = min(seconds, _seconds(clip["end_offset"]) - start)
+                    prompt_tokens += int(VIDEO_TOKENS_PER_SECOND * seconds)
+        prompt_tokens += estimate_tokens(str(self.schema))
+
+        # only the langchain engine reaches this, keep langchain_core optional for the rest
+        from langchain_core.messages import AIMessage
+
+        self.client.faults.sleep(prompt_tokens, 0)
+        text = self.client.faults.answer(labels, "results" in self.schema.get("properties", {}))
+        return AIMessage(content=text, usage_metadata={
+            "input_tokens": prompt_tokens,
+            "output_tokens": estimate_tokens(text),
+            "total_tokens": prompt_tokens + estimate_tokens(text),
+        })
@@ -0,0 +1,151 @@
+import os
+import time
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from services.metrics import CACHE_LOOKUPS
+
+DEFAULT_REGISTRY_PATH = os.getenv("REMOTE_FILE_REGISTRY_PATH", os.path.join(".cache", "remote_files.sqlite"))
+# uploaded files live 48h on the Files API; stop reusing them a bit before that
+FILE_TTL_SECONDS = 48 * 3600
+EXPIRY_MARGIN_SECONDS = 15 * 60
+# remote files unused for this long are deleted by collect_garbage()
+DEFAULT_IDLE_SECONDS = int(os.getenv("REMOTE_FILE_IDLE_SECONDS", str(6 * 3600)))
+GC_WORKERS = 8
+
+
+def registry_enabled() -> bool:
+    return os.getenv("REMOTE_FILE_REGISTRY", "on").lower() not in ("0", "off", "false", "no")
+
+
+class RemoteFileRegistry:
+    """maps video content hash -> uploaded Gemini file, so identical bytes are uploaded once.
+
+    Entries are reused while the remote file is still ACTIVE and not close to
+    its expiry; collect_garbage() deletes idle remote files in bulk.
+    """
+
+    def __init__(self, client, path: str = DEFAULT_REGISTRY_PATH):
+        self.client = client
+        self.path = path
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS remote_files (
+                content_hash TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                uri TEXT,
+                mime_type TEXT,
+                expires_at REAL NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def lookup(self, content_hash: str):
+        """return the live remote file for this content, or None if it must be uploaded."""
+        video_file = self._lookup(content_hash)
+        CACHE_LOOKUPS.inc(cache="remote_file", result="miss" if video_file is None else "hit")
+        return video_file
+
+    def _lookup(self, content_hash: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT name, expires_at FROM remote_files WHERE content_hash = ?", (content_hash,)
+            ).fetchone()
+        if row is None:
+            return None
+
+        name, expires_at = row
+        if expires_at - EXPIRY_MARGIN_SECONDS <= time.time():
+            self.forget(content_hash)
+            return None
+
+        try:
+            video_file = self.client.files.get(name=name)
+        except Exception:
+            # deleted remotely or never finished, upload again
+            self.forget(content_hash)
+            return None
+        if video_file.state.name == "FAILED":
+            self.forget(content_hash)
+            return None
+
+        with self._lock:
+            self._conn.execute(
+                "UPDATE remote_files SET last_used = ? WHERE content_hash = ?", (time.time(), content_hash)
+            )
+            self._conn.commit()
+        return video_file
+
+    def register(self, content_hash: str, video_file) -> None:
+        now = time.time()
+        expiration = getattr(video_file, "expiration_time", None)
+        expires_at = expiration.timestamp() if expiration is not None else now + FILE_TTL_SECONDS
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO remote_files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (content_hash, video_file.name, video_file.uri, video_file.mime_type, expires_at, now, now),
+            )
+            self._conn.commit()
+
+    def forget(self, content_hash: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM remote_files WHERE content_hash = ?", (content_hash,))
+            self._conn.commit()
+
+    def collect_garbage(self, idle_seconds: int = DEFAULT_IDLE_SECONDS) -> int:
+        """delete remote files idle for idle_seconds (0 = all of them), returns how many."""
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT content_hash, name, expires_at FROM remote_files WHERE last_used <= ?",
+                (now - idle_seconds,),
+            ).fetchall()
+        if not rows:
+            return 0
+
+        def _delete(row):
+            content_hash, name, expires_at = row
+            if expires_at > now:
+                try:
+                    self.client.files.delete(name=name)
+                except Exception as e:
+                    print(f"Could not delete remote file {name}: {e}")
+            return content_hash
+
+        # the SDK has no bulk delete, fan the calls out instead of doing them one by one
+        with ThreadPoolExecutor(max_workers=GC_WORKERS) as pool:
+            removed = list(pool.map(_delete, rows))
+
+        with self._lock:
+            self._conn.executemany("DELETE FROM remote_files WHERE content_hash = ?", [(h,) for h in removed])
+            self._conn.commit()
+        print(f"Removed {len(removed)} remote files.")
+        return len(removed)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_default_registry: Optional[RemoteFileRegistry] = None
+_default_registry_lock = threading.Lock()
+
+
+def get_default_registry(client) -> Optional[RemoteFileRegistry]:
+    """shared registry for the API server, disabled with REMOTE_FILE_REGISTRY=off."""
+    global _default_registry
+    if not registry_enabled():
+        return None
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = RemoteFileRegistry(client)
+        return _default_registry
@@ -0,0 +1,173 @@
+import os
+import time
+import random
+import itertools
+import threading
+from concurrent.futures import Future
+from typing import Dict, Optional
+from services.metrics import FILE_POLLS
+from services.rate_limit import status_code
+
+# backoff for status checks of a single file: base * 2**attempt, capped, with jitter
+INITIAL_DELAY_SECONDS = 0.5
+MAX_DELAY_SECONDS = 10.0
+# with at least this many files due, the first page of files.list replaces N files.get calls
+LIST_THRESHOLD = 5
+LIST_PAGE_SIZE = 100
+# a file still PROCESSING after this long fails with TimeoutError instead of being polled forever
+MAX_WAIT_SECONDS = float(os.getenv("FILE_PROCESSING_TIMEOUT_SECONDS", "900"))
+
+
+class FileProcessingError(ValueError):
+    """the Files API reported FAILED for an upload."""
+
+
+def is_terminal(error: BaseException) -> bool:
+    """4xx other than 429, e.g. 403/404 once a file expired or was deleted, polling again cannot help."""
+    code = status_code(error)
+    return code is not None and 400 <= code < 500 and code != 429
+
+
+class _Pending:
+    __slots__ = ("future", "attempt", "due_at", "deadline")
+
+    def __init__(self, future: Future, due_at: float, deadline: float):
+        self.future = future
+        self.attempt = 0
+        self.due_at = due_at
+        self.deadline = deadline
+
+
+class FileReadinessTracker:
+    """watches every in-flight upload from one background loop.
+
+    track() returns a Future per file that resolves with the refreshed file
+    object once it is ACTIVE, or fails with FileProcessingError on FAILED,
+    with the API error when the file is gone (4xx) and with TimeoutError after
+    max_wait seconds of PROCESSING; other lookup errors are retried.
+    Each file is re-checked on its own exponential backoff with jitter, and
+    when several files are due at once their states come from the first page
+    of files.list instead of one files.get each.
+    """
+
+    def __init__(self, client, initial_delay: float = INITIAL_DELAY_SECONDS,
+                 max_delay: float = MAX_DELAY_SECONDS, list_threshold: int = LIST_THRESHOLD,
+                 max_wait: float = MAX_WAIT_SECONDS):
+        self.client = client
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.list_threshold = list_threshold
+        self.max_wait = max_wait
+        self.poll_count = 0
+        self._pending: Dict[str, _Pending] = {}
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def track(self, video_file) -> Future:
+        future: Future = Future()
+        state = video_file.state.name
+        if state == "ACTIVE":
+            future.set_result(video_file)
+            return future
+        if state == "FAILED":
+            future.set_exception(FileProcessingError(f"Video processing failed on Google's side: {video_file.name}"))
+            return future
+
+        with self._cond:
+            existing = self._pending.get(video_file.name)
+            if existing is not None:
+                return existing.future
+            now = time.monotonic()
+            self._pending[video_file.name] = _Pending(future, now + self.initial_delay, now + self.max_wait)
+            self._ensure_thread()
+            self._cond.notify()
+        return future
+
+    def pending_count(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name="file-readiness", daemon=True)
+            self._thread.start()
+
+    def _delay(self, attempt: int) -> float:
+        ceiling = min(self.max_delay, self.initial_delay * (2 ** attempt))
+        # "equal jitter": never below half the ceiling, spreads out synchronized uploads
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                now = time.monotonic()
+                next_due = min(p.due_at for p in self._pending.values())
+                if next_due > now:
+                    # woken early by track() if a new file needs an earlier check
+                    self._cond.wait(timeout=next_due - now)
+                    continue
+                due = [name for name, p in self._pending.items() if p.due_at <= now]
+
+            states = self._fetch_states(due)
+
+            with self._cond:
+                now = time.monotonic()
+                for name in due:
+                    pending = self._pending.get(name)
+                    if pending is None:
+                        continue
+                    video_file = states.get(name)
+                    if isinstance(video_file, Exception):
+                        if is_terminal(video_file):
+                            del self._pending[name]
+                            pending.future.set_exception(video_file)
+                            continue
+                        print(f"Status check for {name} failed, retrying: {video_file}")
+                        video_file = None
+                    state = video_file.state.name if video_file is not None else "PROCESSING"
+                    if state == "ACTIVE":
+                        del self._pending[name]
+                        pending.future.set_result(video_file)
+                    elif state == "FAILED":
+                        del self._pending[name]
+                        pending.future.set_exception(
+                            FileProcessingError(f"Video processing failed on Google's side: {name}")
+                        )
+                    elif now >= pending.deadline:
+                        del self._pending[name]
+                        pending.future.set_exception(
+                            TimeoutError(f"{name} still {state} after {self.max_wait:.0f}s")
+                        )
+                    else:
+                        pending.attempt += 1
+                        pending.due_at = now + self._delay(pending.attempt)
+
+    def _fetch_states(self, names) -> dict:
+        """name -> refreshed file object, or the exception its lookup raised."""
+        wanted = set(names)
+        states = {}
+        if len(names) >= self.list_threshold:
+            self.poll_count += 1
+            FILE_POLLS.inc(method="list")
+            try:
+                # newest files come first, so the in-flight ones are on the first page. Reading
+                # past it would walk the whole project whenever one of them was deleted
+                listing = self.client.files.list(config={"page_size": LIST_PAGE_SIZE})
+                for video_file in itertools.islice(listing, LIST_PAGE_SIZE):
+                    if video_file.name in wanted:
+                        states[video_file.name] = video_file
+                        if len(states) == len(wanted):
+                            break
+            except Exception as e:
+                print(f"Status listing failed, checking files one by one: {e}")
+        # anything the listing did not return gets a direct lookup
+        for name in wanted - states.keys():
+            self.poll_count += 1
+            FILE_POLLS.inc(method="get")
+            try:
+                states[name] = self.client.files.get(name=name)
+            except Exception as e:
+                states[name] = e
+        return states
@@ -0,0 +1,95 @@
+import os
+import time
+import uuid
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+from data_models.AnalysisJob import AnalysisJob, JobStatus
+
+# bounded worker pool for analyses started by the API, model calls inside
+# them are further limited by services.rate_limit
+DEFAULT_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "16"))
+# queued + running jobs allowed before new submissions are refused
+DEFAULT_MAX_PENDING = int(os.getenv("ANALYSIS_MAX_PENDING", "100"))
+# finished jobs are kept this long for GET /jobs/{id}
+DEFAULT_RETENTION_SECONDS = int(os.getenv("ANALYSIS_JOB_RETENTION_SECONDS", "3600"))
+
+
+class QueueFullError(RuntimeError):
+    """too many jobs are already queued or running."""
+
+
+class JobManager:
+    """runs analysis callables on a bounded thread pool and tracks their status."""
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, max_pending: int = DEFAULT_MAX_PENDING,
+                 retention_seconds: int = DEFAULT_RETENTION_SECONDS):
+        self.max_pending = max_pending
+        self.retention_seconds = retention_seconds
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="analysis")
+        self._jobs: Dict[str, AnalysisJob] = {}
+        self._futures: Dict[str, Future] = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable, *args, filename: Optional[str] = None,
+               on_finish: Optional[Callable[[], None]] = None) -> AnalysisJob:
+        """queue fn(*args); on_finish runs after the job ends, e.g. temp file cleanup."""
+        with self._lock:
+            self._prune()
+            if self._pending >= self.max_pending:
+                raise QueueFullError(f"{self._pending} analyses already pending, try again later.")
+            job = AnalysisJob(id=uuid.uuid4().hex, filename=filename, created_at=time.time())
+            self._jobs[job.id] = job
+            self._pending += 1
+
+        try:
+            self._futures[job.id] = self._executor.submit(self._run, job.id, fn, args, on_finish)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+                self._jobs.pop(job.id, None)
+            raise
+        return job
+
+    def _run(self, job_id: str, fn: Callable, args: tuple, on_finish: Optional[Callable[[], None]]):
+        self._update(job_id, status=JobStatus.RUNNING, started_at=time.time())
+        try:
+            result = fn(*args)
+        except Exception as e:
+            self._update(job_id, status=JobStatus.FAILED, error=str(e), finished_at=time.time())
+            raise
+        else:
+            self._update(job_id, status=JobStatus.DONE, result=result, finished_at=time.time())
+            return result
+        finally:
+            with self._lock:
+                self._pending -= 1
+            if on_finish is not None:
+                on_finish()
+
+    def _update(self, job_id: str, **changes) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                self._jobs[job_id] = job.model_copy(update=changes)
+
+    def _prune(self) -> None:
+        # caller holds the lock
+        cutoff = time.time() - self.retention_seconds
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+            self._futures.pop(job_id, None)
+
+    def get(self, job_id: str) -> Optional[AnalysisJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def future(self, job_id: str) -> Optional[Future]:
+        """the underlying future, for callers that want to wait on the result."""
+        return self._futures.get(job_id)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,240 @@
+import time
+import random
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# raw samples kept per series for percentiles, reservoir sampled beyond that
+MAX_SAMPLES = 10000
+
+TIME_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+BYTE_BUCKETS = (1e5, 1e6, 5e6, 1e7, 2.5e7, 5e7, 1e8, 2.5e8, 5e8, 1e9)
+TOKEN_BUCKETS = (100, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000)
+
+
+def _label_key(label_names: Sequence[str], labels: Dict[str, str]) -> Tuple[str, ...]:
+    if set(labels) != set(label_names):
+        raise ValueError(f"expected labels {list(label_names)}, got {list(labels)}")
+    return tuple(str(labels[name]) for name in label_names)
+
+
+def _format_labels(label_names: Sequence[str], key: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in zip(label_names, key)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+_INF = 'le="+Inf"'
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+class Counter:
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(self.label_names, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def values(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value:g}")
+        return lines
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class _Series:
+    def __init__(self, buckets: Sequence[float]):
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.samples: List[float] = []
+
+
+class Histogram:
+    """cumulative buckets for Prometheus plus a bounded sample of raw values for percentiles."""
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float], label_names: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.label_names = tuple(label_names)
+        self._series: Dict[Tuple[str, ...], _Series] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(self.label_names, labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series(self.buckets)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series.bucket_counts[i] += 1
+            series.count += 1
+            series.sum += value
+            if len(series.samples) < MAX_SAMPLES:
+                series.samples.append(value)
+            else:
+                slot = random.randrange(series.count)
+                if slot < MAX_SAMPLES:
+                    series.samples[slot] = value
+
+    @contextmanager
+    def time(self, **labels):
+        """observe the wall time of the block, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def summary(self) -> Dict[Tuple[str, ...], Dict[str, float]]:
+        """count, sum and p50/p95/p99/max per label set."""
+        out = {}
+        with self._lock:
+            items = [(key, s.count, s.sum, sorted(s.samples)) for key, s in self._series.items()]
+        for key, count, total, samples in items:
+            out[key] = {
+                "count": count,
+                "sum": total,
+                "p50": percentile(samples, 50),
+                "p95": percentile(samples, 95),
+                "p99": percentile(samples, 99),
+                "max": samples[-1] if samples else 0.0,
+            }
+        return out
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, list(s.bucket_counts), s.count, s.sum) for key, s in self._series.items())
+        for key, bucket_counts, count, total in items:
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                labels = _format_labels(self.label_names, key, f'le="{bound:g}"')
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, _INF)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {total:g}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[object] = []
+
+    def counter(self, name: str, help: str, label_names: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help, label_names)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float],
+                  label_names: Sequence[str] = ()) -> Histogram:
+        metric = Histogram(name, help, buckets, label_names)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        for metric in self._metrics:
+            metric.reset()
+
+
+REGISTRY = MetricsRegistry()
+
+# probe, landing, hash, transcode, trim, upload, processing_wait, throttle, inference, parse, total, hook_total
+STAGE_SECONDS = REGISTRY.histogram(
+    "analyzer_stage_seconds", "Wall time per analysis stage.", TIME_BUCKETS, ("stage",))
+UPLOAD_BYTES = REGISTRY.histogram(
+    "analyzer_upload_bytes", "Bytes sent to the Files API per upload.", BYTE_BUCKETS)
+REQUEST_TOKENS = REGISTRY.histogram(
+    "analyzer_request_tokens", "Tokens per inference request from usage metadata.", TOKEN_BUCKETS, ("kind",))
+FILE_POLLS = REGISTRY.counter(
+    "analyzer_file_polls_total", "Files API calls made while waiting for PROCESSING to end.", ("method",))
+RETRIES = REGISTRY.counter(
+    "analyzer_retries_total", "Requests repeated after a failure.", ("reason",))
+CACHE_LOOKUPS = REGISTRY.counter(
+    "analyzer_cache_lookups_total", "Result cache and remote file registry lookups.", ("cache", "result"))
+ANALYSES = REGISTRY.counter(
+    "analyzer_analyses_total", "Finished analyses by outcome.", ("outcome",))
+COALESCED = REGISTRY.counter(
+    "analyzer_coalesced_total", "API requests that joined an identical analysis already in flight.", ("kind",))
+
+
+def stage_timer(stage: str):
+    return STAGE_SECONDS.time(stage=stage)
+
+
+@contextmanager
+def track_analysis(stage: str = "total"):
+    """end-to-end time of one analysis (stage "total", "hook_total" for hook mode) and its outcome."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ANALYSES.inc(outcome="error")
+        raise
+    else:
+        ANALYSES.inc(outcome="ok")
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+
+def record_usage(prompt_tokens: Optional[int], output_tokens: Optional[int],
+                 cached_tokens: Optional[int] = None) -> None:
+    if prompt_tokens is not None:
+        REQUEST_TOKENS.observe(prompt_tokens, kind="prompt")
+    if output_tokens is not None:
+        REQUEST_TOKENS.observe(output_tokens, kind="output")
+    if cached_tokens:
+        REQUEST_TOKENS.observe(cached_tokens, kind="cached")
+
+
+def format_summary() -> str:
+    """per-run table of stage latencies (p50/p95/p99) plus token, byte and counter totals."""
+    lines = [f"{'stage':<16}{'count':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'total':>10}"]
+    for (stage,), s in sorted(STAGE_SECONDS.summary().items()):
+        lines.append(f"{stage:<16}{s['count']:>7}{s['p50']:>8.2f}s{s['p95']:>8.2f}s{s['p99']:>8.2f}s"
+                     f"{s['max']:>8.2f}s{s['sum']:>9.1f}s")
+    for (kind,), s in sorted(REQUEST_TOKENS.summary().items()):
+        lines.append(f"{kind + ' tokens':<16}{s['count']:>7}{s['p50']:>9.0f}{s['p95']:>9.0f}{s['p99']:>9.0f}"
+                     f"{s['max']:>9.0f}{s['sum']:>10.0f}")
+    uploads = UPLOAD_BYTES.summary().get(())
+    if uploads:
+        lines.append(f"{'upload MB':<16}{uploads['count']:>7}{uploads['p50'] / 1e6:>9.1f}{uploads['p95'] / 1e6:>9.1f}"
+                     f"{uploads['p99'] / 1e6:>9.1f}{uploads['max'] / 1e6:>9.1f}{uploads['sum'] / 1e6:>10.1f}")
+    for counter in (FILE_POLLS, RETRIES, CACHE_LOOKUPS, ANALYSES, COALESCED):
+        for key, value in sorted(counter.values().items()):
+            lines.append(f"{counter.name}{_format_labels(counter.label_names, key)} {value:g}")
+    return "\n".join(lines)
@@ -0,0 +1,144 @@
+import json
+from collections import Counter
+from typing import Dict, NamedTuple, Optional, Set, Type, Union
+from pydantic import BaseModel, ValidationError
+from data_models.CreativeAdsAnalysis import CreativeAnalysis
+from data_models.HookAnalysis import HookAnalysis
+from services.cache import ResultCache, make_cache_key
+from services.response_store import ResponseStore, StoredResponse, prompt_sha
+from services.schema_fields import enum_values, multi_enum_fields, single_enum_fields
+
+RESULT_MODELS = {"analysis": CreativeAnalysis, "hook": HookAnalysis}
+
+
+class MigrationRules(NamedTuple):
+    """how stored responses are rewritten before validation against the current schema.
+
+    rename_fields: old field name -> new field name.
+    values: field name (or "*" for every enum field) -> {old value: new value},
+    a new value of null removes it from lists and empties single fields.
+    drop_unknown: True, or a set of fields, whose values outside the current
+    enums are dropped instead of failing validation.
+    """
+    rename_fields: Dict[str, str] = {}
+    values: Dict[str, Dict[str, Optional[str]]] = {}
+    drop_unknown: Union[bool, Set[str]] = False
+
+
+def load_rules(path: Optional[str]) -> MigrationRules:
+    """read a rules JSON file, e.g.
+    {"rename_fields": {...}, "values": {"pointer_style": {"Pointer_3DHand": "Pointer_3D_Hand"}}, "drop_unknown": false}
+    """
+    if not path:
+        return MigrationRules()
+    with open(path, encoding="utf-8") as f:
+        raw = json.load(f)
+    unknown = set(raw) - set(MigrationRules._fields)
+    if unknown:
+        raise ValueError(f"Unknown rule keys {', '.join(sorted(unknown))}, expected {', '.join(MigrationRules._fields)}")
+    drop = raw.get("drop_unknown", False)
+    return MigrationRules(
+        rename_fields=raw.get("rename_fields") or {},
+        values=raw.get("values") or {},
+        drop_unknown=set(drop) if isinstance(drop, list) else bool(drop),
+    )
+
+
+def apply_rules(data: dict, rules: MigrationRules, model: Type[BaseModel] = CreativeAnalysis) -> dict:
+    """rewrite one stored response dict; the input is left untouched."""
+    data = {rules.rename_fields.get(name, name): value for name, value in data.items()}
+    single = single_enum_fields(model)
+    multi = multi_enum_fields(model)
+
+    def dropping(name: str) -> bool:
+        return rules.drop_unknown is True or (isinstance(rules.drop_unknown, set) and name in rules.drop_unknown)
+
+    def mapped(name: str, value):
+        for table in (rules.values.get(name), rules.values.get("*")):
+            if table and isinstance(value, str) and value in table:
+                return table[value]
+        return value
+
+    for name, enum_cls in {**single, **multi}.items():
+        if name not in data:
+            continue
+        allowed = set(enum_values(enum_cls))
+        if name in multi and isinstance(data[name], list):
+            values = [mapped(name, v) for v in data[name]]
+            values = [v for v in values if v is not None and (v in allowed or not dropping(name))]
+            # a mapping can fold two old values into one new one
+            data[name] = list(dict.fromkeys(values))
+        elif name in single:
+            value = mapped(name, data[name])
+            if value is not None and value not in allowed and dropping(name):
+                value = None
+            data[name] = value
+    return data
+
+
+class MigrationReport(NamedTuple):
+    total: int
+    migrated: int
+    # responses that only validate after the rules
+    rewritten: int
+    failed: int
+    skipped_prompt: int
+    # (field, offending value) -> count, the input for the next rules file
+    failures: Counter
+
+
+def migrate(store: ResponseStore, kind: str = "analysis", rules: MigrationRules = MigrationRules(),
+            cache: Optional[ResultCache] = None, writer=None, any_prompt: bool = False,
+            prompt: str = "", schema_version: str = "") -> MigrationReport:
+    """re-derive current-schema results from every video's latest stored response.
+
+    Valid results are written into cache under the key the analyzer now looks
+    up (prompt and schema version as given, model id and variant as stored),
+    and to writer (a CsvResultWriter / ParquetResultWriter) when one is given.
+    Responses produced with a different prompt are skipped unless any_prompt.
+    """
+    model = RESULT_MODELS[kind]
+    current_prompt = prompt_sha(prompt)
+    total = migrated = rewritten = failed = skipped = 0
+    failures: Counter = Counter()
+
+    for stored in store.latest(kind):
+        total += 1
+        if stored.prompt_sha != current_prompt and not any_prompt:
+            skipped += 1
+            continue
+        result = _revalidate(stored, model, rules, failures)
+        if result is None:
+            failed += 1
+            continue
+        migrated += 1
+        if result[1]:
+            rewritten += 1
+        analysis = result[0]
+        if cache is not None and stored.content_hash:
+            key = make_cache_key(stored.content_hash, stored.model_id, prompt, schema_version, stored.variant)
+            cache.put(key, stored.content_hash, stored.model_id, schema_version, analysis)
+        if writer is not None:
+            writer.write_result(analysis, stored.source or stored.content_hash or str(stored.id))
+
+    return MigrationReport(total, migrated, rewritten, failed, skipped, failures)
+
+
+def _revalidate(stored: StoredResponse, model: Type[BaseModel], rules: MigrationRules, failures: Counter):
+    """(validated model, whether the rules changed anything) or None."""
+    try:
+        data = json.loads(stored.raw)
+    except ValueError:
+        failures[("<response>", "not valid JSON")] += 1
+        return None
+    if not isinstance(data, dict):
+        failures[("<response>", "not a JSON object")] += 1
+        return None
+    rewritten = apply_rules(data, rules, model)
+    try:
+        return model.model_validate(rewritten), rewritten != data
+    except ValidationError as e:
+        for error in e.errors():
+            field = str(error["loc"][0]) if error["loc"] else "<response>"
+            failures[(field, repr(error.get("input"))[:80])] += 1
+        return None
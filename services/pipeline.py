@@ -0,0 +1,316 @@
+import os
+import time
+import queue
+import threading
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Union
+from data_models.CreativeAdsAnalysis import CreativeAnalysis
+from data_models.HookAnalysis import HookAnalysis
+from services import analyzer
+from services.cache import ResultCache, file_sha256
+from services.file_registry import RemoteFileRegistry
+from services.metrics import ANALYSES, STAGE_SECONDS
+from services.rate_limit import DEFAULT_MAX_CONCURRENCY
+from services.response_store import get_default_response_store
+
+# marks the end of a stage's input
+_DONE = object()
+
+
+class _FeedEnd(NamedTuple):
+    # how many paths the feeder handed out in total
+    count: int
+
+
+class PipelineResult(NamedTuple):
+    video_path: str
+    analysis: Optional[Union[CreativeAnalysis, HookAnalysis]]
+    error: Optional[Exception] = None
+    from_cache: bool = False
+
+
+class _Stage:
+    """a pool of worker threads reading one bounded queue and feeding the next.
+
+    The handler returns the item for the downstream stage, or None when it has
+    already reported a final result. When every worker has seen the end marker
+    the stage forwards one marker per downstream worker, so shutdown ripples
+    through the pipeline.
+    """
+
+    def __init__(self, name: str, workers: int, inbox: "queue.Queue", handler):
+        self.name = name
+        self.workers = workers
+        self.inbox = inbox
+        self.handler = handler
+        self.downstream: Optional["_Stage"] = None
+        self._remaining = workers
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            t = threading.Thread(target=self._loop, name=f"{self.name}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _loop(self) -> None:
+        while True:
+            item = self.inbox.get()
+            if item is _DONE:
+                break
+            out = self.handler(item)
+            if out is not None and self.downstream is not None:
+                self.downstream.inbox.put(out)
+        self._finish()
+
+    def _finish(self) -> None:
+        with self._lock:
+            self._remaining -= 1
+            last = self._remaining == 0
+        if last and self.downstream is not None:
+            for _ in range(self.downstream.workers):
+                self.downstream.inbox.put(_DONE)
+
+
+class _BatchingStage(_Stage):
+    """a _Stage whose handler receives lists of items.
+
+    A worker starts a batch with the next item and keeps adding whatever
+    arrives within linger seconds while fits(batch, item) allows it; an item
+    that does not fit opens the following batch. One worker collects at a
+    time, so a large pool still fills batches while the others are sending.
+    """
+
+    def __init__(self, name: str, workers: int, inbox: "queue.Queue", handler, fits, linger: float):
+        super().__init__(name, workers, inbox, handler)
+        self.fits = fits
+        self.linger = linger
+        self._collecting = threading.Lock()
+
+    def _loop(self) -> None:
+        carry = None
+        done = False
+        while not done:
+            with self._collecting:
+                item = carry if carry is not None else self.inbox.get()
+                carry = None
+                if item is _DONE:
+                    break
+                batch = [item]
+                deadline = time.monotonic() + self.linger
+                while True:
+                    try:
+                        item = self.inbox.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    if item is _DONE:
+                        done = True
+                        break
+                    if not self.fits(batch, item):
+                        carry = item
+                        break
+                    batch.append(item)
+            self.handler(batch)
+        self._finish()
+
+
+class AnalysisPipeline:
+    """overlaps upload, server-side processing and inference across many videos.
+
+    Each stage has its own worker pool and a bounded inbox, so uploads for the
+    next videos run while earlier ones are still PROCESSING and inference starts
+    as soon as a file turns ACTIVE. Total time approaches the slowest stage.
+    """
+
+    def __init__(self, cache: Optional[ResultCache] = None,
+                 registry: Optional[RemoteFileRegistry] = None, upload_workers: int = 2,
+                 wait_workers: int = 8, inference_workers: int = DEFAULT_MAX_CONCURRENCY, queue_size: int = 4,
+                 profile: str = "full", batch_inference: bool = False,
+                 batch_max_videos: int = analyzer.BATCH_MAX_VIDEOS,
+                 batch_max_tokens: int = analyzer.BATCH_MAX_TOKENS, batch_linger: float = 3.0,
+                 hook_seconds: Optional[float] = None, hook_clip_mode: str = analyzer.HOOK_CLIP_MODE):
+        self.cache = cache
+        self.registry = registry
+        self.upload_workers = upload_workers
+        self.wait_workers = wait_workers
+        # threads ready to call the model, services.rate_limit decides how many calls run at once
+        self.inference_workers = inference_workers
+        self.queue_size = queue_size
+        # transcoding profile applied in the upload stage
+        self.profile = profile
+        # several ready videos per inference request, see analyzer.run_batch_inference
+        self.batch_inference = batch_inference
+        self.batch_max_videos = batch_max_videos
+        self.batch_max_tokens = batch_max_tokens
+        # how long a batch waits for more ACTIVE files before it is sent
+        self.batch_linger = batch_linger
+        # hook mode: only the opening seconds, HookAnalysis results, one video per request
+        self.hook_seconds = hook_seconds
+        self.hook_clip_mode = hook_clip_mode
+        self._tokens_of: dict = {}
+        # feed time per path, for the end-to-end latency of each result
+        self._started: dict = {}
+
+    def run(self, video_paths: Iterable[str]) -> Iterator[PipelineResult]:
+        """yield one PipelineResult per input path, in completion order.
+
+        video_paths may be any iterable, including an endless one such as
+        services.watcher.FolderWatcher.paths(); it is consumed as the upload
+        stage has room and the run ends once it is exhausted and drained.
+        """
+        results: "queue.Queue[PipelineResult]" = queue.Queue(maxsize=self.queue_size)
+
+        upload = _Stage("upload", self.upload_workers, queue.Queue(maxsize=self.queue_size),
+                        lambda item: self._upload(item, results))
+        wait = _Stage("wait", self.wait_workers, queue.Queue(maxsize=self.queue_size),
+                      lambda item: self._wait(item, results))
+        if self.batch_inference and self.hook_seconds is None:
+            infer = _BatchingStage("inference", self.inference_workers,
+                                   queue.Queue(maxsize=max(self.queue_size, self.batch_max_videos)),
+                                   lambda batch: self._infer_batch(batch, results), self._fits, self.batch_linger)
+        else:
+            infer = _Stage("inference", self.inference_workers, queue.Queue(maxsize=self.queue_size),
+                           lambda item: self._infer(item, results))
+        upload.downstream = wait
+        wait.downstream = infer
+
+        for stage in (upload, wait, infer):
+            stage.start()
+
+        feeder = threading.Thread(target=self._feed, args=(video_paths, upload, results),
+                                  name="feeder", daemon=True)
+        feeder.start()
+
+        # the feeder closes with _FeedEnd(count), results may still be in flight behind it
+        expected = None
+        received = 0
+        while expected is None or received < expected:
+            result = results.get()
+            if isinstance(result, _FeedEnd):
+                expected = result.count
+                continue
+            received += 1
+            yield result
+
+    def _feed(self, video_paths: Iterable[str], upload: _Stage, results: "queue.Queue") -> None:
+        count = 0
+        for path in video_paths:
+            count += 1
+            self._started[path] = time.perf_counter()
+            try:
+                # the response store keys raw responses by content too
+                needs_hash = (self.cache is not None or self.registry is not None
+                              or get_default_response_store() is not None)
+                content_hash = file_sha256(path) if needs_hash else None
+                if self.cache is not None:
+                    cached = self.cache.get(self._cache_key(content_hash), self._result_model())
+                    if cached is not None:
+                        self._report(results, PipelineResult(path, cached, from_cache=True))
+                        continue
+            except Exception as e:
+                self._report(results, PipelineResult(path, None, e))
+                continue
+            # blocks when the upload stage is saturated
+            upload.inbox.put((path, content_hash))
+
+        for _ in range(upload.workers):
+            upload.inbox.put(_DONE)
+        results.put(_FeedEnd(count))
+
+    def _report(self, results: "queue.Queue", result: PipelineResult) -> None:
+        started = self._started.pop(result.video_path, None)
+        if started is not None:
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage="total")
+        ANALYSES.inc(outcome="error" if result.error is not None else "ok")
+        results.put(result)
+
+    def _cache_key(self, content_hash: str) -> str:
+        if self.hook_seconds is not None:
+            return analyzer.hook_cache_key(content_hash, self.hook_seconds)
+        return analyzer.analysis_cache_key(content_hash, self.profile)
+
+    def _result_model(self):
+        return HookAnalysis if self.hook_seconds is not None else CreativeAnalysis
+
+    def _store(self, content_hash: Optional[str], analysis) -> None:
+        if self.cache is None or content_hash is None:
+            return
+        schema_version = analyzer.HOOK_SCHEMA_VERSION if self.hook_seconds is not None else analyzer.SCHEMA_VERSION
+        self.cache.put(self._cache_key(content_hash), content_hash, analyzer.MODEL_NAME, schema_version, analysis)
+
+    def _upload(self, item, results: "queue.Queue"):
+        path, content_hash = item
+        # local hook clips are cut before upload, server clips upload the whole video
+        clip_seconds = self.hook_seconds if self.hook_clip_mode == "local" else None
+        try:
+            video_file = analyzer.upload_video(path, content_hash, self.registry, self.profile, clip_seconds)
+        except Exception as e:
+            self._report(results, PipelineResult(path, None, e))
+            return None
+        return path, content_hash, video_file
+
+    def _wait(self, item, results: "queue.Queue"):
+        path, content_hash, video_file = item
+        try:
+            video_file = analyzer.wait_for_processing(video_file)
+        except Exception as e:
+            self._report(results, PipelineResult(path, None, e))
+            return None
+        return path, content_hash, video_file
+
+    def _infer(self, item, results: "queue.Queue") -> None:
+        path, content_hash, video_file = item
+        try:
+            if self.hook_seconds is not None:
+                analysis = analyzer.run_hook_inference(
+                    video_file, self.hook_seconds, server_clip=self.hook_clip_mode == "server",
+                    record=analyzer.hook_record(content_hash, path, self.hook_seconds))
+            else:
+                analysis = analyzer.run_inference(video_file,
+                                                  analyzer.analysis_record(content_hash, path, self.profile))
+            if analysis is not None:
+                self._store(content_hash, analysis)
+        except Exception as e:
+            self._report(results, PipelineResult(path, None, e))
+            return None
+        self._report(results, PipelineResult(path, analysis))
+        return None
+
+    def _tokens(self, path: str) -> int:
+        if path not in self._tokens_of:
+            self._tokens_of[path] = analyzer.estimate_video_tokens(path)
+        return self._tokens_of[path]
+
+    def _fits(self, batch, item) -> bool:
+        if len(batch) >= self.batch_max_videos:
+            return False
+        used = sum(self._tokens(path) for path, _, _ in batch)
+        return used + self._tokens(item[0]) <= self.batch_max_tokens
+
+    def _infer_batch(self, batch, results: "queue.Queue") -> None:
+        # filenames are the keys of the wrapper schema, so they must be unique within a request
+        labels = []
+        for path, _, _ in batch:
+            label = os.path.basename(path)
+            while label in labels:
+                label = f"{len(labels)}_{label}"
+            labels.append(label)
+
+        try:
+            records = {label: analyzer.analysis_record(item[1], item[0], self.profile)
+                       for label, item in zip(labels, batch)}
+            outcome = analyzer.run_batch_inference([(label, item[2]) for label, item in zip(labels, batch)], records)
+        except Exception as e:
+            for path, _, _ in batch:
+                self._report(results, PipelineResult(path, None, e))
+            return None
+
+        for label, (path, content_hash, _) in zip(labels, batch):
+            analysis = outcome.analyses.get(label)
+            if analysis is None:
+                error = outcome.errors.get(label) or ValueError(f"no analysis returned for {label}")
+                self._report(results, PipelineResult(path, None, error))
+                continue
+            self._store(content_hash, analysis)
+            self._report(results, PipelineResult(path, analysis))
+        return None
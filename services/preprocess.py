@@ -0,0 +1,221 @@
+import os
+import shutil
+import tempfile
+import threading
+import subprocess
+from typing import NamedTuple, Optional
+import cv2
+
+
+class TranscodeProfile(NamedTuple):
+    name: str
+    # target for the shorter side, so 9x16 and 16x9 creatives scale alike
+    max_short_side: Optional[int]
+    max_fps: Optional[float]
+
+
+# "full" uploads the original master untouched
+PROFILES = {
+    "full": TranscodeProfile("full", None, None),
+    "balanced": TranscodeProfile("balanced", 720, 24),
+    "fast": TranscodeProfile("fast", 480, 12),
+}
+DEFAULT_PROFILE = os.getenv("TRANSCODE_PROFILE", "full")
+
+
+class TranscodeResult(NamedTuple):
+    path: str
+    original_bytes: int
+    output_bytes: int
+    is_temporary: bool
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_bytes - self.output_bytes
+
+
+_totals_lock = threading.Lock()
+_totals = {"original_bytes": 0, "output_bytes": 0, "videos": 0}
+
+
+def transcode_totals() -> dict:
+    """bytes before/after transcoding for everything processed in this process."""
+    with _totals_lock:
+        return dict(_totals)
+
+
+def get_profile(name: Optional[str]) -> TranscodeProfile:
+    try:
+        return PROFILES[name or "full"]
+    except KeyError:
+        raise ValueError(f"Unknown transcode profile '{name}', choose from {', '.join(PROFILES)}")
+
+
+def video_duration_seconds(video_path: str) -> Optional[float]:
+    """container duration from the frame count and fps, None when OpenCV cannot read it."""
+    capture = cv2.VideoCapture(video_path)
+    try:
+        if not capture.isOpened():
+            return None
+        frames = capture.get(cv2.CAP_PROP_FRAME_COUNT)
+        fps = capture.get(cv2.CAP_PROP_FPS)
+        if frames <= 0 or fps <= 0:
+            return None
+        return frames / fps
+    finally:
+        capture.release()
+
+
+def transcode(video_path: str, profile: TranscodeProfile) -> TranscodeResult:
+    """downscale and fps-cap a video with OpenCV before upload.
+
+    OpenCV only writes the video track. When an ffmpeg binary is available the
+    original audio is muxed back in; without it the audio is dropped, which
+    weakens the audio/voiceover fields. The original is kept when the profile
+    would not make the file smaller.
+    """
+    original_bytes = os.path.getsize(video_path)
+    untouched = TranscodeResult(video_path, original_bytes, original_bytes, False)
+    if profile.max_short_side is None and profile.max_fps is None:
+        return untouched
+
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        # let the Files API report the real problem
+        return untouched
+    width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    source_fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+
+    scale = 1.0
+    if profile.max_short_side and min(width, height) > profile.max_short_side:
+        scale = profile.max_short_side / min(width, height)
+    target_fps = min(source_fps, profile.max_fps) if profile.max_fps else source_fps
+    if scale == 1.0 and target_fps >= source_fps:
+        capture.release()
+        return untouched
+
+    # even dimensions keep every codec happy
+    out_size = (int(width * scale) // 2 * 2, int(height * scale) // 2 * 2)
+    fd, video_only = tempfile.mkstemp(prefix="transcode_", suffix=".mp4")
+    os.close(fd)
+    writer = cv2.VideoWriter(video_only, cv2.VideoWriter_fourcc(*"mp4v"), target_fps, out_size)
+    if not writer.isOpened():
+        # no mp4v encoder in this OpenCV build, upload the original
+        print("   Warning: OpenCV could not open a video writer, uploading the original.")
+        capture.release()
+        os.remove(video_only)
+        return untouched
+
+    # keep a frame whenever the output clock has caught up with the source clock
+    step = source_fps / target_fps
+    next_keep = 0.0
+    index = 0
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            if index >= next_keep:
+                if scale != 1.0:
+                    frame = cv2.resize(frame, out_size, interpolation=cv2.INTER_AREA)
+                writer.write(frame)
+                next_keep += step
+            index += 1
+    finally:
+        capture.release()
+        writer.release()
+
+    output_path = _mux_audio(video_only, video_path)
+    output_bytes = os.path.getsize(output_path)
+    if output_bytes == 0 or output_bytes >= original_bytes:
+        # empty means no frame was written, bigger means the profile did not help
+        os.remove(output_path)
+        return untouched
+
+    with _totals_lock:
+        _totals["original_bytes"] += original_bytes
+        _totals["output_bytes"] += output_bytes
+        _totals["videos"] += 1
+    print(f"   Transcoded ({profile.name}) {original_bytes / 1e6:.1f} MB -> {output_bytes / 1e6:.1f} MB "
+          f"(saved {100 * (original_bytes - output_bytes) / original_bytes:.0f}%)")
+    return TranscodeResult(output_path, original_bytes, output_bytes, True)
+
+
+def trim(video_path: str, seconds: float) -> TranscodeResult:
+    """cut the first seconds of a video for hook-only analysis.
+
+    With ffmpeg the streams are copied without re-encoding, audio included;
+    the cut lands on the next packet boundary, so the clip can run slightly
+    long. Without ffmpeg OpenCV re-encodes the frames and the audio is lost.
+    """
+    original_bytes = os.path.getsize(video_path)
+    untouched = TranscodeResult(video_path, original_bytes, original_bytes, False)
+    duration = video_duration_seconds(video_path)
+    if duration is not None and duration <= seconds:
+        return untouched
+
+    ext = os.path.splitext(video_path)[1] or ".mp4"
+    fd, clip = tempfile.mkstemp(prefix="hook_", suffix=ext)
+    os.close(fd)
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is not None:
+        command = [ffmpeg, "-y", "-loglevel", "error", "-i", video_path, "-t", f"{seconds:g}",
+                   "-map", "0:v:0", "-map", "0:a:0?", "-c", "copy", "-avoid_negative_ts", "make_zero", clip]
+        if subprocess.run(command, capture_output=True).returncode == 0 and os.path.getsize(clip) > 0:
+            return TranscodeResult(clip, original_bytes, os.path.getsize(clip), True)
+    os.remove(clip)
+
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        # let the Files API report the real problem
+        return untouched
+    fd, clip = tempfile.mkstemp(prefix="hook_", suffix=".mp4")
+    os.close(fd)
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    size = (int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)), int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    writer = cv2.VideoWriter(clip, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+    if not writer.isOpened():
+        capture.release()
+        os.remove(clip)
+        print("   Warning: no ffmpeg and OpenCV could not write the hook clip, sending the full video.")
+        return untouched
+    try:
+        for _ in range(int(round(seconds * fps))):
+            ok, frame = capture.read()
+            if not ok:
+                break
+            writer.write(frame)
+    finally:
+        capture.release()
+        writer.release()
+    clip_bytes = os.path.getsize(clip)
+    if clip_bytes == 0:
+        os.remove(clip)
+        print("   Warning: OpenCV wrote an empty hook clip, sending the full video.")
+        return untouched
+    print("   Warning: hook clip cut with OpenCV (no usable ffmpeg), it has no audio track.")
+    return TranscodeResult(clip, original_bytes, clip_bytes, True)
+
+
+def _mux_audio(video_only: str, original: str) -> str:
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        print("   Warning: ffmpeg not found, transcoded upload has no audio track.")
+        return video_only
+
+    fd, muxed = tempfile.mkstemp(prefix="transcode_av_", suffix=".mp4")
+    os.close(fd)
+    command = [
+        ffmpeg, "-y", "-loglevel", "error",
+        "-i", video_only, "-i", original,
+        "-map", "0:v:0", "-map", "1:a:0?",
+        "-c:v", "copy", "-c:a", "aac", "-b:a", "96k", "-shortest", muxed,
+    ]
+    result = subprocess.run(command, capture_output=True)
+    if result.returncode != 0:
+        print(f"   Warning: could not mux audio back ({result.stderr.decode(errors='ignore').strip()}).")
+        os.remove(muxed)
+        return video_only
+    os.remove(video_only)
+    return muxed
@@ -0,0 +1,181 @@
+import os
+import time
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional
+import cv2
+
+# files outside these limits are rejected before upload, 0 disables a limit
+PROBE_MIN_SECONDS = float(os.getenv("PROBE_MIN_SECONDS", "0.5"))
+# ~300 tokens per second of video, longer ads would not fit the 1M token context
+PROBE_MAX_SECONDS = float(os.getenv("PROBE_MAX_SECONDS", "3000"))
+# Files API per-file limit
+PROBE_MAX_BYTES = int(os.getenv("PROBE_MAX_BYTES", str(2 * 1024 ** 3)))
+PROBE_MIN_SHORT_SIDE = int(os.getenv("PROBE_MIN_SHORT_SIDE", "0"))
+DEFAULT_PROBE_WORKERS = int(os.getenv("PROBE_WORKERS", str(min(8, os.cpu_count() or 1))))
+
+# extra result columns and their Parquet types
+PROBE_COLUMN_TYPES = {
+    "probe_duration_seconds": "double",
+    "probe_width": "int32",
+    "probe_height": "int32",
+    "probe_fps": "double",
+    "probe_frame_count": "int64",
+    "probe_has_audio": "bool",
+}
+PROBE_COLUMNS = list(PROBE_COLUMN_TYPES)
+
+# ISO base media boxes on the way from the file root to a track's handler
+_MP4_CONTAINERS = {b"moov", b"trak", b"mdia"}
+
+
+class ProbeResult(NamedTuple):
+    path: str
+    ok: bool
+    reason: Optional[str] = None
+    duration_seconds: Optional[float] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    fps: Optional[float] = None
+    frame_count: Optional[int] = None
+    # None when the container is not MP4/MOV and the answer is unknown
+    has_audio: Optional[bool] = None
+    seconds: float = 0.0
+
+
+def probe_row(result: ProbeResult) -> Dict[str, object]:
+    """the probe_* columns written next to the analysis fields."""
+    return {
+        "probe_duration_seconds": None if result.duration_seconds is None else round(result.duration_seconds, 3),
+        "probe_width": result.width,
+        "probe_height": result.height,
+        "probe_fps": None if result.fps is None else round(result.fps, 3),
+        "probe_frame_count": result.frame_count,
+        "probe_has_audio": result.has_audio,
+    }
+
+
+def mp4_has_audio(path: str) -> Optional[bool]:
+    """True when an MP4/MOV track has a 'soun' handler, None for other or broken containers.
+
+    OpenCV only exposes the video stream, so the box tree is walked directly;
+    only box headers are read, never the media data.
+    """
+    with open(path, "rb") as f:
+        end = os.fstat(f.fileno()).st_size
+        found_moov = []
+        result = _walk_boxes(f, 0, end, found_moov)
+    if result:
+        return True
+    return False if found_moov else None
+
+
+def _walk_boxes(f, start: int, end: int, found_moov: list) -> bool:
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        size, kind = struct.unpack(">I4s", f.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            # torn or not an ISO file at all
+            return False
+        if kind == b"moov":
+            found_moov.append(offset)
+        if kind in _MP4_CONTAINERS:
+            if _walk_boxes(f, offset + header, offset + size, found_moov):
+                return True
+        elif kind == b"hdlr":
+            # version/flags, pre_defined, then the handler type
+            f.seek(offset + header + 8)
+            if f.read(4) == b"soun":
+                return True
+        offset += size
+    return False
+
+
+def _decodes_at(capture, frame_index: int, attempts: int = 3) -> bool:
+    capture.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+    for _ in range(attempts):
+        ok, _ = capture.read()
+        if ok:
+            return True
+    return False
+
+
+def probe_video(path: str) -> ProbeResult:
+    """read container metadata and decode a couple of frames, no network involved.
+
+    A file is rejected when OpenCV cannot open it, the first frame or one
+    near the end does not decode (truncated copies), or it is outside the
+    PROBE_* limits.
+    """
+    started = time.perf_counter()
+
+    def reject(reason: str, **fields) -> ProbeResult:
+        return ProbeResult(path, False, reason, seconds=time.perf_counter() - started, **fields)
+
+    try:
+        size = os.path.getsize(path)
+    except OSError as e:
+        return reject(f"unreadable ({e.strerror})")
+    if size == 0:
+        return reject("empty file")
+    if PROBE_MAX_BYTES and size > PROBE_MAX_BYTES:
+        return reject(f"{size / 1e9:.1f} GB exceeds the {PROBE_MAX_BYTES / 1e9:.1f} GB upload limit")
+
+    try:
+        has_audio = mp4_has_audio(path)
+    except OSError:
+        has_audio = None
+
+    capture = cv2.VideoCapture(path)
+    try:
+        if not capture.isOpened():
+            return reject("container cannot be opened", has_audio=has_audio)
+        width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)) or None
+        height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)) or None
+        fps = capture.get(cv2.CAP_PROP_FPS) or None
+        frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        # webm and some streams report no frame count, duration stays unknown then
+        frame_count = frames if frames > 0 else None
+        duration = frame_count / fps if frame_count and fps else None
+        meta = dict(duration_seconds=duration, width=width, height=height, fps=fps,
+                    frame_count=frame_count, has_audio=has_audio)
+
+        if not _decodes_at(capture, 0):
+            return reject("no decodable video frames", **meta)
+        if frame_count and frame_count > 10 and not _decodes_at(capture, int(frame_count * 0.9)):
+            return reject("frames stop decoding before the end (truncated?)", **meta)
+    finally:
+        capture.release()
+
+    if duration is not None:
+        if PROBE_MIN_SECONDS and duration < PROBE_MIN_SECONDS:
+            return reject(f"{duration:.2f}s is shorter than {PROBE_MIN_SECONDS:g}s", **meta)
+        if PROBE_MAX_SECONDS and duration > PROBE_MAX_SECONDS:
+            return reject(f"{duration:.0f}s is longer than {PROBE_MAX_SECONDS:g}s", **meta)
+    if PROBE_MIN_SHORT_SIDE and width and height and min(width, height) < PROBE_MIN_SHORT_SIDE:
+        return reject(f"{width}x{height} is below {PROBE_MIN_SHORT_SIDE}p", **meta)
+    return ProbeResult(path, True, seconds=time.perf_counter() - started, **meta)
+
+
+def _probe_safely(path: str) -> ProbeResult:
+    # a crash in one file must not take down the whole map
+    try:
+        return probe_video(path)
+    except Exception as e:
+        return ProbeResult(path, False, f"probe failed: {e}")
+
+
+def probe_many(paths: List[str], workers: int = DEFAULT_PROBE_WORKERS) -> Dict[str, ProbeResult]:
+    """probe every path, spread over a process pool (decoding holds the GIL in parts of OpenCV)."""
+    if workers <= 1 or len(paths) <= 1:
+        return {path: _probe_safely(path) for path in paths}
+    chunksize = max(1, len(paths) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return dict(zip(paths, pool.map(_probe_safely, paths, chunksize=chunksize)))
@@ -0,0 +1,338 @@
+import os
+import time
+import random
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, Optional
+from services.metrics import RETRIES, STAGE_SECONDS
+
+# quota budgets shared by every model call in the process, 0 disables a budget.
+# set them to the limits of your tier, e.g. RATE_LIMIT_RPM=1000 RATE_LIMIT_TPM=1000000
+DEFAULT_RPM = float(os.getenv("RATE_LIMIT_RPM", "0"))
+DEFAULT_TPM = float(os.getenv("RATE_LIMIT_TPM", "0"))
+# combined bandwidth of all uploads to the Files API
+DEFAULT_UPLOAD_BYTES_PER_SECOND = float(os.getenv("RATE_LIMIT_UPLOAD_BYTES_PER_SECOND", "0"))
+# AIMD bounds for parallel model calls
+DEFAULT_INITIAL_CONCURRENCY = int(os.getenv("RATE_LIMIT_INITIAL_CONCURRENCY", "2"))
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("RATE_LIMIT_MAX_CONCURRENCY", "16"))
+# attempts per call while the API keeps answering 429/503
+DEFAULT_MAX_ATTEMPTS = int(os.getenv("RATE_LIMIT_MAX_ATTEMPTS", "6"))
+# SQLite file holding the bucket levels, so several processes or containers share the budgets above.
+# empty keeps them per process; queue workers default to one next to the work queue
+DEFAULT_STATE_PATH = os.getenv("RATE_LIMIT_STATE_PATH", "")
+# how long a bucket update waits for another process's transaction
+STATE_BUSY_TIMEOUT_SECONDS = 30.0
+
+# per-minute budgets may burst this share of a minute at once
+BURST_FRACTION = 0.1
+# backoff when an overload response carries no retry delay
+BACKOFF_BASE_SECONDS = 2.0
+BACKOFF_MAX_SECONDS = 60.0
+OVERLOAD_CODES = (429, 503)
+
+
+def _error_chain(error: BaseException):
+    # LangChain wraps google.genai errors, the original is the __cause__
+    seen = []
+    while error is not None and error not in seen and len(seen) < 5:
+        seen.append(error)
+        error = error.__cause__
+    return seen
+
+
+def status_code(error: BaseException) -> Optional[int]:
+    """HTTP status of an API error or of the error it wraps."""
+    for err in _error_chain(error):
+        code = getattr(err, "code", None)
+        if isinstance(code, int):
+            return code
+        code = getattr(err, "status_code", None)
+        if isinstance(code, int):
+            return code
+    return None
+
+
+def is_overloaded(error: BaseException) -> bool:
+    return status_code(error) in OVERLOAD_CODES
+
+
+def _parse_duration(value) -> Optional[float]:
+    # protobuf Duration JSON looks like "7s" or "0.250s"
+    try:
+        return max(0.0, float(str(value).strip().rstrip("s")))
+    except ValueError:
+        return None
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """server-suggested delay from the RetryInfo detail or a Retry-After header, None when absent."""
+    for err in _error_chain(error):
+        details = getattr(err, "details", None)
+        if isinstance(details, dict):
+            for detail in (details.get("error") or {}).get("details") or []:
+                if isinstance(detail, dict) and str(detail.get("@type", "")).endswith("RetryInfo"):
+                    delay = _parse_duration(detail.get("retryDelay"))
+                    if delay is not None:
+                        return delay
+        headers = getattr(getattr(err, "response", None), "headers", None)
+        if headers is not None and headers.get("retry-after"):
+            delay = _parse_duration(headers.get("retry-after"))
+            if delay is not None:
+                return delay
+    return None
+
+
+class TokenBucket:
+    """refills at rate per second up to capacity.
+
+    A request larger than the bucket waits for a full bucket and then drives
+    the level negative, so the long-run rate still holds.
+    """
+
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.rate = rate_per_second
+        self.capacity = max(1.0, capacity)
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount: float) -> float:
+        """block until amount fits, returns the seconds spent waiting."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                needed = min(amount, self.capacity)
+                if self._level >= needed:
+                    self._level -= amount
+                    return waited
+                delay = (needed - self._level) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def adjust(self, amount: float) -> None:
+        """charge (positive) or refund (negative) the difference to an earlier estimate."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._level = min(self.capacity, self._level - amount)
+
+
+class SharedTokenBucket:
+    """a TokenBucket whose level lives in a SQLite row, shared by every process using the same file.
+
+    Refills from wall-clock time, monotonic clocks differ between processes.
+    Every process should be configured with the same rate and capacity. Needs
+    a local filesystem, SQLite locking is unreliable on network mounts.
+    """
+
+    def __init__(self, path: str, name: str, rate_per_second: float, capacity: float):
+        self.path = path
+        self.name = name
+        self.rate = rate_per_second
+        self.capacity = max(1.0, capacity)
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # autocommit, each update is its own IMMEDIATE transaction
+        self._conn = sqlite3.connect(path, timeout=STATE_BUSY_TIMEOUT_SECONDS, check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, level REAL NOT NULL, updated REAL NOT NULL)")
+
+    def _charge(self, amount: float, needed: Optional[float] = None) -> float:
+        """take amount once needed fits (always when None), else return the seconds until it would fit."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = self._conn.execute("SELECT level, updated FROM buckets WHERE name = ?", (self.name,)).fetchone()
+                level = self.capacity if row is None else min(self.capacity,
+                                                              row[0] + max(0.0, now - row[1]) * self.rate)
+                delay = 0.0
+                if needed is not None and level < needed:
+                    delay = (needed - level) / self.rate
+                else:
+                    level = min(self.capacity, level - amount)
+                self._conn.execute("INSERT OR REPLACE INTO buckets (name, level, updated) VALUES (?, ?, ?)",
+                                   (self.name, level, now))
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return delay
+
+    def acquire(self, amount: float) -> float:
+        """block until amount fits, returns the seconds spent waiting."""
+        waited = 0.0
+        while True:
+            delay = self._charge(amount, min(amount, self.capacity))
+            if delay <= 0:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+    def adjust(self, amount: float) -> None:
+        """charge (positive) or refund (negative) the difference to an earlier estimate."""
+        self._charge(amount)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class AdaptiveConcurrency:
+    """AIMD limit on parallel calls.
+
+    The limit grows by one after a full window of successful calls and halves
+    on an overload response. Calls that were already in flight when the limit
+    was cut report the same congestion and do not cut it again. An overload
+    with a retry delay also holds back new calls until the delay has passed.
+    """
+
+    def __init__(self, initial: int = DEFAULT_INITIAL_CONCURRENCY, minimum: int = 1,
+                 maximum: int = DEFAULT_MAX_CONCURRENCY):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def slot(self):
+        """hold one of the parallel slots, yields the time the call started."""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    self._cond.wait(self._paused_until - now)
+                elif self._in_flight < int(self.limit):
+                    break
+                else:
+                    self._cond.wait()
+            self._in_flight += 1
+        try:
+            yield time.monotonic()
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    def on_success(self) -> None:
+        with self._cond:
+            if self.limit < self.maximum:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+                self._cond.notify_all()
+
+    def on_overload(self, started: float, retry_after: Optional[float]) -> None:
+        with self._cond:
+            now = time.monotonic()
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+            if started >= self._last_decrease:
+                self.limit = max(float(self.minimum), self.limit / 2)
+                self._last_decrease = now
+            self._cond.notify_all()
+
+
+class RateLimiter:
+    """requests/min, tokens/min and upload bandwidth budgets plus adaptive concurrency.
+
+    One instance is shared by the API server and the batch runner (see
+    get_default_limiter), so every model call and upload in the process draws
+    from the same quota. With state_path the budgets are also shared with
+    every other process pointed at that file; concurrency stays per process.
+    """
+
+    def __init__(self, rpm: float = DEFAULT_RPM, tpm: float = DEFAULT_TPM,
+                 upload_bytes_per_second: float = DEFAULT_UPLOAD_BYTES_PER_SECOND,
+                 initial_concurrency: int = DEFAULT_INITIAL_CONCURRENCY,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 state_path: str = DEFAULT_STATE_PATH):
+        self.state_path = state_path
+        self.requests = self._bucket("requests", rpm / 60, rpm * BURST_FRACTION) if rpm > 0 else None
+        self.tokens = self._bucket("tokens", tpm / 60, tpm * BURST_FRACTION) if tpm > 0 else None
+        self.uploads = (self._bucket("uploads", upload_bytes_per_second, upload_bytes_per_second)
+                        if upload_bytes_per_second > 0 else None)
+        self.concurrency = AdaptiveConcurrency(initial_concurrency, 1, max_concurrency)
+        self.max_attempts = max(1, max_attempts)
+        self.throttled = 0
+
+    def _bucket(self, name: str, rate_per_second: float, capacity: float):
+        if self.state_path:
+            return SharedTokenBucket(self.state_path, name, rate_per_second, capacity)
+        return TokenBucket(rate_per_second, capacity)
+
+    def call(self, fn: Callable, tokens: int = 0,
+             used_tokens: Optional[Callable[[object], Optional[int]]] = None, label: str = "request"):
+        """run fn within the budgets and the concurrency limit, retrying on 429/503.
+
+        tokens is the estimated prompt size reserved up front; used_tokens reads
+        the real count from the result so the reservation can be corrected.
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            queued = time.perf_counter()
+            with self.concurrency.slot() as started:
+                if self.requests is not None:
+                    self.requests.acquire(1)
+                if self.tokens is not None and tokens:
+                    self.tokens.acquire(tokens)
+                STAGE_SECONDS.observe(time.perf_counter() - queued, stage="throttle")
+                try:
+                    result = fn()
+                except Exception as e:
+                    if not is_overloaded(e) or attempt == self.max_attempts:
+                        raise
+                    delay = retry_after_seconds(e)
+                    self.concurrency.on_overload(started, delay)
+                    if self.tokens is not None and tokens:
+                        # a rejected request does not spend token quota
+                        self.tokens.adjust(-tokens)
+                    code = status_code(e)
+                else:
+                    self.concurrency.on_success()
+                    if self.tokens is not None and used_tokens is not None:
+                        used = used_tokens(result)
+                        if used is not None:
+                            self.tokens.adjust(used - tokens)
+                    return result
+
+            if delay is None:
+                delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempt - 1)) * random.uniform(0.5, 1)
+            self.throttled += 1
+            RETRIES.inc(reason="rate_limited")
+            print(f"   {label}: throttled ({code}), retry {attempt}/{self.max_attempts - 1} in {delay:.1f}s, "
+                  f"concurrency now {int(self.concurrency.limit)}")
+            time.sleep(delay)
+
+    def acquire_upload(self, size: int) -> None:
+        """wait for upload bandwidth before sending size bytes."""
+        if self.uploads is not None and size:
+            self.uploads.acquire(size)
+
+
+_default_limiter: Optional[RateLimiter] = None
+_default_limiter_lock = threading.Lock()
+
+
+def get_default_limiter() -> RateLimiter:
+    """process-wide limiter, configured from the RATE_LIMIT_* environment variables."""
+    global _default_limiter
+    with _default_limiter_lock:
+        if _default_limiter is None:
+            _default_limiter = RateLimiter()
+        return _default_limiter
+
+
+def configure_default_limiter(**kwargs) -> RateLimiter:
+    """replace the process-wide limiter, e.g. with budgets from command line flags."""
+    global _default_limiter
+    with _default_limiter_lock:
+        _default_limiter = RateLimiter(**kwargs)
+        return _default_limiter
@@ -0,0 +1,148 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Iterator, NamedTuple, Optional
+
+# raw model output is the source of truth for offline re-validation, so unlike
+# the result cache it is never evicted; override with RESPONSE_STORE_PATH
+DEFAULT_RESPONSE_STORE_PATH = os.getenv("RESPONSE_STORE_PATH", os.path.join(".cache", "analysis_responses.sqlite"))
+
+
+def response_store_enabled() -> bool:
+    return os.getenv("RESPONSE_STORE", "on").lower() not in ("0", "off", "false", "no")
+
+
+def prompt_sha(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+class ResponseRecord(NamedTuple):
+    """which video a response belongs to and how it was requested."""
+    # "analysis" (CreativeAnalysis) or "hook" (HookAnalysis)
+    kind: str
+    content_hash: Optional[str]
+    # path or upload filename, for exports
+    source: Optional[str] = None
+    # the make_cache_key variant, e.g. "profile=fast" or "hook=3"
+    variant: str = ""
+
+
+class StoredResponse(NamedTuple):
+    id: int
+    kind: str
+    content_hash: Optional[str]
+    source: Optional[str]
+    variant: str
+    model_id: str
+    prompt_sha: str
+    schema_version: str
+    engine: str
+    raw: str
+    valid: bool
+    error: Optional[str]
+    created_at: float
+
+
+class ResponseStore:
+    """append-only SQLite log of raw JSON responses with model id and schema version.
+
+    Every structured response is kept, including ones that failed validation,
+    so a schema change can be applied to the stored text with
+    migrate_results.py instead of calling the model again.
+    """
+
+    def __init__(self, path: str = DEFAULT_RESPONSE_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                content_hash TEXT,
+                source TEXT,
+                variant TEXT NOT NULL,
+                model_id TEXT NOT NULL,
+                prompt_sha TEXT NOT NULL,
+                schema_version TEXT NOT NULL,
+                engine TEXT NOT NULL,
+                raw TEXT NOT NULL,
+                valid INTEGER NOT NULL,
+                error TEXT,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_video ON responses(kind, content_hash, variant)")
+        self._conn.commit()
+
+    def record(self, record: ResponseRecord, raw: str, model_id: str, prompt: str, schema_version: str,
+               engine: str, error: Optional[Exception] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO responses (kind, content_hash, source, variant, model_id, prompt_sha, schema_version,"
+                " engine, raw, valid, error, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (record.kind, record.content_hash, record.source, record.variant, model_id, prompt_sha(prompt),
+                 schema_version, engine, raw, error is None, None if error is None else str(error)[:2000],
+                 time.time()),
+            )
+            self._conn.commit()
+
+    def latest(self, kind: Optional[str] = None) -> Iterator[StoredResponse]:
+        """the newest response per video and variant (by content hash, else by source)."""
+        query = (
+            "SELECT * FROM responses WHERE id IN (SELECT MAX(id) FROM responses"
+            " GROUP BY kind, COALESCE(content_hash, source), variant)"
+        )
+        params = ()
+        if kind is not None:
+            query += " AND kind = ?"
+            params = (kind,)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY id", params).fetchall()
+        for row in rows:
+            row = list(row)
+            row[10] = bool(row[10])
+            yield StoredResponse(*row)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_default_store: Optional[ResponseStore] = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_response_store() -> Optional[ResponseStore]:
+    """shared store for main.py and batch_runner.py, disabled with RESPONSE_STORE=off."""
+    global _default_store
+    if not response_store_enabled():
+        return None
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = ResponseStore()
+        return _default_store
+
+
+def configure_default_response_store(path: str) -> Optional[ResponseStore]:
+    """point the shared store somewhere else, e.g. next to batch outputs."""
+    global _default_store
+    if not response_store_enabled():
+        return None
+    with _default_store_lock:
+        if _default_store is not None and _default_store.path != path:
+            _default_store.close()
+            _default_store = None
+        if _default_store is None:
+            _default_store = ResponseStore(path)
+        return _default_store
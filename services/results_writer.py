@@ -0,0 +1,160 @@
+import os
+import csv
+import json
+from typing import Callable, Dict, List, Optional, Type
+from pydantic import BaseModel
+from data_models.CreativeAdsAnalysis import CreativeAnalysis
+
+
+def csv_fieldnames(model: Type[BaseModel] = CreativeAnalysis) -> List[str]:
+    # setup output CSV from pydantic model
+    return ["filename"] + list(model.model_fields.keys())
+
+
+def flatten_row(analysis: BaseModel, filename: str) -> Dict[str, object]:
+    #mode=json ensures Enums are converted to strings instead of python objects
+    row_data = analysis.model_dump(mode="json")
+
+    # CSVs can't handle lists like list[str] or list[Enum]
+    # We must join them into a single string.
+    for key, value in row_data.items():
+        if isinstance(value, list):
+            row_data[key] = ", ".join(str(x) for x in value)
+
+    row_data["filename"] = filename
+    return row_data
+
+
+class CsvResultWriter:
+    """appends one row per finished video and flushes it straight to disk."""
+
+    def __init__(self, path: str, fieldnames: List[str], append: bool = False,
+                 on_flushed: Optional[Callable[[List[str]], None]] = None):
+        self.path = path
+        self.fieldnames = fieldnames
+        self.on_flushed = on_flushed
+        self.rows_written = 0
+        write_header = not (append and os.path.exists(path) and os.path.getsize(path) > 0)
+        if not write_header:
+            # appended rows must line up with the header already in the file
+            with open(path, newline="", encoding="utf-8") as f:
+                existing = next(csv.reader(f), None)
+            if existing and existing != fieldnames:
+                dropped = [name for name in fieldnames if name not in existing]
+                if dropped:
+                    print(f"Warning: {path} has no {', '.join(dropped)} column(s), those values are not written.")
+                self.fieldnames = fieldnames = existing
+        self._file = open(path, "a" if append else "w", newline="", encoding="utf-8")
+        # extra columns added by later stages are dropped rather than failing the row
+        self._writer = csv.DictWriter(self._file, fieldnames=fieldnames, extrasaction="ignore")
+        if write_header:
+            self._writer.writeheader()
+            self._file.flush()
+
+    def write(self, row: Dict[str, object]) -> None:
+        self._writer.writerow(row)
+        self._file.flush()
+        self.rows_written += 1
+
+    def write_result(self, analysis: BaseModel, filename: str,
+                     extra: Optional[Dict[str, object]] = None, source_path: Optional[str] = None) -> None:
+        row = flatten_row(analysis, filename)
+        row.update(extra or {})
+        self.write(row)
+        if self.on_flushed is not None and source_path is not None:
+            self.on_flushed([source_path])
+
+    def flush(self) -> None:
+        # rows are already flushed as they are written, kept for parity with ParquetResultWriter
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def merge_csv_shards(shards: Dict[str, str], path: str, keep: Callable[[str, str], bool]) -> int:
+    """combine per-worker CSVs (worker -> path) into one file sorted by filename.
+
+    keep(worker, filename) decides which worker's row counts when a video was
+    written twice, e.g. after a lease ran out; within one shard the last row wins.
+    """
+    fieldnames: List[str] = []
+    rows: Dict[str, Dict[str, str]] = {}
+    for worker, shard in sorted(shards.items()):
+        with open(shard, newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            # shards can differ in extra columns, the merged header is their union
+            fieldnames += [name for name in reader.fieldnames or [] if name not in fieldnames]
+            for row in reader:
+                if keep(worker, row["filename"]):
+                    rows[row["filename"]] = row
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        for filename in sorted(rows):
+            writer.writerow(rows[filename])
+    return len(rows)
+
+
+class RunManifest:
+    """JSON-lines record of finished inputs (filename, size, mtime) used by --resume.
+
+    A video counts as done only while its size and mtime match the recorded
+    ones, so a re-rendered file with the same name is analysed again.
+    """
+
+    def __init__(self, path: str, reset: bool = False):
+        self.path = path
+        self._done: Dict[str, tuple] = {}
+        if reset and os.path.exists(path):
+            os.remove(path)
+        if os.path.exists(path):
+            self._load()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _load(self) -> None:
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # a torn last line from a crash, the video is simply redone
+                    continue
+                self._done[entry["filename"]] = (entry["size"], entry["mtime"])
+
+    @staticmethod
+    def _signature(video_path: str) -> tuple:
+        stat = os.stat(video_path)
+        return stat.st_size, stat.st_mtime_ns
+
+    def is_done(self, video_path: str, key: Optional[str] = None) -> bool:
+        key = key or os.path.basename(video_path)
+        recorded = self._done.get(key)
+        if recorded is None:
+            return False
+        try:
+            return tuple(recorded) == self._signature(video_path)
+        except OSError:
+            return False
+
+    def mark_done(self, video_path: str, key: Optional[str] = None) -> None:
+        key = key or os.path.basename(video_path)
+        size, mtime = self._signature(video_path)
+        self._done[key] = (size, mtime)
+        self._file.write(json.dumps({"filename": key, "size": size, "mtime": mtime}) + "\n")
+        self._file.flush()
+
+    def __len__(self) -> int:
+        return len(self._done)
+
+    def close(self) -> None:
+        self._file.close()
@@ -0,0 +1,47 @@
+import typing
+from enum import Enum
+from typing import Dict, Type
+from pydantic import BaseModel
+from data_models.CreativeAdsAnalysis import CreativeAnalysis
+
+
+def _unwrap(annotation):
+    """strip Optional[...] and return (inner type, is_list)."""
+    origin = typing.get_origin(annotation)
+    if origin is typing.Union:
+        args = [a for a in typing.get_args(annotation) if a is not type(None)]
+        if len(args) == 1:
+            return _unwrap(args[0])
+    if origin in (list, typing.List):
+        (inner,) = typing.get_args(annotation)
+        return inner, True
+    return annotation, False
+
+
+def _is_enum(tp) -> bool:
+    return isinstance(tp, type) and issubclass(tp, Enum)
+
+
+def single_enum_fields(model: Type[BaseModel] = CreativeAnalysis) -> Dict[str, Type[Enum]]:
+    """fields holding one enum value (possibly None), e.g. art_style -> ArtStyle."""
+    fields = {}
+    for name, info in model.model_fields.items():
+        inner, is_list = _unwrap(info.annotation)
+        if _is_enum(inner) and not is_list:
+            fields[name] = inner
+    return fields
+
+
+def multi_enum_fields(model: Type[BaseModel] = CreativeAnalysis) -> Dict[str, Type[Enum]]:
+    """list-of-enum fields, e.g. mechanics_present -> GameplayMechanic."""
+    fields = {}
+    for name, info in model.model_fields.items():
+        inner, is_list = _unwrap(info.annotation)
+        if _is_enum(inner) and is_list:
+            fields[name] = inner
+    return fields
+
+
+def enum_values(enum_cls: Type[Enum]) -> list:
+    # declaration order, which also fixes bit positions in multi-hot encodings
+    return [member.value for member in enum_cls]
@@ -0,0 +1,47 @@
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, TypeVar
+from services.metrics import COALESCED
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """runs one call per key at a time, concurrent callers with the same key share its outcome.
+
+    The first caller (the leader) runs fn; callers arriving while it is in
+    flight block on the leader's future and get the same result or the same
+    exception. The key is released when the call ends, so later requests go
+    through normally and hit the result cache instead.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[..., T], *args, kind: str = "analysis") -> T:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+
+        if not leader:
+            COALESCED.inc(kind=kind)
+            return future.result()
+
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
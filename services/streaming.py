@@ -0,0 +1,90 @@
+import io
+import os
+import hashlib
+from typing import Optional
+from services.metrics import stage_timer
+
+# resumable upload chunks must be multiples of 256 KiB except the last one
+UPLOAD_GRANULARITY = 256 * 1024
+DEFAULT_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+
+
+class HashingReader(io.RawIOBase):
+    """read-through wrapper that hashes bytes as the uploader consumes them.
+
+    Reads are capped at chunk_size, so the uploader never holds more than one
+    chunk of the video in memory. The SDK seeks to measure the stream before
+    uploading; only bytes read in order from the start feed the digest, so
+    content_hash is available once the whole stream has passed through.
+    """
+
+    def __init__(self, raw, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        super().__init__()
+        self._raw = raw
+        self.chunk_size = max(UPLOAD_GRANULARITY, chunk_size - chunk_size % UPLOAD_GRANULARITY)
+        self._digest = hashlib.sha256()
+        self._hashed_upto = 0
+        self._size: Optional[int] = None
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return self._raw.seekable()
+
+    def tell(self) -> int:
+        return self._raw.tell()
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        position = self._raw.seek(offset, whence)
+        if whence == io.SEEK_END and offset == 0:
+            self._size = position
+        return position
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0 or size > self.chunk_size:
+            size = self.chunk_size
+        start = self._raw.tell()
+        # fill the whole chunk, short reads would break the upload granularity
+        parts = []
+        remaining = size
+        while remaining > 0:
+            data = self._raw.read(remaining)
+            if not data:
+                break
+            parts.append(data)
+            remaining -= len(data)
+        data = b"".join(parts)
+
+        # only extend the digest with bytes directly following what is already hashed
+        if start <= self._hashed_upto < start + len(data):
+            self._digest.update(data[self._hashed_upto - start:])
+            self._hashed_upto = start + len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    @property
+    def bytes_hashed(self) -> int:
+        return self._hashed_upto
+
+    @property
+    def content_hash(self) -> Optional[str]:
+        """sha256 of the full stream, or None if it was not read to the end."""
+        if self._size is None or self._hashed_upto != self._size:
+            return None
+        return self._digest.hexdigest()
+
+
+def stream_sha256(stream, chunk_size: int = DEFAULT_CHUNK_SIZE) -> str:
+    """hash a seekable upload body up front and rewind it, same digest as file_sha256 for the same bytes."""
+    digest = hashlib.sha256()
+    stream.seek(0)
+    with stage_timer("hash"):
+        for chunk in iter(lambda: stream.read(chunk_size), b""):
+            digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
@@ -0,0 +1,341 @@
+import os
+import re
+import csv
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+from data_models.CreativeAdsAnalysis import CreativeAnalysis
+from services.schema_fields import enum_values, multi_enum_fields, single_enum_fields
+
+try:
+    # compressed (roaring) bitsets when available
+    from pyroaring import BitMap
+except ImportError:
+    BitMap = None
+
+# boolean fields are indexed as a tag that is present when the field is True
+BOOL_TAGS = [name for name, info in CreativeAnalysis.model_fields.items() if info.annotation is bool]
+
+
+# ---- bitset helpers: pyroaring BitMap, or a plain Python int as fallback ----
+
+def _from_ids(ids: Iterable[int]):
+    if BitMap is not None:
+        return BitMap(ids)
+    ids = list(ids)
+    if not ids:
+        return 0
+    # build the whole int at once, setting bits one by one would copy it per id
+    buffer = bytearray(max(ids) // 8 + 1)
+    for i in ids:
+        buffer[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(buffer, "little")
+
+
+def _empty():
+    return BitMap() if BitMap is not None else 0
+
+
+def _difference(a, b):
+    return a - b if BitMap is not None else a & ~b
+
+
+def _to_ids(bitset) -> List[int]:
+    if BitMap is not None:
+        return list(bitset)
+    ids = []
+    data = bitset.to_bytes((bitset.bit_length() + 7) // 8, "little")
+    for byte_index, byte in enumerate(data):
+        while byte:
+            low = byte & -byte
+            ids.append(byte_index * 8 + low.bit_length() - 1)
+            byte ^= low
+    return ids
+
+
+def _count(bitset) -> int:
+    return len(bitset) if BitMap is not None else bin(bitset).count("1")
+
+
+def _same_csv(f, stat, header_line: bytes, offset: int, signature) -> bool:
+    """true when the file still starts with what was read up to offset.
+
+    mtime moves on every append, so the last row read stands in for it: a rewrite
+    in place ("w" keeps the inode) almost never puts the same row at the same offset.
+    """
+    inode, header, last_row = signature
+    if stat.st_ino != inode or header_line != header or stat.st_size < offset:
+        return False
+    if not last_row:
+        return True
+    f.seek(offset - len(last_row))
+    same = f.read(len(last_row)) == last_row
+    f.seek(len(header_line))
+    return same
+
+
+class QuerySyntaxError(ValueError):
+    """the search expression could not be parsed."""
+
+
+class TagIndex:
+    """inverted index: every enum value (and bool field) -> bitset of creative ids.
+
+    Boolean queries such as
+        Genre_ArcadeIdle AND Mechanic_Digging AND Fail_Physics AND NOT VO_Human_Pro
+    are answered with bitset AND/OR/NOT, so their cost depends on the bitsets,
+    not on a scan of every row. Results are added incrementally, either one at
+    a time (add) or by re-reading only the new part of the batch outputs (refresh).
+    """
+
+    def __init__(self):
+        self._single = single_enum_fields()
+        self._multi = multi_enum_fields()
+        self.known_tags = set(BOOL_TAGS)
+        for cls in list(self._single.values()) + list(self._multi.values()):
+            self.known_tags.update(enum_values(cls))
+
+        self.filenames: List[str] = []
+        self._id_of: Dict[str, int] = {}
+        self._tags_of: List[Tuple[str, ...]] = []
+        self._bitsets: Dict[str, object] = {}
+        self._universe = _empty()
+        # source path -> CSV (offset, signature), or set of Parquet parts already read
+        self._progress: Dict[str, object] = {}
+        # creative id -> source file that last tagged it, so a rewritten file can be dropped
+        self._source_of: Dict[int, str] = {}
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._id_of)
+
+    # ---- building ----
+
+    def _tags_from_dump(self, data: dict) -> Tuple[str, ...]:
+        tags = []
+        for name in self._single:
+            if data.get(name):
+                tags.append(data[name])
+        for name in self._multi:
+            tags.extend(data.get(name) or [])
+        for name in BOOL_TAGS:
+            if data.get(name):
+                tags.append(name)
+        return tuple(tags)
+
+    def add(self, filename: str, analysis: CreativeAnalysis) -> None:
+        self.add_many([(filename, self._tags_from_dump(analysis.model_dump(mode="json")))])
+
+    def add_many(self, entries: Iterable[Tuple[str, Tuple[str, ...]]], source: Optional[str] = None) -> int:
+        """index (filename, tags) pairs; a filename seen before is re-tagged."""
+        new_ids: Dict[str, List[int]] = defaultdict(list)
+        all_new: List[int] = []
+        added = 0
+        with self._lock:
+            for filename, tags in entries:
+                creative_id = self._id_of.get(filename)
+                if creative_id is not None:
+                    self._remove_tags(creative_id)
+                    self._tags_of[creative_id] = tags
+                else:
+                    creative_id = len(self.filenames)
+                    self._id_of[filename] = creative_id
+                    self.filenames.append(filename)
+                    self._tags_of.append(tags)
+                if source is not None:
+                    self._source_of[creative_id] = source
+                else:
+                    self._source_of.pop(creative_id, None)
+                for tag in tags:
+                    new_ids[tag].append(creative_id)
+                all_new.append(creative_id)
+                added += 1
+
+            # one bulk OR per tag per batch keeps loading linear
+            for tag, ids in new_ids.items():
+                self._bitsets[tag] = self._bitsets.get(tag, _empty()) | _from_ids(ids)
+            self._universe = self._universe | _from_ids(all_new)
+        return added
+
+    def _remove_tags(self, creative_id: int) -> None:
+        single = _from_ids([creative_id])
+        for tag in self._tags_of[creative_id]:
+            self._bitsets[tag] = _difference(self._bitsets[tag], single)
+
+    def _drop_source(self, source: str) -> None:
+        """forget every creative last read from source."""
+        stale = [i for i, owner in self._source_of.items() if owner == source]
+        for creative_id in stale:
+            self._remove_tags(creative_id)
+            self._tags_of[creative_id] = ()
+            del self._id_of[self.filenames[creative_id]]
+            del self._source_of[creative_id]
+        self._universe = _difference(self._universe, _from_ids(stale))
+
+    def refresh(self, sources: Iterable[str]) -> int:
+        """read only rows appended since the last call from CSV files or Parquet datasets."""
+        added = 0
+        for source in sources:
+            if os.path.isdir(source) or source.endswith(".parquet"):
+                added += self._load_parquet(source)
+            elif os.path.exists(source):
+                added += self._load_csv(source)
+        return added
+
+    def _load_csv(self, path: str) -> int:
+        with self._lock:
+            offset, signature = self._progress.get(path, (0, None))
+            entries = []
+            with open(path, "rb") as f:
+                stat = os.fstat(f.fileno())
+                header_line = f.readline()
+                if offset and not _same_csv(f, stat, header_line, offset, signature):
+                    # file was rewritten (fresh batch run, edit), its old rows are stale
+                    self._drop_source(path)
+                    offset, signature = 0, None
+                last_row = signature[2] if signature else None
+                if stat.st_size == offset:
+                    return 0
+                header = next(csv.reader([header_line.decode("utf-8-sig")]))
+                if offset:
+                    f.seek(offset)
+                while True:
+                    position = f.tell()
+                    line = f.readline()
+                    # rows can span lines when a quoted field holds a newline
+                    while line and line.count(b'"') % 2:
+                        more = f.readline()
+                        if not more:
+                            break
+                        line += more
+                    if not line.endswith(b"\n"):
+                        # nothing left, or a row still being written: pick it up next time
+                        f.seek(position)
+                        break
+                    last_row = line
+                    values = next(csv.reader([line.decode("utf-8")]), None)
+                    if values:
+                        entries.append(self._tags_from_csv(dict(zip(header, values))))
+                self._progress[path] = (f.tell(), (stat.st_ino, header_line, last_row))
+            return self.add_many(entries, source=path)
+
+    def _tags_from_csv(self, row: Dict[str, str]) -> Tuple[str, Tuple[str, ...]]:
+        data = {}
+        for name in self._single:
+            data[name] = row.get(name) or None
+        for name in self._multi:
+            data[name] = [v.strip() for v in (row.get(name) or "").split(",") if v.strip()]
+        for name in BOOL_TAGS:
+            data[name] = row.get(name) == "True"
+        return row["filename"], self._tags_from_dump(data)
+
+    def _load_parquet(self, path: str) -> int:
+        from services.columnar import dataset_parts, decode_multi_hot, enum_layout
+        import pyarrow.parquet as pq
+
+        parts = dataset_parts(path)
+        with self._lock:
+            seen = self._progress.setdefault(path, set())
+            entries = []
+            for part in parts:
+                if part in seen:
+                    continue
+                table = pq.read_table(part)
+                layout = enum_layout(table)["multi_hot"]
+                rows = table.to_pydict()
+                for i, filename in enumerate(rows["filename"]):
+                    data = {name: rows[name][i] for name in self._single}
+                    for name in self._multi:
+                        data[name] = decode_multi_hot(rows[name][i], layout[name])
+                    for name in BOOL_TAGS:
+                        data[name] = rows[name][i]
+                    entries.append((filename, self._tags_from_dump(data)))
+                seen.add(part)
+            return self.add_many(entries, source=path)
+
+    # ---- querying ----
+
+    def search(self, query: str, limit: Optional[int] = None) -> Tuple[int, List[str]]:
+        """evaluate a boolean tag query, returns (match count, filenames)."""
+        with self._lock:
+            bitset = _Parser(query, self).parse()
+            ids = _to_ids(bitset)
+            if limit is not None:
+                ids = ids[:limit]
+            return _count(bitset), [self.filenames[i] for i in ids]
+
+    def tag_counts(self) -> Dict[str, int]:
+        with self._lock:
+            return {tag: _count(bits) for tag, bits in self._bitsets.items()}
+
+    def _bitset_for(self, tag: str):
+        if tag not in self.known_tags:
+            raise QuerySyntaxError(f"Unknown tag '{tag}'")
+        return self._bitsets.get(tag, _empty())
+
+
+_TOKEN = re.compile(r"\s*(\(|\)|[A-Za-z0-9_]+)")
+
+
+class _Parser:
+    """recursive descent over: expr := term (OR term)*, term := factor (AND? factor)*,
+    factor := NOT factor | ( expr ) | TAG. Adjacent tags are ANDed."""
+
+    def __init__(self, query: str, index: TagIndex):
+        self.index = index
+        self.tokens = []
+        position = 0
+        query = query.rstrip()
+        while position < len(query):
+            match = _TOKEN.match(query, position)
+            if not match:
+                raise QuerySyntaxError(f"Unexpected input at position {position}: '{query[position:]}'")
+            self.tokens.append(match.group(1))
+            position = match.end()
+        self.pos = 0
+
+    def _peek(self) -> Optional[str]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _take(self) -> str:
+        token = self._peek()
+        if token is None:
+            raise QuerySyntaxError("Unexpected end of query")
+        self.pos += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise QuerySyntaxError("Empty query")
+        result = self._expr()
+        if self._peek() is not None:
+            raise QuerySyntaxError(f"Unexpected token '{self._peek()}'")
+        return result
+
+    def _expr(self):
+        result = self._term()
+        while (self._peek() or "").upper() == "OR":
+            self._take()
+            result = result | self._term()
+        return result
+
+    def _term(self):
+        result = self._factor()
+        while self._peek() is not None and self._peek() != ")" and self._peek().upper() != "OR":
+            if self._peek().upper() == "AND":
+                self._take()
+            result = result & self._factor()
+        return result
+
+    def _factor(self):
+        token = self._take()
+        if token.upper() == "NOT":
+            return _difference(self.index._universe, self._factor())
+        if token == "(":
+            result = self._expr()
+            if self._take() != ")":
+                raise QuerySyntaxError("Missing ')'")
+            return result
+        if token == ")":
+            raise QuerySyntaxError("Unexpected ')'")
+        return self.index._bitset_for(token)
@@ -0,0 +1,172 @@
+import os
+import time
+import threading
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# container formats the Gemini Files API accepts for video
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".m4v", ".avi", ".webm", ".wmv", ".flv", ".mpeg", ".mpg", ".3gp")
+# a file counts as fully written once its size and mtime held still this long
+DEFAULT_SETTLE_SECONDS = float(os.getenv("WATCH_SETTLE_SECONDS", "5"))
+# directory scan interval without filesystem events
+DEFAULT_POLL_SECONDS = float(os.getenv("WATCH_POLL_SECONDS", "2"))
+# safety rescan with events, catches anything an overflowing inotify queue dropped
+EVENT_RESCAN_SECONDS = 60.0
+# how often pending files are re-checked for stability
+CHECK_SECONDS = 0.5
+
+Signature = Tuple[int, int]
+
+
+def _is_video(name: str, extensions: Sequence[str]) -> bool:
+    # hidden files are usually partial copies (rsync, browsers)
+    return not name.startswith(".") and name.lower().endswith(tuple(extensions))
+
+
+def scan_videos(root: str, extensions: Sequence[str] = VIDEO_EXTENSIONS,
+                recursive: bool = False) -> Dict[str, Signature]:
+    """path -> (size, mtime_ns) of every video under root."""
+    found = {}
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive and not entry.name.startswith("."):
+                        stack.append(entry.path)
+                elif entry.is_file() and _is_video(entry.name, extensions):
+                    stat = entry.stat()
+                    found[entry.path] = (stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                # vanished between listing and stat
+                continue
+    return found
+
+
+def find_videos(root: str, extensions: Sequence[str] = VIDEO_EXTENSIONS, recursive: bool = False) -> List[str]:
+    return sorted(scan_videos(root, extensions, recursive))
+
+
+class FolderWatcher:
+    """yields videos under root once they are fully written, then keeps watching.
+
+    Filesystem events come from watchdog (inotify on Linux) when it is
+    installed; otherwise the folder is polled. Either way a changed path only
+    becomes a candidate, and it is handed out after its size and mtime have
+    stayed the same for settle_seconds. A file that is rewritten later is
+    handed out again.
+    """
+
+    def __init__(self, root: str, extensions: Sequence[str] = VIDEO_EXTENSIONS, recursive: bool = False,
+                 settle_seconds: float = DEFAULT_SETTLE_SECONDS, poll_seconds: float = DEFAULT_POLL_SECONDS,
+                 use_events: bool = True):
+        self.root = root
+        self.extensions = tuple(e.lower() for e in extensions)
+        self.recursive = recursive
+        self.settle_seconds = settle_seconds
+        self.poll_seconds = poll_seconds
+        self.use_events = use_events
+        self.mode = "polling"
+        # path -> (last seen signature, monotonic time it was first seen)
+        self._pending: Dict[str, Tuple[Optional[Signature], float]] = {}
+        self._emitted: Dict[str, Signature] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._observer = None
+
+    def _start_events(self) -> None:
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            return
+
+        watcher = self
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.is_directory:
+                    return
+                # moves report the new name in dest_path
+                watcher._touch(getattr(event, "dest_path", None) or event.src_path)
+
+        try:
+            observer = Observer()
+            observer.schedule(_Handler(), self.root, recursive=self.recursive)
+            observer.start()
+        except OSError as e:
+            # e.g. inotify watch limit reached, or a network mount without events
+            print(f"Filesystem events unavailable ({e}), polling {self.root}")
+            return
+        self._observer = observer
+        self.mode = "events"
+
+    def _touch(self, path) -> None:
+        if isinstance(path, bytes):
+            path = os.fsdecode(path)
+        if not _is_video(os.path.basename(path), self.extensions):
+            return
+        if not self.recursive and os.path.dirname(os.path.abspath(path)) != os.path.abspath(self.root):
+            return
+        with self._lock:
+            if path not in self._pending:
+                self._pending[path] = (None, time.monotonic())
+
+    def _rescan(self) -> None:
+        for path, signature in scan_videos(self.root, self.extensions, self.recursive).items():
+            if self._emitted.get(path) != signature:
+                self._touch(path)
+
+    def _settled(self) -> List[str]:
+        now = time.monotonic()
+        ready = []
+        with self._lock:
+            pending = list(self._pending.items())
+        for path, (seen, since) in pending:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                with self._lock:
+                    self._pending.pop(path, None)
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            with self._lock:
+                if signature != seen:
+                    # still being written (or first look), restart the clock
+                    self._pending[path] = (signature, now)
+                    continue
+                if now - since < self.settle_seconds or stat.st_size == 0:
+                    continue
+                del self._pending[path]
+                if self._emitted.get(path) != signature:
+                    self._emitted[path] = signature
+                    ready.append(path)
+        return sorted(ready)
+
+    def paths(self) -> Iterator[str]:
+        """existing videos first, then new or rewritten ones as they settle, until stop()."""
+        if self.use_events:
+            self._start_events()
+        print(f"Watching {self.root} ({self.mode}{', recursive' if self.recursive else ''}, "
+              f"settle {self.settle_seconds:g}s)")
+        rescan_every = EVENT_RESCAN_SECONDS if self._observer is not None else self.poll_seconds
+        next_scan = 0.0
+        try:
+            while not self._stopped.is_set():
+                if time.monotonic() >= next_scan:
+                    self._rescan()
+                    next_scan = time.monotonic() + rescan_every
+                for path in self._settled():
+                    yield path
+                self._stopped.wait(CHECK_SECONDS)
+        finally:
+            if self._observer is not None:
+                self._observer.stop()
+                self._observer.join(timeout=5)
+
+    def stop(self) -> None:
+        self._stopped.set()
@@ -0,0 +1,233 @@
+import os
+import re
+import time
+import random
+import socket
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from services.metrics import RETRIES
+
+# a claim lives this long without renewal, then another worker may take the video over
+DEFAULT_LEASE_SECONDS = float(os.getenv("QUEUE_LEASE_SECONDS", "120"))
+# failed analyses are retried by whichever worker claims them next, up to this many attempts
+DEFAULT_MAX_ATTEMPTS = int(os.getenv("QUEUE_MAX_ATTEMPTS", "3"))
+# how often an idle worker asks again while other workers still hold claims
+DEFAULT_POLL_SECONDS = 2.0
+# how long a write waits for other workers' transactions before giving up
+BUSY_TIMEOUT_SECONDS = 30.0
+
+
+def default_worker_id() -> str:
+    # container hostnames differ per replica, the pid separates processes on one host
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def safe_worker_id(worker_id: str) -> str:
+    """worker ids double as shard directory names."""
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", worker_id) or "worker"
+
+
+class WorkQueue:
+    """SQLite table of videos that several batch_runner processes claim from.
+
+    Each video is one row keyed by its path relative to the input folder,
+    with the (size, mtime) signature it was queued with. A claim is a lease:
+    the worker renews it while the video is in flight, and when a worker dies
+    its leases run out and the videos go back to whoever claims next. Claims
+    happen inside BEGIN IMMEDIATE transactions, so two workers never get the
+    same video while its lease is live. Needs a local filesystem; SQLite
+    locking is unreliable on network mounts.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # autocommit with no busy handler, _retry() waits instead: SQLite's own handler
+        # backs off to long sleeps and lets one busy worker starve the others
+        self._conn = sqlite3.connect(path, timeout=0, check_same_thread=False, isolation_level=None)
+        self._retry(lambda: self._conn.execute("PRAGMA journal_mode=WAL"))
+        with self._write():
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS tasks (
+                    key TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    owner TEXT,
+                    lease_until REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status, lease_until)")
+
+    @staticmethod
+    def _retry(fn):
+        deadline = time.monotonic() + BUSY_TIMEOUT_SECONDS
+        while True:
+            try:
+                return fn()
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e) or time.monotonic() > deadline:
+                    raise
+            # a few ms with jitter, so waiting workers take turns
+            time.sleep(random.uniform(0.001, 0.01))
+
+    @contextmanager
+    def _write(self):
+        """one IMMEDIATE transaction at a time per process."""
+        with self._lock:
+            self._retry(lambda: self._conn.execute("BEGIN IMMEDIATE"))
+            try:
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def enqueue(self, items: Iterable[Tuple[str, int, int]]) -> int:
+        """add (key, size, mtime_ns) rows; new, changed and failed videos become pending.
+
+        Every worker may enqueue the same scan, unchanged videos are left as
+        they are. Failed ones get a fresh set of attempts, as with --resume.
+        """
+        now = time.time()
+        added = 0
+        with self._write():
+            for key, size, mtime_ns in items:
+                row = self._conn.execute("SELECT size, mtime_ns, status FROM tasks WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self._conn.execute(
+                        "INSERT INTO tasks (key, size, mtime_ns, status, updated_at) VALUES (?, ?, ?, 'pending', ?)",
+                        (key, size, mtime_ns, now))
+                    added += 1
+                elif tuple(row[:2]) != (size, mtime_ns) or row[2] == "failed":
+                    # re-rendered since it was queued, or out of attempts in an earlier run
+                    self._conn.execute(
+                        "UPDATE tasks SET size = ?, mtime_ns = ?, status = 'pending', owner = NULL,"
+                        " lease_until = NULL, attempts = 0, error = NULL, updated_at = ? WHERE key = ?",
+                        (size, mtime_ns, now, key))
+                    added += 1
+        return added
+
+    def claim(self, owner: str, limit: int = 1) -> List[str]:
+        """lease up to limit pending videos, or ones whose lease ran out, to owner."""
+        with self._write():
+            now = time.time()
+            rows = self._conn.execute(
+                "SELECT key, status FROM tasks WHERE status = 'pending'"
+                " OR (status = 'claimed' AND lease_until < ?) ORDER BY attempts, key LIMIT ?",
+                (now, limit)).fetchall()
+            for key, _ in rows:
+                self._conn.execute(
+                    "UPDATE tasks SET status = 'claimed', owner = ?, lease_until = ?, attempts = attempts + 1,"
+                    " updated_at = ? WHERE key = ?", (owner, now + self.lease_seconds, now, key))
+        for key, status in rows:
+            if status == "claimed":
+                print(f"Reclaimed {key}, the previous worker's lease expired")
+                RETRIES.inc(reason="lease_expired")
+        return [key for key, _ in rows]
+
+    def renew(self, owner: str) -> int:
+        """extend every live claim of owner, returns how many were renewed."""
+        with self._write():
+            now = time.time()
+            cursor = self._conn.execute(
+                "UPDATE tasks SET lease_until = ?, updated_at = ? WHERE owner = ? AND status = 'claimed'",
+                (now + self.lease_seconds, now, owner))
+        return cursor.rowcount
+
+    def _finish(self, owner: str, key: str, status: str, error: Optional[str] = None) -> bool:
+        # "retry" is decided by the same UPDATE, from the attempts of the claim being finished
+        if status == "retry":
+            new_status, params = "CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END", (self.max_attempts,)
+        else:
+            new_status, params = "?", (status,)
+        with self._write():
+            cursor = self._conn.execute(
+                f"UPDATE tasks SET status = {new_status}, lease_until = NULL, error = ?, updated_at = ?"
+                " WHERE key = ? AND owner = ? AND status = 'claimed'",
+                params + (error, time.time(), key, owner))
+        if cursor.rowcount == 0:
+            # the lease ran out and another worker took over, its result wins at finalize
+            print(f"Warning: lost the claim on {key} before finishing it")
+            return False
+        return True
+
+    def complete(self, owner: str, key: str) -> bool:
+        return self._finish(owner, key, "done")
+
+    def reject(self, owner: str, key: str, reason: str) -> bool:
+        """a video that will never analyse (probe), not retried."""
+        return self._finish(owner, key, "rejected", reason)
+
+    def fail(self, owner: str, key: str, error: str) -> bool:
+        """give the video back for another attempt, or mark it failed once attempts run out."""
+        return self._finish(owner, key, "retry", error)
+
+    def counts(self) -> Dict[str, int]:
+        # WAL readers never wait for writers
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall())
+
+    def done_owners(self) -> Dict[str, str]:
+        """key -> the worker whose shard holds the accepted row."""
+        with self._lock:
+            return dict(self._conn.execute("SELECT key, owner FROM tasks WHERE status = 'done'").fetchall())
+
+    def claims(self, owner: str, poll_seconds: float = DEFAULT_POLL_SECONDS,
+               stop: Optional[threading.Event] = None) -> Iterator[str]:
+        """claim videos one at a time as the caller asks for them.
+
+        Ends once nothing is pending or claimed anywhere. While other workers
+        still hold claims it keeps polling, so videos from a crashed worker
+        are picked up once their lease expires.
+        """
+        while stop is None or not stop.is_set():
+            claimed = self.claim(owner)
+            if claimed:
+                yield claimed[0]
+                continue
+            counts = self.counts()
+            if not counts.get("pending") and not counts.get("claimed"):
+                return
+            time.sleep(poll_seconds)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class LeaseRenewer:
+    """background thread renewing a worker's claims every third of the lease."""
+
+    def __init__(self, queue: WorkQueue, owner: str):
+        self.queue = queue
+        self.owner = owner
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="lease-renewer", daemon=True)
+
+    def _loop(self) -> None:
+        while not self._stopped.wait(self.queue.lease_seconds / 3):
+            try:
+                self.queue.renew(self.owner)
+            except sqlite3.Error as e:
+                # retried at the next tick, well before the lease runs out
+                print(f"Warning: lease renewal failed ({e})")
+
+    def start(self) -> "LeaseRenewer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join(timeout=5)
@@ -0,0 +1,49 @@
+import os
+import sys
+import pytest
+
+# tests run offline against services.fakes, nothing may reach the real API or the shared .cache/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GOOGLE_API_KEY", "offline-tests")
+os.environ["RESPONSE_STORE"] = "off"
+
+from services import analyzer  # noqa: E402
+from services.cache import ResultCache  # noqa: E402
+from services.fakes import FakeGenaiClient, FakeStructuredLLM  # noqa: E402
+from services.file_registry import RemoteFileRegistry  # noqa: E402
+from services.file_tracker import FileReadinessTracker  # noqa: E402
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    """a fresh FakeGenaiClient wired into the analyzer, files turn ACTIVE almost at once."""
+    client = FakeGenaiClient()
+    analyzer.configure_backend(client, FakeStructuredLLM(client))
+    # the default first poll waits half a second
+    monkeypatch.setattr(analyzer, "_file_tracker", FileReadinessTracker(client, initial_delay=0.01))
+    return client
+
+
+@pytest.fixture
+def cache(tmp_path):
+    result_cache = ResultCache(str(tmp_path / "cache.sqlite"))
+    yield result_cache
+    result_cache.close()
+
+
+@pytest.fixture
+def registry(fake, tmp_path):
+    remote_files = RemoteFileRegistry(fake, str(tmp_path / "remote_files.sqlite"))
+    yield remote_files
+    remote_files.close()
+
+
+@pytest.fixture
+def videos(tmp_path):
+    """three small files with distinct bytes, the fakes never decode them."""
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"video_{i}.mp4"
+        path.write_bytes(bytes([i]) * 4096)
+        paths.append(str(path))
+    return paths
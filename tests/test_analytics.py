@@ -0,0 +1,41 @@
+import os
+import numpy as np
+import pytest
+from services.fakes import sample_analysis
+
+pytest.importorskip("pyarrow")
+
+from services.analytics import cooccurrence, encode, lift, load_table  # noqa: E402
+from services.columnar import ParquetResultWriter  # noqa: E402
+
+
+def write(path, analyses, **kwargs):
+    with ParquetResultWriter(path, **kwargs) as writer:
+        for i, analysis in enumerate(analyses):
+            writer.write_result(analysis, f"v{i}.mp4")
+
+
+def test_cooccurrence_and_lift(tmp_path):
+    path = str(tmp_path / "results.parquet")
+    write(path, [sample_analysis(0), sample_analysis(0), sample_analysis(1)])
+    matrix, vocab = encode(load_table(path))
+    counts = cooccurrence(matrix)
+    genre = vocab.columns.index(sample_analysis(0).primary_genre.value)
+    assert counts[genre, genre] == 2
+    # always together with itself: P(a,a) / P(a)^2 = 1 / P(a)
+    assert lift(counts, 3)[genre, genre] == pytest.approx(1.5)
+    assert np.array_equal(counts, counts.T)
+
+
+def test_load_table_handles_appended_parts_and_an_empty_dataset(tmp_path):
+    path = str(tmp_path / "results.parquet")
+    os.makedirs(path)
+    assert load_table(path).num_rows == 0
+
+    write(path, [sample_analysis(0)], append=True)
+    write(path, [sample_analysis(0)], append=True, extra_columns=["cluster_id"])
+    table = load_table(path)
+    matrix, _ = encode(table)
+    assert table.num_rows == 2
+    assert table.column("cluster_id").to_pylist() == [None, None]
+    assert (matrix[0] == matrix[1]).all()
@@ -0,0 +1,37 @@
+import time
+import asyncio
+import pytest
+
+pytest.importorskip("fastapi")
+
+import main  # noqa: E402
+from services.jobs import JobManager, JobStatus  # noqa: E402
+
+
+def test_disconnected_batch_stream_leaves_jobs_running(monkeypatch):
+    jobs = JobManager(workers=1, max_pending=10)
+    monkeypatch.setattr(main, "jobs", jobs)
+    finished = []
+
+    def slow(value):
+        time.sleep(0.1)
+        return None
+
+    submitted = [(i, f"v{i}.mp4", jobs.submit(slow, i, filename=f"v{i}.mp4", on_finish=lambda: finished.append(1)),
+                  None) for i in range(3)]
+
+    async def disconnect():
+        stream = main._stream_batch(submitted, sse=False)
+        await stream.__anext__()
+        # the client goes away while the stream waits for the first result
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(stream.__anext__(), 0.05)
+        await stream.aclose()
+
+    asyncio.run(disconnect())
+    deadline = time.monotonic() + 5
+    while len(finished) < 3 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert [jobs.get(job.id).status for _, _, job, _ in submitted] == [JobStatus.DONE] * 3
+    assert len(finished) == 3
+    jobs.shutdown()
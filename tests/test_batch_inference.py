@@ -0,0 +1,16 @@
+from services import analyzer
+from services.pipeline import AnalysisPipeline
+
+
+def test_batch_inference_returns_one_result_per_video(fake, cache, videos):
+    pipeline = AnalysisPipeline(cache, batch_inference=True, batch_linger=0.05)
+    results = {result.video_path: result for result in pipeline.run(videos)}
+    assert sorted(results) == sorted(videos)
+    assert all(r.error is None and r.analysis is not None for r in results.values())
+    assert fake.calls < len(videos)
+
+
+def test_plan_batches_respects_the_video_cap(videos, monkeypatch):
+    monkeypatch.setattr(analyzer, "estimate_video_tokens", lambda path: 100)
+    batches = analyzer.plan_batches(videos, max_tokens=10000, max_videos=2)
+    assert [len(b) for b in batches] == [2, 1]
@@ -0,0 +1,25 @@
+from services import analyzer
+from services.fakes import sample_analysis
+
+
+def test_cache_hit_makes_no_uploads_or_calls(fake, cache, videos):
+    first = analyzer.analyze_video(videos[0], cache)
+    assert fake.files.uploads == 1 and fake.calls == 1
+
+    again = analyzer.analyze_video(videos[0], cache)
+    assert again == first
+    assert fake.files.uploads == 1 and fake.calls == 1
+
+
+def test_different_bytes_miss_the_cache(fake, cache, videos):
+    analyzer.analyze_video(videos[0], cache)
+    analyzer.analyze_video(videos[1], cache)
+    assert fake.files.uploads == 2
+
+
+def test_put_get_and_delete(cache):
+    analysis = sample_analysis(3)
+    cache.put("key", "hash", "model", "v1", analysis)
+    assert cache.get("key") == analysis
+    cache.delete("key")
+    assert cache.get("key") is None
@@ -0,0 +1,109 @@
+import os
+import pytest
+from services.fakes import sample_analysis
+from services.schema_fields import multi_enum_fields
+
+pa = pytest.importorskip("pyarrow")
+
+from services import columnar  # noqa: E402
+
+
+def write(path, analyses, **kwargs):
+    flushed = []
+    with columnar.ParquetResultWriter(path, on_flushed=flushed.extend, **kwargs) as writer:
+        for i, analysis in enumerate(analyses):
+            writer.write_result(analysis, f"v{i}.mp4", source_path=f"/in/v{i}.mp4")
+    return flushed
+
+
+def test_round_trip_through_read_results(tmp_path):
+    path = str(tmp_path / "results.parquet")
+    analyses = [sample_analysis(i) for i in range(5)]
+    flushed = write(path, analyses)
+    assert len(flushed) == 5
+
+    table = columnar.read_results(path)
+    assert table.column("filename").to_pylist() == [f"v{i}.mp4" for i in range(5)]
+    layout = columnar.enum_layout(table)["multi_hot"]
+    rows = table.to_pydict()
+    for i, analysis in enumerate(analyses):
+        dumped = analysis.model_dump(mode="json")
+        for name in multi_enum_fields():
+            assert columnar.decode_multi_hot(rows[name][i], layout[name]) == dumped[name]
+        assert rows["primary_genre"][i] == dumped["primary_genre"]
+
+
+def test_idle_flushes_are_compacted(tmp_path):
+    path = str(tmp_path / "results.parquet")
+    with columnar.ParquetResultWriter(path) as writer:
+        for i in range(columnar.COMPACT_AFTER_PARTS * 2):
+            writer.write_result(sample_analysis(i), f"v{i}.mp4")
+            writer.flush()
+    assert len(os.listdir(path)) == 1
+    assert columnar.read_results(path).num_rows == columnar.COMPACT_AFTER_PARTS * 2
+
+
+def test_resumed_runs_append_parts(tmp_path):
+    path = str(tmp_path / "results.parquet")
+    write(path, [sample_analysis(0)])
+    write(path, [sample_analysis(1)], append=True, extra_columns=["cluster_id"])
+    table = columnar.read_results(path)
+    assert table.num_rows == 2
+    assert table.column("cluster_id").to_pylist() == [None, None]
+
+
+def rewrite_with_older_layout(part):
+    """pretend part was written before an enum change: reversed bit order, one retired value, wider masks."""
+    import json
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(part)
+    layout = columnar.enum_layout(table)
+    columns = {}
+    for name in table.column_names:
+        column = table[name]
+        if name in layout["multi_hot"]:
+            domain = layout["multi_hot"][name]
+            values = [columnar.decode_multi_hot(mask, domain) for mask in column.to_pylist()]
+            older = ["Retired_Value"] + list(reversed(domain))
+            layout["multi_hot"][name] = older
+            column = pa.array([columnar.encode_multi_hot(v + ["Retired_Value"], older) for v in values],
+                              type=pa.uint64())
+        columns[name] = column
+    metadata = {columnar.ENUM_METADATA_KEY: json.dumps(layout).encode("utf-8")}
+    pq.write_table(pa.table(columns).replace_schema_metadata(metadata), part)
+
+
+def test_parts_from_before_an_enum_change_are_remapped(tmp_path):
+    path = str(tmp_path / "results.parquet")
+    write(path, [sample_analysis(2)])
+    write(path, [sample_analysis(2)], append=True)
+    rewrite_with_older_layout(columnar.dataset_parts(path)[0])
+
+    table = columnar.read_results(path)
+    layout = columnar.enum_layout(table)["multi_hot"]
+    assert layout == columnar.model_layout()["multi_hot"]
+    rows = table.to_pydict()
+    dumped = sample_analysis(2).model_dump(mode="json")
+    for name in multi_enum_fields():
+        assert table.schema.field(name).type == columnar.ParquetResultWriter(
+            str(tmp_path / "schema_only")).schema.field(name).type
+        for i in range(2):
+            assert columnar.decode_multi_hot(rows[name][i], layout[name]) == dumped[name]
+
+
+def test_merge_keeps_the_current_layout(tmp_path):
+    shards = {}
+    for worker in ("a", "b"):
+        shards[worker] = str(tmp_path / worker / "results.parquet")
+        write(shards[worker], [sample_analysis(1)])
+    rewrite_with_older_layout(columnar.dataset_parts(shards["a"])[0])
+    merged = str(tmp_path / "merged.parquet")
+    # both workers' rows count, so the older-layout one must be re-encoded before the concat
+    assert columnar.merge_parquet_shards(shards, merged, lambda worker, name: True) == 2
+    table = columnar.read_results(merged)
+    layout = columnar.enum_layout(table)["multi_hot"]
+    dumped = sample_analysis(1).model_dump(mode="json")
+    for name in multi_enum_fields():
+        for mask in table[name].to_pylist():
+            assert columnar.decode_multi_hot(mask, layout[name]) == dumped[name]
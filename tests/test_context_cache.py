@@ -0,0 +1,77 @@
+import time
+from services.context_cache import PrefixCache
+from services.fakes import FakeGenaiClient
+
+# long enough for the fake's minimum cacheable size
+INSTRUCTION = "Tag the creative. " * 400
+
+
+def make_cache(client, ttl_seconds=3600, refresh_margin=300):
+    return PrefixCache(client, "gemini-test", INSTRUCTION, "v1", ttl_seconds=ttl_seconds,
+                       refresh_margin=refresh_margin)
+
+
+def test_creates_once_and_reuses_the_name():
+    client = FakeGenaiClient()
+    prefix = make_cache(client)
+    name = prefix.name()
+    assert prefix.name() == name
+    assert prefix.creates == 1
+    assert [c.name for c in client.caches.list()] == [name]
+
+
+def test_adopts_a_cache_left_by_an_earlier_run():
+    client = FakeGenaiClient()
+    name = make_cache(client).name()
+    later = make_cache(client)
+    assert later.name() == name
+    assert later.creates == 0
+
+
+def test_refreshes_ttl_inside_the_margin():
+    client = FakeGenaiClient()
+    # every call lands inside the refresh margin
+    prefix = make_cache(client, ttl_seconds=60, refresh_margin=120)
+    name = prefix.name()
+    expires = client.caches.get(name).expire_time
+    time.sleep(0.01)
+    assert prefix.name() == name
+    assert prefix.refreshes == 1
+    assert client.caches.get(name).expire_time > expires
+
+
+def test_recreates_when_the_cache_disappears():
+    client = FakeGenaiClient()
+    prefix = make_cache(client, ttl_seconds=60, refresh_margin=120)
+    name = prefix.name()
+    client.caches.delete(name)
+    # the refresh fails with a 403 and falls back to a new cache
+    new_name = prefix.name()
+    assert new_name != name
+    assert prefix.creates == 2
+
+
+def test_invalidate_forces_a_new_cache():
+    client = FakeGenaiClient()
+    prefix = make_cache(client)
+    name = prefix.name()
+    client.caches.delete(name)
+    prefix.invalidate(name)
+    assert prefix.name() != name
+    assert prefix.creates == 2
+
+
+def test_a_changed_instruction_is_not_adopted():
+    client = FakeGenaiClient()
+    name = make_cache(client).name()
+    # same schema version, edited prompt
+    edited = PrefixCache(client, "gemini-test", INSTRUCTION + "Also tag the music.", "v1")
+    assert edited.name() != name
+    assert edited.creates == 1
+
+
+def test_another_model_is_not_adopted():
+    client = FakeGenaiClient()
+    name = make_cache(client).name()
+    other = PrefixCache(client, "gemini-other", INSTRUCTION, "v1")
+    assert other.name() != name
@@ -0,0 +1,22 @@
+from services import analyzer
+
+
+def test_registry_reuses_a_live_upload(fake, registry, videos):
+    analyzer.analyze_video(videos[0], registry=registry)
+    analyzer.analyze_video(videos[0], registry=registry)
+    assert fake.files.uploads == 1
+    assert fake.calls == 2
+
+
+def test_registry_uploads_again_once_the_file_is_gone(fake, registry, videos):
+    analyzer.analyze_video(videos[0], registry=registry)
+    for video_file in fake.files.list():
+        fake.files.delete(video_file.name)
+    analyzer.analyze_video(videos[0], registry=registry)
+    assert fake.files.uploads == 2
+
+
+def test_collect_garbage_deletes_idle_files(fake, registry, videos):
+    analyzer.analyze_video(videos[0], registry=registry)
+    assert registry.collect_garbage(idle_seconds=0) == 1
+    assert fake.files.list() == []
@@ -0,0 +1,76 @@
+from services import analyzer
+from services.fakes import FakeGenaiClient, FakeStructuredLLM, api_error
+from services.file_tracker import FileProcessingError, FileReadinessTracker, is_terminal
+from services.pipeline import AnalysisPipeline
+
+
+def run(pipeline, paths):
+    return {result.video_path: result for result in pipeline.run(paths)}
+
+
+def test_every_video_gets_a_result(fake, cache, videos):
+    results = run(AnalysisPipeline(cache), videos)
+    assert sorted(results) == sorted(videos)
+    assert all(r.error is None and r.analysis is not None for r in results.values())
+    assert fake.files.uploads == 3
+
+
+def test_second_run_is_served_from_the_cache(fake, cache, videos):
+    run(AnalysisPipeline(cache), videos)
+    results = run(AnalysisPipeline(cache), videos)
+    assert all(r.from_cache for r in results.values())
+    assert fake.files.uploads == 3 and fake.calls == 3
+
+
+def test_missing_file_is_reported_not_raised(fake, cache, videos, tmp_path):
+    missing = str(tmp_path / "gone.mp4")
+    results = run(AnalysisPipeline(cache), videos + [missing])
+    assert isinstance(results[missing].error, OSError)
+    assert all(results[path].error is None for path in videos)
+
+
+def test_failed_processing_is_reported(monkeypatch, cache, videos):
+    client = FakeGenaiClient(failed_rate=1.0)
+    analyzer.configure_backend(client, FakeStructuredLLM(client))
+    monkeypatch.setattr(analyzer, "_file_tracker", FileReadinessTracker(client, initial_delay=0.01))
+    results = run(AnalysisPipeline(cache), videos)
+    assert all(isinstance(r.error, FileProcessingError) for r in results.values())
+    assert client.calls == 0
+
+
+def test_inference_error_is_reported_and_not_cached(fake, cache, videos, monkeypatch):
+    def reject(video_file, record=None):
+        raise api_error(400, "INVALID_ARGUMENT", "bad request")
+
+    monkeypatch.setattr(analyzer, "run_inference", reject)
+    results = run(AnalysisPipeline(cache), videos)
+    assert all(r.error is not None and r.analysis is None for r in results.values())
+    assert analyzer.cached_analysis(videos[0], cache) is None
+
+
+def test_status_listing_stops_after_the_first_page(monkeypatch, tmp_path):
+    from services import file_tracker
+
+    client = FakeGenaiClient()
+    video = tmp_path / "v.mp4"
+    video.write_bytes(b"\0" * 4096)
+    for _ in range(20):
+        client.files.upload(file=str(video))
+    names = [client.files.upload(file=str(video)).name for _ in range(5)]
+    client.files.delete(names[0])
+
+    listed = []
+    full_listing = client.files.list
+
+    def counting_list(config=None):
+        for video_file in full_listing(config):
+            listed.append(video_file.name)
+            yield video_file
+
+    monkeypatch.setattr(client.files, "list", counting_list)
+    monkeypatch.setattr(file_tracker, "LIST_PAGE_SIZE", 10)
+    states = FileReadinessTracker(client)._fetch_states(names)
+    assert all(states[name].state.name == "ACTIVE" for name in names[1:])
+    # the deleted file gets a direct lookup instead of a walk through every older upload
+    assert is_terminal(states[names[0]])
+    assert len(listed) == 10
@@ -0,0 +1,54 @@
+import time
+from services.fakes import api_error
+from services.rate_limit import RateLimiter, SharedTokenBucket, retry_after_seconds, status_code
+
+
+def test_shared_buckets_draw_from_one_budget(tmp_path):
+    path = str(tmp_path / "rate_limit.sqlite")
+    # two processes configured alike, e.g. two queue workers
+    first = SharedTokenBucket(path, "requests", rate_per_second=1, capacity=5)
+    second = SharedTokenBucket(path, "requests", rate_per_second=1, capacity=5)
+    for _ in range(3):
+        assert first.acquire(1) == 0
+    assert second.acquire(2) == 0
+    start = time.monotonic()
+    waited = second._charge(1, 1)
+    assert waited > 0.5
+    assert time.monotonic() - start < 0.5
+    first.close()
+    second.close()
+
+
+def test_refund_restores_the_shared_level(tmp_path):
+    bucket = SharedTokenBucket(str(tmp_path / "rate_limit.sqlite"), "tokens", rate_per_second=1, capacity=100)
+    bucket.acquire(100)
+    bucket.adjust(-40)
+    assert bucket._charge(40, 40) == 0
+    bucket.close()
+
+
+def test_limiter_uses_shared_buckets_with_a_state_path(tmp_path):
+    limiter = RateLimiter(rpm=60, tpm=6000, state_path=str(tmp_path / "rate_limit.sqlite"))
+    assert isinstance(limiter.requests, SharedTokenBucket)
+    assert limiter.call(lambda: "ok", tokens=10) == "ok"
+
+
+def test_retries_after_the_server_delay():
+    attempts = []
+
+    def flaky():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise api_error(429, "RESOURCE_EXHAUSTED", "quota", retry_delay=0.05)
+        return "ok"
+
+    limiter = RateLimiter()
+    assert limiter.call(flaky) == "ok"
+    assert limiter.throttled == 1
+    assert attempts[1] - attempts[0] >= 0.05
+
+
+def test_error_helpers_read_the_api_error():
+    error = api_error(429, "RESOURCE_EXHAUSTED", "quota", retry_delay=7)
+    assert status_code(error) == 429
+    assert retry_after_seconds(error) == 7
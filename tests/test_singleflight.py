@@ -0,0 +1,55 @@
+import time
+import threading
+from services.fakes import sample_analysis
+from services.metrics import COALESCED
+from services.singleflight import SingleFlight
+
+
+def test_singleflight_runs_concurrent_callers_once():
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow(value):
+        calls.append(value)
+        started.set()
+        release.wait(5)
+        return sample_analysis(value)
+
+    COALESCED.reset()
+    flight = SingleFlight()
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("key", slow, 1, kind="test")))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flight.do("key", slow, 2, kind="test")))
+                 for _ in range(4)]
+    for t in followers:
+        t.start()
+    # followers count as coalesced before they block on the leader's future
+    deadline = time.monotonic() + 5
+    while COALESCED.values().get(("test",), 0) < 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for t in [leader] + followers:
+        t.join(5)
+
+    assert calls == [1]
+    assert len(results) == 5 and all(r == sample_analysis(1) for r in results)
+    assert flight.in_flight() == 0
+
+
+def test_singleflight_shares_the_exception_and_releases_the_key():
+    flight = SingleFlight()
+
+    def boom():
+        raise RuntimeError("upload failed")
+
+    try:
+        flight.do("key", boom)
+    except RuntimeError as e:
+        assert str(e) == "upload failed"
+    else:
+        raise AssertionError("expected the leader's exception")
+    # a later call runs again instead of replaying the failure
+    assert flight.do("key", lambda: 42) == 42
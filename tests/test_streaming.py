@@ -0,0 +1,19 @@
+import io
+from services import analyzer
+from services.streaming import stream_sha256
+
+
+def test_stream_cache_hit_makes_no_uploads(fake, cache, registry):
+    body = b"streamed creative" * 1000
+    analyzer.analyze_video_stream(io.BytesIO(body), "video/mp4", "a.mp4", cache, registry)
+    analyzer.analyze_video_stream(io.BytesIO(body), "video/mp4", "b.mp4", cache, registry,
+                                  stream_sha256(io.BytesIO(body)))
+    assert fake.files.uploads == 1
+    assert fake.calls == 1
+
+
+def test_stream_upload_sends_every_byte(fake):
+    body = b"x" * (3 * 1024 + 17)
+    video_file, _ = analyzer.upload_stream(io.BytesIO(body), "video/mp4", "a.mp4", chunk_size=1024)
+    assert video_file.size_bytes == len(body)
+    assert fake.files.bytes_uploaded == len(body)
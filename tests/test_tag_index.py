@@ -0,0 +1,64 @@
+import pytest
+from services.fakes import sample_analysis
+from services.results_writer import CsvResultWriter, csv_fieldnames
+from services.tag_index import QuerySyntaxError, TagIndex
+
+
+def write_csv(path, analyses, append=False):
+    with CsvResultWriter(path, csv_fieldnames(), append=append) as writer:
+        for name, analysis in analyses:
+            writer.write_result(analysis, name)
+
+
+def test_boolean_queries(tmp_path):
+    index = TagIndex()
+    for i in range(4):
+        index.add(f"v{i}.mp4", sample_analysis(i % 2))
+    genre = sample_analysis(0).primary_genre.value
+    assert index.search(genre) == (2, ["v0.mp4", "v2.mp4"])
+    assert index.search(f"NOT {genre}") == (2, ["v1.mp4", "v3.mp4"])
+    assert index.search(f"{genre} OR NOT {genre}", limit=1) == (4, ["v0.mp4"])
+    with pytest.raises(QuerySyntaxError):
+        index.search("Not_A_Tag")
+
+
+def test_csv_refresh_reads_only_appended_rows(tmp_path):
+    path = str(tmp_path / "results.csv")
+    write_csv(path, [("a.mp4", sample_analysis(0))])
+    index = TagIndex()
+    assert index.refresh([path]) == 1
+    write_csv(path, [("b.mp4", sample_analysis(1))], append=True)
+    assert index.refresh([path]) == 1
+    assert index.refresh([path]) == 0
+    assert index.search(sample_analysis(1).primary_genre.value) == (1, ["b.mp4"])
+
+
+def test_parquet_refresh(tmp_path):
+    pytest.importorskip("pyarrow")
+    from services.columnar import ParquetResultWriter
+
+    path = str(tmp_path / "results.parquet")
+    with ParquetResultWriter(path) as writer:
+        for i, variant in enumerate([0, 1, 0]):
+            writer.write_result(sample_analysis(variant), f"v{i}.mp4")
+    index = TagIndex()
+    assert index.refresh([path]) == 3
+    analysis = sample_analysis(0)
+    # a single-valued enum and a bitmask-decoded one
+    query = f"{analysis.primary_genre.value} AND {analysis.mechanics_present[0].value}"
+    assert index.search(query) == (2, ["v0.mp4", "v2.mp4"])
+    # parts already read are skipped on the next refresh
+    assert index.refresh([path]) == 0
+
+
+def test_csv_rewritten_longer_is_read_from_the_start(tmp_path):
+    path = str(tmp_path / "results.csv")
+    write_csv(path, [("a.mp4", sample_analysis(0))])
+    index = TagIndex()
+    assert index.refresh([path]) == 1
+    # a fresh run truncates and writes more rows than before, the size alone cannot tell
+    write_csv(path, [("b.mp4", sample_analysis(1)), ("c.mp4", sample_analysis(1))])
+    assert index.refresh([path]) == 2
+    assert len(index) == 2
+    assert index.search(sample_analysis(0).primary_genre.value) == (0, [])
+    assert index.search(sample_analysis(1).primary_genre.value) == (2, ["b.mp4", "c.mp4"])
@@ -0,0 +1,65 @@
+import time
+import pytest
+from services.work_queue import WorkQueue
+
+
+@pytest.fixture
+def work_queue(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue.sqlite"), lease_seconds=0.2, max_attempts=2)
+    queue.enqueue([("a.mp4", 10, 1), ("b.mp4", 20, 2)])
+    yield queue
+    queue.close()
+
+
+def test_claims_are_exclusive_while_the_lease_lives(work_queue):
+    assert work_queue.claim("w1") == ["a.mp4"]
+    assert work_queue.claim("w2") == ["b.mp4"]
+    assert work_queue.claim("w2") == []
+
+
+def test_expired_lease_is_reclaimed_by_another_worker(work_queue):
+    assert work_queue.claim("w1", limit=2) == ["a.mp4", "b.mp4"]
+    time.sleep(0.3)
+    assert work_queue.claim("w2") == ["a.mp4"]
+    # the first worker finishing late does not override the new owner
+    assert not work_queue.complete("w1", "a.mp4")
+    assert work_queue.complete("w2", "a.mp4")
+    assert work_queue.done_owners() == {"a.mp4": "w2"}
+
+
+def test_renewal_keeps_the_claim(work_queue):
+    work_queue.claim("w1")
+    for _ in range(3):
+        time.sleep(0.1)
+        assert work_queue.renew("w1") == 1
+    assert work_queue.claim("w2") == ["b.mp4"]
+
+
+def test_failures_retry_until_attempts_run_out(work_queue):
+    work_queue.claim("w1")
+    work_queue.fail("w1", "a.mp4", "boom")
+    assert work_queue.counts()["pending"] == 2
+    work_queue.claim("w1", limit=2)
+    work_queue.fail("w1", "a.mp4", "boom")
+    assert work_queue.counts()["failed"] == 1
+    # a new scan gives failed videos another round
+    assert work_queue.enqueue([("a.mp4", 10, 1)]) == 1
+
+
+
+def test_late_failure_leaves_the_new_claim_alone(work_queue):
+    work_queue.claim("w1", limit=2)
+    time.sleep(0.3)
+    assert work_queue.claim("w2") == ["a.mp4"]
+    # w2's claim used the last attempt, w1 giving up late must not touch it
+    assert not work_queue.fail("w1", "a.mp4", "boom")
+    assert work_queue.renew("w2") == 1
+    assert work_queue.fail("w2", "a.mp4", "boom")
+    assert work_queue.counts()["failed"] == 1
+
+
+def test_changed_video_is_queued_again(work_queue):
+    work_queue.claim("w1")
+    work_queue.complete("w1", "a.mp4")
+    assert work_queue.enqueue([("a.mp4", 10, 1)]) == 0
+    assert work_queue.enqueue([("a.mp4", 11, 5)]) == 1